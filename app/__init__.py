@@ -2,10 +2,12 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_migrate import Migrate
+from werkzeug.middleware.proxy_fix import ProxyFix
 from config import Config
+from app.replicas import RoutingSession, replicas
 import os
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 login_manager = LoginManager()
 login_manager.login_view = 'auth.login'
 migrate = Migrate()
@@ -16,10 +18,37 @@ def create_app(config_class=Config):
 
     app.config.from_object(config_class)
 
+    hops = app.config['PROXY_FIX_HOPS']
+    if hops:
+        # remote_addr и схема берутся из X-Forwarded-* ровно от стольких прокси
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops)
+
+    replicas.init_app(app)
     db.init_app(app)
     login_manager.init_app(app)
     migrate.init_app(app, db)
 
+    from app.invalidation import bus
+    bus.init_app(app)
+
+    from app.metrics import metrics
+    metrics.init_app(app)
+
+    from app.ratelimit import limiter
+    limiter.init_app(app)
+
+    from app.compression import compress
+    compress.init_app(app)
+
+    from app.profiling import profiler
+    profiler.init_app(app)
+
+    from app.models import TaskStatus, RequestStatus
+    app.jinja_env.globals.update(TaskStatus=TaskStatus, RequestStatus=RequestStatus)
+
+    from app.badges import nav_badges
+    app.context_processor(nav_badges)
+
     from app.auth import bp as auth_bp
     app.register_blueprint(auth_bp, url_prefix='/auth')
 
@@ -32,4 +61,23 @@ def create_app(config_class=Config):
     from app.profile import bp as profile_bp
     app.register_blueprint(profile_bp, url_prefix='/profile')
 
+    from app.api import bp as api_bp
+    app.register_blueprint(api_bp, url_prefix='/api/v1')
+
+    from app.jobs import jobs_cli
+    from app import deletion, retention, deadlines, task_tree, recommendations, contributions  # регистрируют фоновые задачи
+    app.cli.add_command(jobs_cli)
+
+    from app.chat.loadtest import chat_cli
+    app.cli.add_command(chat_cli)
+
+    from app.backfill import backfill_cli
+    app.cli.add_command(backfill_cli)
+
+    from app.replicas import replicas_cli
+    app.cli.add_command(replicas_cli)
+
+    from app.importer import import_projects_command
+    app.cli.add_command(import_projects_command)
+
     return app
\ No newline at end of file
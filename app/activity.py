@@ -0,0 +1,77 @@
+import json
+from collections import namedtuple
+from datetime import datetime
+
+from flask_login import current_user
+from sqlalchemy import event, insert
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import Activity, User
+
+# Код действия хранится в SmallInteger, подпись берётся отсюда
+ACTIONS = {
+    1: ('task_created', 'создал задачу'),
+    2: ('task_edited', 'изменил задачу'),
+    3: ('task_assigned', 'назначил ответственного'),
+    4: ('task_status', 'изменил статус задачи'),
+    5: ('task_deleted', 'удалил задачу'),
+    6: ('subtask_created', 'добавил подзадачу'),
+    7: ('subtask_status', 'изменил статус подзадачи'),
+    8: ('application_accepted', 'принял заявку'),
+    9: ('application_rejected', 'отклонил заявку'),
+    10: ('invitation_sent', 'пригласил пользователя'),
+    11: ('invitation_accepted', 'принял приглашение'),
+    12: ('invitation_rejected', 'отклонил приглашение'),
+    13: ('participant_removed', 'исключил участника'),
+    14: ('project_archived', 'перенёс проект в архив'),
+    15: ('project_unarchived', 'вернул проект из архива'),
+}
+CODES = {name: code for code, (name, label) in ACTIONS.items()}
+
+Entry = namedtuple('Entry', 'id username label target_id data created_at')
+
+
+def record(project_id, action, target_id=None, user_id=None, **data):
+    # Событие только копится в сессии; запись в БД — одной пачкой при commit
+    if user_id is None and current_user and current_user.is_authenticated:
+        user_id = current_user.id
+    db.session.info.setdefault('activity', []).append({
+        'project_id': project_id,
+        'user_id': user_id,
+        'action': CODES[action],
+        'target_id': target_id,
+        'data': json.dumps(data, ensure_ascii=False, separators=(',', ':')) if data else None,
+        'created_at': datetime.utcnow()
+    })
+
+
+@event.listens_for(Session, 'before_commit')
+def _flush_activity(session):
+    rows = session.info.pop('activity', None)
+    if rows:
+        session.execute(insert(Activity), rows)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_activity(session, previous_transaction):
+    session.info.pop('activity', None)
+
+
+def activity_feed(project_id, before=None, limit=50):
+    query = db.session.query(
+        Activity.id, User.username, Activity.action, Activity.target_id, Activity.data, Activity.created_at
+    ).outerjoin(User, User.id == Activity.user_id).filter(Activity.project_id == project_id)
+    if before:
+        query = query.filter(Activity.id < before)
+    rows = query.order_by(Activity.id.desc()).limit(limit + 1).all()
+
+    entries = [Entry(
+        row.id,
+        row.username,
+        ACTIONS.get(row.action, (None, 'действие'))[1],
+        row.target_id,
+        json.loads(row.data) if row.data else {},
+        row.created_at
+    ) for row in rows[:limit]]
+    return entries, len(rows) > limit
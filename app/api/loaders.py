@@ -0,0 +1,43 @@
+from flask import current_app, g
+from sqlalchemy.orm import raiseload
+
+
+class Loader:
+    # Строки одной модели по значениям одной колонки. Ключи со всех родителей уровня
+    # собираются вместе и читаются одним IN (...); прочитанное живёт до конца запроса
+    def __init__(self, model, column='id'):
+        self.model = model
+        self.column = column
+        self._rows = {}
+
+    def load_many(self, keys):
+        keys = [key for key in dict.fromkeys(keys) if key is not None]
+        missing = [key for key in keys if key not in self._rows]
+        if missing:
+            for key in missing:
+                self._rows[key] = []
+            chunk_size = current_app.config.get('API_IN_CHUNK_SIZE', 1000)
+            for i in range(0, len(missing), chunk_size):
+                rows = self.model.query.options(raiseload('*')) \
+                    .filter(getattr(self.model, self.column).in_(missing[i:i + chunk_size])) \
+                    .order_by(self.model.id).all()
+                for row in rows:
+                    self._rows[getattr(row, self.column)].append(row)
+                prime(self.model, rows)
+        return {key: self._rows[key] for key in keys}
+
+    def prime(self, rows):
+        for row in rows:
+            self._rows.setdefault(getattr(row, self.column), [row])
+
+
+def loader(model, column='id'):
+    loaders = g.setdefault('api_loaders', {})
+    if (model, column) not in loaders:
+        loaders[model, column] = Loader(model, column)
+    return loaders[model, column]
+
+
+def prime(model, rows):
+    # Строки, пришедшие любым путём, доступны загрузчику по id без повторного запроса
+    loader(model).prime(rows)
@@ -0,0 +1,166 @@
+import enum
+from collections import namedtuple
+
+from flask import abort, g, request
+from flask_login import current_user
+
+from app import db
+from app.api.loaders import loader
+from app.models import User, Project, ProjectParticipant, Task, SubTask, Message
+
+# local — атрибут родителя, remote — колонка связанных строк; members_only — только для участников проекта
+Relation = namedtuple('Relation', 'type local remote many members_only')
+Resource = namedtuple('Resource', 'model fields relations')
+
+
+def one(type_, local, members_only=False):
+    return Relation(type_, local, 'id', False, members_only)
+
+
+def many(type_, remote, members_only=False):
+    return Relation(type_, 'id', remote, True, members_only)
+
+
+RESOURCES = {
+    'projects': Resource(Project, (
+        'title', 'description', 'skills_required', 'deadline', 'created_at', 'archived', 'archived_at'
+    ), {
+        'creator': one('users', 'creator_id'),
+        'tasks': many('tasks', 'project_id', members_only=True),
+        'participants': many('participants', 'project_id', members_only=True),
+    }),
+    'tasks': Resource(Task, (
+        'title', 'description', 'status', 'deadline', 'created_at', 'completed_at', 'overdue', 'hidden'
+    ), {
+        'project': one('projects', 'project_id'),
+        'assignee': one('users', 'assignee_id'),
+        'parent': one('tasks', 'parent_task_id'),
+        'children': many('tasks', 'parent_task_id'),
+        'subtasks': many('subtasks', 'task_id'),
+    }),
+    'subtasks': Resource(SubTask, ('title', 'deadline', 'completed', 'overdue'), {
+        'task': one('tasks', 'task_id'),
+    }),
+    'participants': Resource(ProjectParticipant, ('joined_at',), {
+        'project': one('projects', 'project_id'),
+        'user': one('users', 'user_id'),
+    }),
+    'messages': Resource(Message, ('content', 'timestamp'), {
+        'project': one('projects', 'project_id'),
+        'user': one('users', 'user_id'),
+    }),
+    # Email в API не отдаётся
+    'users': Resource(User, ('username', 'about_me', 'skills', 'avatar'), {}),
+}
+
+
+def member_project_ids():
+    if 'api_member_projects' not in g:
+        g.api_member_projects = {row[0] for row in db.session.query(ProjectParticipant.project_id)
+                                 .filter(ProjectParticipant.user_id == current_user.id)} | \
+                                {row[0] for row in db.session.query(Project.id)
+                                 .filter(Project.creator_id == current_user.id)}
+    return g.api_member_projects
+
+
+def _value(value):
+    if isinstance(value, enum.Enum):
+        return value.name.lower()
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def parse_fields():
+    # fields[tasks]=title,status — только перечисленные атрибуты
+    fields = {}
+    for key, value in request.args.items():
+        if not (key.startswith('fields[') and key.endswith(']')):
+            continue
+        type_ = key[7:-1]
+        if type_ not in RESOURCES:
+            abort(400, description=f'Неизвестный тип в fields: {type_}')
+        names = [name for name in value.split(',') if name]
+        unknown = set(names) - set(RESOURCES[type_].fields)
+        if unknown:
+            abort(400, description=f'Неизвестные поля {type_}: {", ".join(sorted(unknown))}')
+        fields[type_] = names
+    return fields
+
+
+def parse_include(type_, max_depth=3):
+    # include=tasks.subtasks,tasks.assignee -> {'tasks': {'subtasks': {}, 'assignee': {}}}
+    tree = {}
+    for path in filter(None, request.args.get('include', '').split(',')):
+        names = path.split('.')
+        if len(names) > max_depth:
+            abort(400, description=f'Слишком глубокий include: {path}')
+        node, current = tree, type_
+        for name in names:
+            relation = RESOURCES[current].relations.get(name)
+            if relation is None:
+                abort(400, description=f'Неизвестная связь {current}.{name}')
+            node = node.setdefault(name, {})
+            current = relation.type
+    return tree
+
+
+def _identifier(type_, id_):
+    return {'type': type_, 'id': id_} if id_ is not None else None
+
+
+def _serialize(type_, rows, include, fields, included):
+    resource = RESOURCES[type_]
+    related = {}
+    for name, subtree in include.items():
+        relation = resource.relations[name]
+        parents = rows
+        if relation.members_only:
+            parents = [row for row in rows if row.id in member_project_ids()]
+        found = loader(RESOURCES[relation.type].model, relation.remote) \
+            .load_many(getattr(row, relation.local) for row in parents)
+        related[name] = (relation, found)
+        # Все связанные строки уровня сериализуются вместе: следующий уровень include — снова один запрос
+        children = list({row.id: row for rows_ in found.values() for row in rows_}.values())
+        for item in _serialize(relation.type, children, subtree, fields, included):
+            key = (item['type'], item['id'])
+            if key in included:
+                included[key]['relationships'].update(item['relationships'])
+            else:
+                included[key] = item
+
+    items = []
+    for row in rows:
+        relationships = {
+            name: {'data': _identifier(relation.type, getattr(row, relation.local))}
+            for name, relation in resource.relations.items() if not relation.many
+        }
+        for name, (relation, found) in related.items():
+            if getattr(row, relation.local) not in found:
+                continue
+            linked = found[getattr(row, relation.local)]
+            relationships[name] = {'data': [_identifier(relation.type, r.id) for r in linked] if relation.many
+                                   else (_identifier(relation.type, linked[0].id) if linked else None)}
+        items.append({
+            'type': type_,
+            'id': row.id,
+            'attributes': {name: _value(getattr(row, name)) for name in fields.get(type_, resource.fields)},
+            'relationships': relationships,
+        })
+    return items
+
+
+def document(type_, rows, single=False, meta=None):
+    fields = parse_fields()
+    include = parse_include(type_)
+    included = {}
+    data = _serialize(type_, rows, include, fields, included)
+    for item in data:
+        included.pop((item['type'], item['id']), None)
+
+    body = {'data': data[0] if single else data}
+    if included:
+        body['included'] = list(included.values())
+    if meta:
+        body['meta'] = meta
+    return body
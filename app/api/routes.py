@@ -0,0 +1,113 @@
+from flask import current_app, request, abort, jsonify
+from flask_login import current_user
+from sqlalchemy.orm import raiseload
+from werkzeug.exceptions import HTTPException
+
+from app.api import bp
+from app.api.loaders import loader, prime
+from app.api.resources import document, member_project_ids
+from app.models import Project, ProjectParticipant, Task, TaskStatus, Message, MessageArchive
+
+
+@bp.before_request
+def require_login():
+    if not current_user.is_authenticated:
+        abort(401, description='Требуется вход')
+
+
+@bp.errorhandler(HTTPException)
+def api_error(e):
+    response = jsonify({'errors': [{'status': str(e.code), 'title': e.name, 'detail': e.description}]})
+    response.status_code = e.code
+    return response
+
+
+def _page_size():
+    size = request.args.get('page[size]', current_app.config.get('API_PAGE_SIZE', 100), type=int)
+    return max(1, min(size, current_app.config.get('API_MAX_PAGE_SIZE', 1000)))
+
+
+def _keyset(query, model):
+    # Страницы по id: page[after] из meta.next предыдущего ответа
+    size = _page_size()
+    after = request.args.get('page[after]', type=int)
+    if after:
+        query = query.filter(model.id > after)
+    rows = query.options(raiseload('*')).order_by(model.id).limit(size + 1).all()
+    prime(model, rows)
+    return rows[:size], {'next': rows[size - 1].id if len(rows) > size else None}
+
+
+def _project(project_id, members_only=False):
+    rows = loader(Project).load_many([project_id]).get(project_id)
+    if not rows or rows[0].deleting:
+        abort(404, description='Проект не найден')
+    if members_only and project_id not in member_project_ids():
+        abort(403, description='Нет доступа к проекту')
+    return rows[0]
+
+
+@bp.route('/projects')
+def list_projects():
+    query = Project.visible()
+    if request.args.get('filter[archived]') not in ('1', 'true'):
+        query = query.filter(Project.archived == False)
+    rows, meta = _keyset(query, Project)
+    return jsonify(document('projects', rows, meta=meta))
+
+
+@bp.route('/projects/<int:project_id>')
+def get_project(project_id):
+    return jsonify(document('projects', [_project(project_id)], single=True))
+
+
+@bp.route('/projects/<int:project_id>/tasks')
+def project_tasks(project_id):
+    _project(project_id, members_only=True)
+    query = Task.query.filter(Task.project_id == project_id)
+    statuses = request.args.get('filter[status]')
+    if statuses:
+        try:
+            query = query.filter(Task.status.in_([TaskStatus[name.upper()] for name in statuses.split(',')]))
+        except KeyError as e:
+            abort(400, description=f'Неизвестный статус: {e.args[0].lower()}')
+    rows, meta = _keyset(query, Task)
+    return jsonify(document('tasks', rows, meta=meta))
+
+
+@bp.route('/projects/<int:project_id>/participants')
+def project_participants(project_id):
+    _project(project_id, members_only=True)
+    rows, meta = _keyset(ProjectParticipant.query.filter(ProjectParticipant.project_id == project_id),
+                         ProjectParticipant)
+    return jsonify(document('participants', rows, meta=meta))
+
+
+@bp.route('/projects/<int:project_id>/messages')
+def project_messages(project_id):
+    # Новые сообщения первыми, page[before] из meta.next; старые добираются из архива
+    _project(project_id, members_only=True)
+    size = _page_size()
+    before = request.args.get('page[before]', type=int)
+    rows = []
+    for model in (Message, MessageArchive):
+        query = model.query.options(raiseload('*')).filter(model.project_id == project_id)
+        if rows:
+            query = query.filter(model.id < rows[-1].id)
+        elif before:
+            query = query.filter(model.id < before)
+        rows += query.order_by(model.id.desc()).limit(size + 1 - len(rows)).all()
+        if len(rows) > size:
+            break
+    meta = {'next': rows[size - 1].id if len(rows) > size else None}
+    return jsonify(document('messages', rows[:size], meta=meta))
+
+
+@bp.route('/tasks/<int:task_id>')
+def get_task(task_id):
+    rows = loader(Task).load_many([task_id]).get(task_id)
+    if not rows:
+        abort(404, description='Задача не найдена')
+    if rows[0].project_id not in member_project_ids():
+        abort(403, description='Нет доступа к проекту')
+    return jsonify(document('tasks', rows, single=True))
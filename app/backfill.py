@@ -0,0 +1,166 @@
+import time
+import traceback
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import update
+
+from app import db
+from app.jobs import job
+from app.models import Backfill, Task
+
+_registry = {}
+
+backfill_cli = AppGroup('backfill', help='Порционное заполнение данных в больших таблицах.')
+
+
+def backfill(name, model, batch_size=None):
+    # Функция получает id одной порции (по возрастанию) и возвращает число изменённых строк.
+    # Порции идут по первичному ключу, поэтому каждая затрагивает не больше batch_size строк
+    def decorator(func):
+        _registry[name] = (model, func, batch_size)
+        return func
+    return decorator
+
+
+def _claim(name, restart):
+    # Условие на статус в UPDATE не даёт двум процессам вести одно заполнение;
+    # «зависший» running можно перехватить после BACKFILL_LOCK_TIMEOUT
+    if Backfill.query.filter_by(name=name).first() is None:
+        db.session.add(Backfill(name=name))
+        db.session.commit()
+
+    now = datetime.utcnow()
+    stale_before = now - timedelta(seconds=current_app.config.get('BACKFILL_LOCK_TIMEOUT', 600))
+    values = {'status': 'running', 'started_at': now, 'updated_at': now, 'last_error': None}
+    if restart:
+        values.update(last_id=0, rows=0, batches=0, finished_at=None)
+    claimed = Backfill.query.filter(
+        Backfill.name == name,
+        db.or_(Backfill.status != 'running', Backfill.updated_at < stale_before)
+    ).update(values, synchronize_session=False)
+    db.session.commit()
+    return Backfill.query.filter_by(name=name).first() if claimed else None
+
+
+def run_backfill(name, batch_size=None, sleep=None, max_batches=None, restart=False, log=None):
+    if name not in _registry:
+        raise KeyError(f'Unknown backfill: {name}')
+    model, func, default_batch_size = _registry[name]
+    batch_size = batch_size or default_batch_size or current_app.config.get('BACKFILL_BATCH_SIZE', 1000)
+    sleep = current_app.config.get('BACKFILL_SLEEP', 0.05) if sleep is None else sleep
+    ratio = current_app.config.get('BACKFILL_THROTTLE', 1.0)
+
+    state = _claim(name, restart)
+    if state is None:
+        raise RuntimeError(f'Backfill {name} is already running')
+    state_id, last_id = state.id, state.last_id
+
+    batches = 0
+    try:
+        while True:
+            started = time.monotonic()
+            ids = [row[0] for row in db.session.query(model.id)
+                   .filter(model.id > last_id)
+                   .order_by(model.id)
+                   .limit(batch_size)]
+            if not ids:
+                Backfill.query.filter_by(id=state_id).update(
+                    {'status': 'done', 'finished_at': datetime.utcnow(), 'updated_at': datetime.utcnow()},
+                    synchronize_session=False
+                )
+                db.session.commit()
+                break
+
+            # Изменения порции и продвижение контрольной точки фиксируются одной транзакцией
+            rows = func(ids) or 0
+            last_id = ids[-1]
+            Backfill.query.filter_by(id=state_id).update({
+                'last_id': last_id,
+                'rows': Backfill.rows + rows,
+                'batches': Backfill.batches + 1,
+                'updated_at': datetime.utcnow()
+            }, synchronize_session=False)
+            db.session.commit()
+            batches += 1
+            elapsed = time.monotonic() - started
+            if log:
+                log(f'{name}: до id {last_id}, изменено {rows}, {elapsed * 1000:.0f} мс')
+
+            if max_batches and batches >= max_batches:
+                Backfill.query.filter_by(id=state_id).update({'status': 'paused'}, synchronize_session=False)
+                db.session.commit()
+                break
+            # Пауза растёт вместе с временем порции: под нагрузкой заполнение само замедляется
+            time.sleep(sleep + elapsed * ratio)
+    except BaseException:
+        # BaseException: и при Ctrl+C контрольная точка остаётся, а статус не залипает в running
+        db.session.rollback()
+        Backfill.query.filter_by(id=state_id).update(
+            {'status': 'failed', 'last_error': traceback.format_exc(), 'updated_at': datetime.utcnow()},
+            synchronize_session=False
+        )
+        db.session.commit()
+        raise
+    return Backfill.query.get(state_id)
+
+
+@job('backfill')
+def backfill_job(backfill_name, batch_size=None, restart=False):
+    # enqueue('backfill', backfill_name=...): аргумент name занят самой очередью
+    run_backfill(backfill_name, batch_size=batch_size, restart=restart)
+
+
+@backfill('task_flags', Task)
+def task_flags(ids):
+    # Колонка hidden добавлялась как nullable: у старых задач там NULL
+    result = db.session.execute(
+        update(Task)
+        .where(Task.id.in_(ids), Task.hidden == None)
+        .values(hidden=False)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+@backfill_cli.command('list')
+def list_command():
+    """Показать зарегистрированные заполнения и их контрольные точки."""
+    states = {state.name: state for state in Backfill.query.all()}
+    for name, (model, func, batch_size) in sorted(_registry.items()):
+        state = states.get(name)
+        if state is None:
+            click.echo(f'{name}\t{model.__tablename__}\tне запускалось')
+            continue
+        click.echo(f'{name}\t{model.__tablename__}\t{state.status}\tid > {state.last_id}\t'
+                   f'изменено {state.rows} за {state.batches} порций'
+                   + (f'\t{state.updated_at:%Y-%m-%d %H:%M:%S}' if state.updated_at else ''))
+
+
+@backfill_cli.command('run')
+@click.argument('name')
+@click.option('--batch-size', type=int, help='Строк в одной порции.')
+@click.option('--sleep', type=float, help='Минимальная пауза между порциями, секунд.')
+@click.option('--max-batches', type=int, help='Остановиться после N порций (продолжить можно тем же вызовом).')
+@click.option('--restart', is_flag=True, help='Начать заново, а не с контрольной точки.')
+@click.option('--verbose', is_flag=True, help='Печатать каждую порцию.')
+def run_command(name, batch_size, sleep, max_batches, restart, verbose):
+    """Запустить или продолжить заполнение."""
+    if name not in _registry:
+        raise click.ClickException(f'Неизвестное заполнение: {name}')
+    try:
+        state = run_backfill(name, batch_size, sleep, max_batches, restart, log=click.echo if verbose else None)
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    click.echo(f'{name}: {state.status}, id > {state.last_id}, изменено {state.rows} за {state.batches} порций')
+
+
+@backfill_cli.command('reset')
+@click.argument('name')
+def reset_command(name):
+    """Сбросить контрольную точку."""
+    Backfill.query.filter_by(name=name).delete()
+    db.session.commit()
+    click.echo(f'Контрольная точка {name} сброшена')
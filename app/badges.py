@@ -0,0 +1,47 @@
+from flask import current_app
+from flask_login import current_user
+from sqlalchemy import func, select
+
+from app import db
+from app.cache import get_cache
+from app.invalidation import bus
+from app.models import Project, Application, Invitation, RequestStatus
+
+
+def _cache():
+    return get_cache('badges', ttl=current_app.config.get('BADGE_CACHE_TTL', 60))
+
+
+def _load(user_id):
+    # Оба счётчика одним запросом; индексы (status, user_id) и (status, project_id) читают только ожидающие
+    invitations = select(func.count(Invitation.id)) \
+        .where(Invitation.status == RequestStatus.PENDING, Invitation.user_id == user_id).scalar_subquery()
+    applications = select(func.count(Application.id)) \
+        .join(Project, Project.id == Application.project_id) \
+        .where(Application.status == RequestStatus.PENDING, Project.creator_id == user_id).scalar_subquery()
+    return tuple(db.session.execute(select(invitations, applications)).one())
+
+
+def pending_counts(user_id):
+    # (приглашения пользователю, заявки в его проекты)
+    return _cache().get_or_set(user_id, lambda: _load(user_id))
+
+
+# Приглашения меняются через ORM при принятии и отказе; заявки и upsert-ы отмечаются явно через changed()
+bus.watch(Invitation, 'badges', key=lambda invitation: invitation.user_id)
+
+
+def changed(*user_ids):
+    # Счётчики сбрасываются после commit, когда новые значения уже видны другим запросам
+    bus.invalidate(db.session, 'badges', *(i for i in user_ids if i is not None))
+
+
+def forget(*user_ids):
+    bus.publish('badges', *user_ids)
+
+
+def nav_badges():
+    if not current_user.is_authenticated:
+        return {}
+    invitations, applications = pending_counts(current_user.id)
+    return {'pending_invitations': invitations, 'pending_applications': applications}
@@ -0,0 +1,70 @@
+import threading
+import time
+
+_caches = {}
+_caches_lock = threading.Lock()
+_missing = object()
+
+
+class Cache:
+    def __init__(self, name, ttl=300, maxsize=10000):
+        self.name = name
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _missing)
+            if item is not _missing and item[0] > time.monotonic():
+                self.hits += 1
+                return item[1]
+            if item is not _missing:
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        with self._lock:
+            if len(self._data) >= self.maxsize and key not in self._data:
+                # Простая стратегия вытеснения: удаляется самая старая запись
+                self._data.pop(next(iter(self._data)))
+            self._data[key] = (time.monotonic() + self.ttl, value)
+
+    def get_or_set(self, key, func):
+        value = self.get(key, _missing)
+        if value is _missing:
+            value = func()
+            self.set(key, value)
+        return value
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._data),
+            'hit_ratio': self.hits / total if total else 0.0
+        }
+
+
+def get_cache(name, ttl=300, maxsize=10000):
+    with _caches_lock:
+        if name not in _caches:
+            _caches[name] = Cache(name, ttl, maxsize)
+        return _caches[name]
+
+
+def all_caches():
+    return dict(_caches)
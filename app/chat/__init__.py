@@ -0,0 +1,4 @@
+def create_chat_app(flask_app, fallback=None):
+    # Импорт здесь: sqlalchemy.ext.asyncio и async-драйвер нужны только процессу, который обслуживает чат
+    from app.chat.asgi import ChatApp
+    return ChatApp(flask_app, fallback)
@@ -0,0 +1,295 @@
+import asyncio
+import json
+import logging
+import math
+import re
+from datetime import datetime
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs
+
+from sqlalchemy import select, insert, func
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.membership import chat_access
+from app.models import Message, User
+from app.ratelimit import limiter
+
+log = logging.getLogger(__name__)
+
+ASYNC_DRIVERS = {'mysql': 'mysql+aiomysql', 'sqlite': 'sqlite+aiosqlite', 'postgresql': 'postgresql+asyncpg'}
+
+ROUTE = re.compile(r'^/(\d+)/messages$')
+
+
+def async_database_uri(uri):
+    url = make_url(uri)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername))
+
+
+class Channel:
+    # Один наблюдатель на проект: сколько бы клиентов ни ждало, новые сообщения читаются из БД один раз
+    # и раздаются всем ожидающим из памяти
+    def __init__(self, size):
+        self.size = size
+        self.last_id = None
+        self.floor = None  # все сообщения с id > floor лежат в recent
+        self.recent = []
+        self.waiters = 0
+        self.changed = asyncio.Condition()
+        self.poke = asyncio.Event()
+        self.watcher = None
+
+    def since(self, after):
+        if self.floor is None or after < self.floor:
+            return None
+        return [row for row in self.recent if row.id > after]
+
+    async def publish(self, rows=(), last_id=None):
+        if rows:
+            self.recent.extend(rows)
+            last_id = rows[-1].id
+            if len(self.recent) > self.size:
+                self.floor = self.recent[-self.size - 1].id
+                self.recent = self.recent[-self.size:]
+        elif self.floor is None:
+            self.floor = last_id
+        self.last_id = last_id
+        async with self.changed:
+            self.changed.notify_all()
+
+
+class ChatApp:
+    def __init__(self, flask_app, fallback=None):
+        config = flask_app.config
+        self.fallback = fallback
+        self.prefix = (config.get('CHAT_ASYNC_PREFIX') or '/chat').rstrip('/')
+        self.page_size = config.get('CHAT_PAGE_SIZE', 50)
+        self.max_wait = config.get('CHAT_LONG_POLL_TIMEOUT', 25)
+        self.poll_interval = config.get('CHAT_POLL_INTERVAL', 1)
+        self.policy = config.get('RATELIMITS', {}).get('projects.send_message') if config.get('RATELIMIT_ENABLED', True) else None
+        self.engine = create_async_engine(
+            config.get('CHAT_ASYNC_DATABASE_URI') or async_database_uri(config['SQLALCHEMY_DATABASE_URI']),
+            pool_size=config.get('CHAT_ASYNC_POOL_SIZE', 10),
+            pool_pre_ping=True
+        )
+        # Сессия Flask читается без обращения к БД: нужен только _user_id из подписанной cookie
+        self.serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+        self.cookie_name = flask_app.config['SESSION_COOKIE_NAME']
+        self.session_max_age = int(flask_app.permanent_session_lifetime.total_seconds())
+        self.channels = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(scope, receive, send)
+        path = scope.get('path', '')
+        if not (path == self.prefix or path.startswith(self.prefix + '/')):
+            if self.fallback is not None:
+                return await self.fallback(scope, receive, send)
+            return await _respond(send, 404, {'error': 'Not found'})
+        if scope['type'] != 'http':
+            return await _respond(send, 404, {'error': 'Not found'})
+
+        match = ROUTE.match(path[len(self.prefix):])
+        if not match:
+            return await _respond(send, 404, {'error': 'Not found'})
+        user_id = self.current_user_id(scope)
+        if user_id is None:
+            return await _respond(send, 401, {'error': 'Требуется вход'})
+
+        project_id = int(match.group(1))
+        if scope['method'] not in ('GET', 'POST'):
+            return await _respond(send, 405, {'error': 'Method not allowed'})
+        # Cookie подтверждает только вход: удаление учётной записи или проекта и членство проверяются в БД
+        async with self.engine.connect() as conn:
+            allowed = await conn.scalar(chat_access(project_id, user_id))
+        if allowed is None:
+            return await _respond(send, 403, {'error': 'Нет доступа к чату проекта'})
+        if scope['method'] == 'GET':
+            return await self.get_messages(scope, send, project_id)
+        if scope['method'] == 'POST':
+            return await self.send_message(receive, send, project_id, user_id)
+
+    async def lifespan(self, scope, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def current_user_id(self, scope):
+        cookie = SimpleCookie()
+        cookie.load(_header(scope, b'cookie'))
+        if self.cookie_name not in cookie:
+            return None
+        try:
+            session = self.serializer.loads(cookie[self.cookie_name].value, max_age=self.session_max_age)
+        except Exception:
+            return None
+        user_id = session.get('_user_id')
+        return int(user_id) if user_id else None
+
+    async def get_messages(self, scope, send, project_id):
+        params = parse_qs(scope.get('query_string', b'').decode())
+        after = _int(params, 'after')
+        wait = min(_int(params, 'wait') or 0, self.max_wait)
+
+        if after is None:
+            # Первая загрузка: последняя страница горячей таблицы
+            rows = await self.fetch(project_id, None)
+        else:
+            channel = self.channels.get(project_id)
+            rows = channel.since(after) if channel else None
+            if rows is None:
+                rows = await self.fetch(project_id, after)
+            if not rows and wait:
+                # Long polling: соединение висит на корутине, а не на потоке воркера
+                channel = await self.wait_for(project_id, after, wait)
+                rows = channel.since(after)
+                if rows is None:
+                    rows = await self.fetch(project_id, after)
+
+        messages = [{
+            'id': row.id,
+            'user_id': row.user_id,
+            'username': row.username,
+            'content': row.content,
+            'timestamp': row.timestamp.strftime('%H:%M')
+        } for row in rows]
+        last_id = messages[-1]['id'] if messages else (after or 0)
+        await _respond(send, 200, {'messages': messages, 'last_id': last_id})
+
+    async def fetch(self, project_id, after):
+        query = select(Message.id, Message.user_id, User.username, Message.content, Message.timestamp) \
+            .outerjoin(User, User.id == Message.user_id) \
+            .where(Message.project_id == project_id)
+        async with self.engine.connect() as conn:
+            if after is None:
+                rows = (await conn.execute(query.order_by(Message.id.desc()).limit(self.page_size))).all()
+                rows.reverse()
+                return rows
+            return (await conn.execute(
+                query.where(Message.id > after).order_by(Message.id).limit(self.page_size)
+            )).all()
+
+    async def wait_for(self, project_id, after, timeout):
+        channel = self.channels.get(project_id)
+        if channel is None:
+            channel = self.channels[project_id] = Channel(self.page_size)
+        channel.waiters += 1
+        if channel.watcher is None:
+            channel.watcher = asyncio.create_task(self.watch(project_id, channel))
+        try:
+            async with channel.changed:
+                await asyncio.wait_for(
+                    channel.changed.wait_for(lambda: channel.last_id is not None and channel.last_id > after),
+                    timeout
+                )
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            channel.waiters -= 1
+        return channel
+
+    async def watch(self, project_id, channel):
+        # Сообщения могут прийти из синхронного send_message или другого процесса, поэтому БД опрашивается
+        # раз в CHAT_POLL_INTERVAL; отправка через этот процесс будит наблюдателя сразу
+        try:
+            while channel.waiters:
+                channel.poke.clear()
+                if channel.last_id is None:
+                    async with self.engine.connect() as conn:
+                        last_id = await conn.scalar(
+                            select(func.max(Message.id)).where(Message.project_id == project_id)
+                        )
+                    await channel.publish(last_id=last_id or 0)
+                    continue
+                rows = await self.fetch(project_id, channel.last_id)
+                if rows:
+                    await channel.publish(rows)
+                if len(rows) < self.page_size:
+                    try:
+                        await asyncio.wait_for(channel.poke.wait(), self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            channel.watcher = None
+            if not channel.waiters:
+                self.channels.pop(project_id, None)
+
+    async def take(self, key, rate, capacity):
+        if limiter.storage is limiter.fallback:
+            return limiter.fallback.take(key, rate, capacity)
+        # Клиент Redis синхронный: вызов уходит в поток, чтобы не останавливать цикл событий.
+        # Как и в WSGI, при недоступном хранилище ограничение действует внутри процесса
+        try:
+            return await asyncio.to_thread(limiter.storage.take, key, rate, capacity)
+        except Exception:
+            log.exception('rate limit storage failed, using in-process buckets')
+            return limiter.fallback.take(key, rate, capacity)
+
+    async def send_message(self, receive, send, project_id, user_id):
+        if self.policy:
+            # Те же корзины, что и у синхронного send_message
+            rate, capacity = self.policy
+            wait = await self.take(f'projects.send_message:user:{user_id}', rate, capacity)
+            if wait:
+                return await _respond(send, 429, {'error': 'Слишком много запросов, попробуйте позже'},
+                                      [(b'retry-after', str(max(1, math.ceil(wait))).encode())])
+
+        body = await _read_body(receive)
+        content = (parse_qs(body.decode('utf-8', 'replace')).get('content') or [''])[0].strip()
+        if not content:
+            return await _respond(send, 400, {'error': 'Сообщение не может быть пустым'})
+
+        async with self.engine.begin() as conn:
+            result = await conn.execute(insert(Message).values(
+                content=content, user_id=user_id, project_id=project_id, timestamp=datetime.utcnow()
+            ))
+        message_id = result.inserted_primary_key[0]
+
+        channel = self.channels.get(project_id)
+        if channel is not None:
+            channel.poke.set()
+        await _respond(send, 200, {'success': True, 'id': message_id})
+
+
+def _header(scope, name):
+    for key, value in scope.get('headers', []):
+        if key == name:
+            return value.decode('latin-1')
+    return ''
+
+
+def _int(params, name):
+    try:
+        return int(params[name][0])
+    except (KeyError, ValueError):
+        return None
+
+
+async def _read_body(receive, limit=64 * 1024):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if len(body) > limit or not message.get('more_body'):
+            return body[:limit]
+
+
+async def _respond(send, status, payload, headers=()):
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+            (b'cache-control', b'no-store'),
+            *headers
+        ]
+    })
+    await send({'type': 'http.response.body', 'body': body})
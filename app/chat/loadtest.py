@@ -0,0 +1,181 @@
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from app.models import User
+
+chat_cli = AppGroup('chat', help='Асинхронный чат.')
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = []
+        self.deliveries = []
+        self.errors = 0
+        self.connected = 0
+        self.peak = 0
+
+    def open(self):
+        self.connected += 1
+        self.peak = max(self.peak, self.connected)
+
+    def close(self):
+        self.connected -= 1
+
+
+async def _request(reader, writer, host, method, path, cookie, body=b''):
+    headers = f'{method} {path} HTTP/1.1\r\nHost: {host}\r\nCookie: {cookie}\r\nAccept: application/json\r\n'
+    if body:
+        headers += f'Content-Type: application/x-www-form-urlencoded\r\nContent-Length: {len(body)}\r\n'
+    writer.write(headers.encode() + b'Connection: keep-alive\r\n\r\n' + body)
+    await writer.drain()
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionResetError('connection closed')
+    status = int(status_line.split()[1])
+    length, keep_alive = None, not status_line.startswith(b'HTTP/1.0')
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+        elif name.lower() == 'connection':
+            keep_alive = value.strip().lower() == 'keep-alive'
+    data = await reader.readexactly(length) if length is not None else await reader.read()
+    return status, data, keep_alive and length is not None
+
+
+def _delivered(stats, data, seen):
+    # Сообщения от --post содержат время отправки, по нему считается задержка доставки
+    now = time.time()
+    for message in json.loads(data).get('messages', []):
+        if message['id'] > seen and message['content'].startswith('loadtest '):
+            stats.deliveries.append(now - float(message['content'].split()[1]))
+        seen = max(seen, message['id'])
+    return seen
+
+
+async def _client(stats, host, port, path, cookie, deadline, interval, follow):
+    after = None
+    seen = None
+    while time.monotonic() < deadline:
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+        except OSError:
+            stats.errors += 1
+            await asyncio.sleep(interval or 1)
+            continue
+        stats.open()
+        try:
+            keep_alive = True
+            while keep_alive and time.monotonic() < deadline:
+                url = path
+                if follow and after is not None:
+                    url += ('&' if '?' in path else '?') + f'after={after}'
+                started = time.monotonic()
+                status, data, keep_alive = await _request(reader, writer, host, 'GET', url, cookie)
+                if status != 200:
+                    stats.errors += 1
+                else:
+                    stats.latencies.append(time.monotonic() - started)
+                    if seen is None:
+                        seen = max([m['id'] for m in json.loads(data).get('messages', [])] or [0])
+                    else:
+                        seen = _delivered(stats, data, seen)
+                    if follow:
+                        after = json.loads(data).get('last_id') or after
+                if interval:
+                    await asyncio.sleep(interval)
+        except (OSError, asyncio.IncompleteReadError, ValueError, IndexError):
+            stats.errors += 1
+        finally:
+            stats.close()
+            writer.close()
+
+
+async def _poster(host, port, path, cookie, deadline, every):
+    while time.monotonic() < deadline:
+        await asyncio.sleep(every)
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+            await _request(reader, writer, host, 'POST', path, cookie, f'content=loadtest+{time.time()}'.encode())
+            writer.close()
+        except (OSError, asyncio.IncompleteReadError, ValueError, IndexError):
+            pass
+
+
+async def _run(url, cookie, clients, duration, interval, follow, ramp, post_url, post_every):
+    parts = urlsplit(url)
+    path = parts.path + (f'?{parts.query}' if parts.query else '')
+    stats = Stats()
+    deadline = time.monotonic() + duration
+    tasks = []
+    if post_url:
+        post = urlsplit(post_url)
+        tasks.append(asyncio.create_task(
+            _poster(post.hostname, post.port or 80, post.path, cookie, deadline, post_every)
+        ))
+    for i in range(clients):
+        tasks.append(asyncio.create_task(
+            _client(stats, parts.hostname, parts.port or 80, path, cookie, deadline, interval, follow)
+        ))
+        if ramp:
+            await asyncio.sleep(ramp / clients)
+    await asyncio.gather(*tasks)
+    return stats
+
+
+def _percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+@chat_cli.command('loadtest')
+@click.argument('url')
+@click.option('--user', 'username', required=True, help='От чьего имени подписать cookie сессии.')
+@click.option('--clients', default=1000, show_default=True, help='Число одновременных клиентов.')
+@click.option('--duration', default=30, show_default=True, help='Длительность, секунд.')
+@click.option('--interval', default=3.0, show_default=True, help='Пауза между запросами клиента (0 для long polling).')
+@click.option('--follow', is_flag=True, help='Передавать after=<last_id> из предыдущего ответа.')
+@click.option('--ramp', default=5.0, show_default=True, help='За сколько секунд подключить всех клиентов.')
+@click.option('--post', 'post_url', help='URL для отправки сообщений, чтобы измерить задержку доставки.')
+@click.option('--post-every', default=2.0, show_default=True, help='Интервал отправки сообщений, секунд.')
+def loadtest(url, username, clients, duration, interval, follow, ramp, post_url, post_every):
+    """Нагрузить эндпоинт чата множеством одновременных клиентов.
+
+    Пример сравнения синхронного опроса и long polling на одном проекте:
+
+        flask chat loadtest http://127.0.0.1:8000/projects/projects/1/messages --user alice \\
+            --post http://127.0.0.1:8000/projects/projects/1/send_message
+
+        flask chat loadtest 'http://127.0.0.1:8001/chat/1/messages?wait=25' --user alice --interval 0 --follow \\
+            --post http://127.0.0.1:8001/chat/1/messages
+    """
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        raise click.ClickException(f'Пользователь "{username}" не найден')
+    serializer = current_app.session_interface.get_signing_serializer(current_app)
+    cookie = f"{current_app.config['SESSION_COOKIE_NAME']}={serializer.dumps({'_user_id': str(user.id), '_fresh': True})}"
+
+    started = time.monotonic()
+    stats = asyncio.run(_run(url, cookie, clients, duration, interval, follow, ramp, post_url, post_every))
+    elapsed = time.monotonic() - started
+
+    click.echo(f'клиентов: {clients}, пик одновременных соединений: {stats.peak}')
+    click.echo(f'ответов: {len(stats.latencies)} ({len(stats.latencies) / elapsed:.1f}/с), ошибок: {stats.errors}')
+    click.echo(f'задержка p50: {_percentile(stats.latencies, 0.5) * 1000:.0f} мс, '
+               f'p95: {_percentile(stats.latencies, 0.95) * 1000:.0f} мс, '
+               f'p99: {_percentile(stats.latencies, 0.99) * 1000:.0f} мс')
+    if post_url:
+        click.echo(f'доставлено сообщений: {len(stats.deliveries)}, '
+                   f'задержка доставки p50: {_percentile(stats.deliveries, 0.5) * 1000:.0f} мс, '
+                   f'p95: {_percentile(stats.deliveries, 0.95) * 1000:.0f} мс')
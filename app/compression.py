@@ -0,0 +1,180 @@
+import gzip
+import mimetypes
+import os
+import zlib
+
+import click
+from flask import current_app, request, send_from_directory
+from flask.cli import AppGroup
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ENCODINGS = {'br': '.br', 'gzip': '.gz'}
+
+compression_cli = AppGroup('compression', help='Сжатие ответов и статики.')
+
+
+class Compress:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.before_request(self.precompressed_static)
+        app.after_request(self.compress)
+        app.cli.add_command(compression_cli)
+
+    def choose(self):
+        accept = request.accept_encodings
+        encodings = ['br', 'gzip'] if brotli is not None else ['gzip']
+        encodings = [encoding for encoding in encodings if accept.quality(encoding) > 0]
+        if not encodings:
+            return None
+        # При равном q предпочитается brotli: он жмёт HTML заметно лучше
+        return max(encodings, key=lambda encoding: accept.quality(encoding))
+
+    def precompressed_static(self):
+        # Заранее сжатые файлы из `flask compression static` отдаются без сжатия на лету
+        if request.endpoint != 'static' or not current_app.config.get('COMPRESS_ENABLED', True):
+            return None
+        encoding = self.choose()
+        if encoding is None:
+            return None
+        filename = request.view_args.get('filename', '')
+        compressed = os.path.join(current_app.static_folder, filename + ENCODINGS[encoding])
+        if not os.path.isfile(compressed):
+            return None
+
+        response = send_from_directory(current_app.static_folder, filename + ENCODINGS[encoding])
+        response.mimetype = mimetypes.guess_type(filename)[0] or response.mimetype
+        response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        return response
+
+    def compress(self, response):
+        config = current_app.config
+        if not config.get('COMPRESS_ENABLED', True):
+            return response
+        if response.mimetype not in config.get('COMPRESS_MIMETYPES', ()):
+            return response
+        response.vary.add('Accept-Encoding')
+        if (response.status_code < 200 or response.status_code in (204, 304)
+                or response.direct_passthrough
+                or 'Content-Encoding' in response.headers
+                or 'no-transform' in response.headers.get('Cache-Control', '')):
+            return response
+
+        encoding = self.choose()
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = _stream(response.response, _compressor(encoding))
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < config.get('COMPRESS_MIN_SIZE', 500):
+                return response
+            response.set_data(_compress(data, encoding))
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+
+def _compressor(encoding):
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=current_app.config.get('COMPRESS_BR_LEVEL', 4))
+        return compressor.process, compressor.flush, compressor.finish
+    # wbits=31 даёт формат gzip, а не «голый» deflate
+    compressor = zlib.compressobj(current_app.config.get('COMPRESS_LEVEL', 6), zlib.DEFLATED, 31)
+    return compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+
+
+def _stream(chunks, compressor):
+    compress, flush, finish = compressor
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        # Каждая порция сбрасывается сразу, чтобы клиент получал данные по мере выгрузки
+        data = compress(chunk) + flush()
+        if data:
+            yield data
+    yield finish()
+
+
+def _compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=current_app.config.get('COMPRESS_BR_LEVEL', 4))
+    return gzip.compress(data, compresslevel=current_app.config.get('COMPRESS_LEVEL', 6))
+
+
+compress = Compress()
+
+
+@compression_cli.command('static')
+def compress_static():
+    """Сжать статические файлы в .gz (и .br, если установлен brotli)."""
+    extensions = current_app.config.get('COMPRESS_STATIC_EXTENSIONS', ('.css', '.js', '.svg'))
+    count = 0
+    for root, dirs, files in os.walk(current_app.static_folder):
+        for name in files:
+            if not name.endswith(tuple(extensions)):
+                continue
+            path = os.path.join(root, name)
+            with open(path, 'rb') as f:
+                data = f.read()
+            with open(path + '.gz', 'wb') as f:
+                f.write(gzip.compress(data, compresslevel=9))
+            if brotli is not None:
+                with open(path + '.br', 'wb') as f:
+                    f.write(brotli.compress(data, quality=11))
+            count += 1
+    click.echo(f'Сжато файлов: {count}')
+
+
+@compression_cli.command('bench')
+@click.option('--user', 'username', required=True, help='Пользователь, от имени которого открываются страницы.')
+@click.option('--project', 'project_id', type=int, required=True, help='Проект для manage/execute.')
+def bench(username, project_id):
+    """Сравнить размер основных страниц без сжатия и со сжатием."""
+    from flask import url_for
+    from app.models import User
+
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        raise click.ClickException(f'Пользователь "{username}" не найден')
+
+    with current_app.test_request_context():
+        urls = [
+            url_for('main.index'),
+            url_for('projects.my_projects'),
+            url_for('projects.manage', project_id=project_id),
+            url_for('projects.execute', project_id=project_id),
+            url_for('projects.get_messages', project_id=project_id),
+            url_for('projects.export_project', project_id=project_id, kind='tasks', fmt='ndjson'),
+            url_for('static', filename='css/style.css'),
+        ]
+
+    encodings = ['identity', 'gzip'] + (['br'] if brotli is not None else [])
+    current_app.config['RATELIMIT_ENABLED'] = False
+    client = current_app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+        session['_fresh'] = True
+
+    click.echo(f'{"URL":<45}' + ''.join(f'{encoding:>12}' for encoding in encodings) + f'{"экономия":>10}')
+    total = dict.fromkeys(encodings, 0)
+    for url in urls:
+        sizes = {}
+        for encoding in encodings:
+            response = client.get(url, headers={'Accept-Encoding': encoding})
+            sizes[encoding] = len(response.get_data())
+            total[encoding] += sizes[encoding]
+        best = min(sizes.values())
+        saved = 1 - best / sizes['identity'] if sizes['identity'] else 0
+        click.echo(f'{url:<45}' + ''.join(f'{sizes[e]:>12}' for e in encodings) + f'{saved:>10.0%}')
+    best = min(total.values())
+    click.echo(f'{"итого":<45}' + ''.join(f'{total[e]:>12}' for e in encodings)
+               + f'{1 - best / total["identity"] if total["identity"] else 0:>10.0%}')
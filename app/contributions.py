@@ -0,0 +1,173 @@
+from collections import namedtuple
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import case, event, func, insert, update
+from sqlalchemy.orm import Session
+
+from app import db
+from app.cache import get_cache
+from app.invalidation import bus
+from app.jobs import job
+from app.models import User, Project, Task, TaskStatus, UserStats
+
+COUNTERS = ('projects_created', 'tasks_completed', 'tasks_on_time', 'tasks_late')
+
+Summary = namedtuple('Summary', 'id username email about_me skills avatar '
+                                'projects_created tasks_completed on_time_rate')
+
+# Правка профиля сбрасывает сводку в кэше всех воркеров
+bus.watch(User, 'profiles')
+
+
+def _cache():
+    return get_cache('profiles', ttl=current_app.config.get('PROFILE_CACHE_TTL', 300))
+
+
+def bump(user_id, **deltas):
+    # Приращения копятся в сессии и применяются при commit вместе с изменениями, которые их вызвали
+    if user_id is None:
+        return
+    pending = db.session.info.setdefault('contributions', {}).setdefault(user_id, {})
+    for name, delta in deltas.items():
+        pending[name] = pending.get(name, 0) + delta
+
+
+def set_task_status(task, status):
+    was_completed = task.status == TaskStatus.COMPLETED
+    completed_at = task.completed_at
+    task.status = status
+    if status == TaskStatus.COMPLETED and not was_completed:
+        task.completed_at = completed_at = datetime.utcnow()
+        sign = 1
+    elif was_completed and status != TaskStatus.COMPLETED:
+        task.completed_at = None
+        sign = -1
+    else:
+        return
+
+    deltas = {'tasks_completed': sign}
+    # У задач, завершённых до появления completed_at, срок выполнения неизвестен
+    if completed_at is not None:
+        on_time = task.deadline is None or completed_at.date() <= task.deadline.date()
+        deltas['tasks_on_time' if on_time else 'tasks_late'] = sign
+    bump(task.assignee_id, **deltas)
+
+
+def _compute(session, user_ids):
+    # Счётчики с нуля по проектам и задачам: GROUP BY по всей порции пользователей
+    counters = {user_id: dict.fromkeys(COUNTERS, 0) for user_id in user_ids}
+    for user_id, count in session.query(Project.creator_id, func.count(Project.id)) \
+            .filter(Project.creator_id.in_(user_ids)).group_by(Project.creator_id):
+        counters[user_id]['projects_created'] = count
+
+    timed = Task.completed_at != None
+    on_time = db.or_(Task.deadline == None, func.date(Task.completed_at) <= func.date(Task.deadline))
+    rows = session.query(
+        Task.assignee_id,
+        func.count(Task.id),
+        func.count(case((db.and_(timed, on_time), 1))),
+        func.count(case((db.and_(timed, db.not_(on_time)), 1)))
+    ).filter(Task.assignee_id.in_(user_ids), Task.status == TaskStatus.COMPLETED).group_by(Task.assignee_id)
+    for user_id, completed, in_time, late in rows:
+        counters[user_id].update(tasks_completed=completed, tasks_on_time=in_time, tasks_late=late)
+    return counters
+
+
+def _insert_ignore():
+    # Строку мог уже вставить параллельный запрос — тогда его значения верны, а наши не нужны
+    return insert(UserStats).prefix_with('IGNORE', dialect='mysql').prefix_with('OR IGNORE', dialect='sqlite')
+
+
+@event.listens_for(Session, 'before_commit')
+def _apply_contributions(session):
+    pending = session.info.pop('contributions', None)
+    if not pending:
+        return
+    now = datetime.utcnow()
+    for user_id, deltas in sorted(pending.items()):
+        values = {name: getattr(UserStats, name) + delta for name, delta in deltas.items() if delta}
+        if not values:
+            continue
+        result = session.execute(
+            update(UserStats).where(UserStats.user_id == user_id).values(updated_at=now, **values)
+            .execution_options(synchronize_session=False)
+        )
+        if not result.rowcount:
+            # Строки ещё нет: счётчики считаются целиком, уже вместе с текущими изменениями
+            session.flush()
+            row = _compute(session, [user_id])[user_id]
+            session.execute(_insert_ignore(), [dict(row, user_id=user_id, updated_at=now)])
+    bus.invalidate(session, 'profiles', *pending)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_contributions(session, previous_transaction):
+    session.info.pop('contributions', None)
+
+
+def forget_profile(user_id):
+    bus.publish('profiles', user_id)
+
+
+def _load_summary(user_id):
+    user = db.session.query(
+        User.id, User.username, User.email, User.about_me, User.skills, User.avatar
+    ).filter(User.id == user_id, User.deleting == False).first()
+    if user is None:
+        return None
+    stats = db.session.query(*(getattr(UserStats, name) for name in COUNTERS)) \
+        .filter(UserStats.user_id == user_id).first()
+    # Пока сверка не создала строку, счётчики считаются на лету
+    counters = dict(zip(COUNTERS, stats)) if stats else _compute(db.session, [user_id])[user_id]
+    timed = counters['tasks_on_time'] + counters['tasks_late']
+    return Summary(
+        *user,
+        projects_created=counters['projects_created'],
+        tasks_completed=counters['tasks_completed'],
+        on_time_rate=round(100 * counters['tasks_on_time'] / timed) if timed else None
+    )
+
+
+def profile_summary(user_id):
+    return _cache().get_or_set(user_id, lambda: _load_summary(user_id))
+
+
+@job('reconcile_contributions')
+def reconcile_contributions(batch_size=None):
+    # Приращения не учитывают удаление проектов и переназначение завершённых задач —
+    # сверка пересчитывает счётчики порциями пользователей и исправляет расхождения
+    batch_size = batch_size or current_app.config.get('CONTRIBUTIONS_BATCH_SIZE', 500)
+    last_id = 0
+    fixed = 0
+    while True:
+        ids = [row[0] for row in db.session.query(User.id).filter(User.id > last_id).order_by(User.id).limit(batch_size)]
+        if not ids:
+            break
+        last_id = ids[-1]
+
+        actual = _compute(db.session, ids)
+        stored = {stats.user_id: stats for stats in UserStats.query.filter(UserStats.user_id.in_(ids))}
+        now = datetime.utcnow()
+        missing = []
+        changed = []
+        for user_id, counters in actual.items():
+            stats = stored.get(user_id)
+            if stats is None:
+                if any(counters.values()):
+                    missing.append(dict(counters, user_id=user_id, updated_at=now))
+                    changed.append(user_id)
+            elif any(getattr(stats, name) != value for name, value in counters.items()):
+                for name, value in counters.items():
+                    setattr(stats, name, value)
+                stats.updated_at = now
+                changed.append(user_id)
+        if missing:
+            db.session.execute(_insert_ignore(), missing)
+        bus.invalidate(db.session, 'profiles', *changed)
+        db.session.commit()
+        fixed += len(changed)
+
+    if fixed:
+        current_app.logger.info('reconcile_contributions: fixed counters of %s users', fixed)
+    return fixed
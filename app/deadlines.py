@@ -0,0 +1,96 @@
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import insert
+
+from app import db
+from app.jobs import job
+from app.models import Task, SubTask, Reminder, TaskStatus
+
+
+def _existing_reminders(column, ids, *criteria):
+    if not ids:
+        return set()
+    return set(db.session.query(column, Reminder.kind).filter(column.in_(ids), *criteria))
+
+
+def _reminder(kind, user_id, task_id, due_at, subtask_id=None):
+    return {
+        'user_id': user_id,
+        'task_id': task_id,
+        'subtask_id': subtask_id,
+        'kind': kind,
+        'due_at': due_at,
+        'created_at': datetime.utcnow(),
+        'seen': False
+    }
+
+
+@job('sweep_deadlines')
+def sweep_deadlines():
+    now = datetime.utcnow()
+    soon = now + timedelta(hours=current_app.config.get('REMINDER_WINDOW_HOURS', 24))
+    stale = now - timedelta(hours=current_app.config.get('REMINDER_OVERDUE_MAX_AGE_HOURS', 72))
+    reminders = []
+
+    # Сроки, истёкшие раньше stale, помечаются без напоминания: иначе первый проход после появления флага
+    # overdue напомнил бы обо всех давно просроченных задачах сразу
+    silenced = Task.query.filter(
+        Task.status.in_([TaskStatus.NOT_STARTED, TaskStatus.IN_PROGRESS]),
+        Task.overdue == False,
+        Task.deadline < stale
+    ).update({'overdue': True}, synchronize_session=False)
+    silenced += SubTask.query.filter(
+        SubTask.completed == False,
+        SubTask.overdue == False,
+        SubTask.deadline < stale.date()
+    ).update({'overdue': True}, synchronize_session=False)
+
+    # Проход по индексу (status, overdue, deadline) для двух незавершённых статусов:
+    # и просроченные, и скоро истекающие
+    tasks = db.session.query(Task.id, Task.assignee_id, Task.deadline).filter(
+        Task.status.in_([TaskStatus.NOT_STARTED, TaskStatus.IN_PROGRESS]),
+        Task.overdue == False,
+        Task.deadline < soon
+    ).all()
+    overdue_ids = [t.id for t in tasks if t.deadline < now]
+    existing = _existing_reminders(Reminder.task_id, [t.id for t in tasks], Reminder.subtask_id == None)
+    for t in tasks:
+        kind = 'overdue' if t.deadline < now else 'due_soon'
+        if t.assignee_id and (t.id, kind) not in existing:
+            reminders.append(_reminder(kind, t.assignee_id, t.id, t.deadline))
+
+    subtasks = db.session.query(SubTask.id, SubTask.task_id, SubTask.deadline, Task.assignee_id) \
+        .join(Task, Task.id == SubTask.task_id) \
+        .filter(
+            SubTask.completed == False,
+            SubTask.overdue == False,
+            SubTask.deadline < soon.date()
+        ).all()
+    overdue_subtask_ids = [s.id for s in subtasks if s.deadline < now.date()]
+    existing = _existing_reminders(Reminder.subtask_id, [s.id for s in subtasks])
+    for s in subtasks:
+        kind = 'overdue' if s.deadline < now.date() else 'due_soon'
+        if s.assignee_id and (s.id, kind) not in existing:
+            due_at = datetime.combine(s.deadline, datetime.min.time())
+            reminders.append(_reminder(kind, s.assignee_id, s.task_id, due_at, subtask_id=s.id))
+
+    if overdue_ids:
+        Task.query.filter(Task.id.in_(overdue_ids)).update({'overdue': True}, synchronize_session=False)
+    if overdue_subtask_ids:
+        SubTask.query.filter(SubTask.id.in_(overdue_subtask_ids)).update({'overdue': True}, synchronize_session=False)
+    if reminders:
+        db.session.execute(insert(Reminder), reminders)
+    db.session.commit()
+
+    current_app.logger.info('deadline sweep: %s tasks and %s subtasks overdue, %s reminders, %s stale without reminder',
+                            len(overdue_ids), len(overdue_subtask_ids), len(reminders), silenced)
+    return len(reminders)
+
+
+def is_overdue(deadline):
+    if not deadline:
+        return False
+    if not isinstance(deadline, datetime):
+        deadline = datetime.combine(deadline, datetime.min.time())
+    return deadline < datetime.utcnow()
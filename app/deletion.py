@@ -0,0 +1,147 @@
+import os
+
+from flask import current_app
+
+from app import db
+from app import badges
+from app.contributions import forget_profile
+from app.jobs import job
+from app.models import User, Project, ProjectParticipant, Task, SubTask, Application, Invitation, Message, MessageArchive, \
+    Reminder, Recommendation, Activity, UserStats, RequestStatus
+
+
+def _log_progress(table, count):
+    current_app.logger.info('deleted %s rows from %s', count, table)
+
+
+def _chunk_size(chunk_size):
+    return chunk_size or current_app.config.get('DELETE_CHUNK_SIZE', 1000)
+
+
+def _delete_in_chunks(model, criterion, chunk_size, progress, join=None):
+    # Каждая порция удаляется отдельной транзакцией, чтобы не держать блокировки долго
+    total = 0
+    while True:
+        query = db.session.query(model.id)
+        if join is not None:
+            query = query.join(join)
+        ids = [row[0] for row in query.filter(criterion).limit(chunk_size)]
+        if not ids:
+            break
+        db.session.query(model).filter(model.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        total += len(ids)
+        progress(model.__tablename__, total)
+    return total
+
+
+def _update_in_chunks(model, criterion, values, chunk_size, progress):
+    total = 0
+    while True:
+        ids = [row[0] for row in db.session.query(model.id).filter(criterion).limit(chunk_size)]
+        if not ids:
+            break
+        db.session.query(model).filter(model.id.in_(ids)).update(values, synchronize_session=False)
+        db.session.commit()
+        total += len(ids)
+        progress(model.__tablename__, total)
+    return total
+
+
+def _recommendation_criterion(subject_kind, target_kind, object_id):
+    return db.or_(
+        db.and_(Recommendation.kind == subject_kind, Recommendation.subject_id == object_id),
+        db.and_(Recommendation.kind == target_kind, Recommendation.target_id == object_id)
+    )
+
+
+@job('remove_avatar')
+def remove_avatar(avatar):
+    if not avatar:
+        return
+    avatar_path = os.path.join(current_app.root_path, 'static', avatar)
+    if os.path.exists(avatar_path):
+        os.remove(avatar_path)
+
+
+@job('delete_project')
+def delete_project(project_id, chunk_size=None, progress=None):
+    chunk_size = _chunk_size(chunk_size)
+    progress = progress or _log_progress
+    counts = {}
+    badge_users = [row[0] for row in db.session.query(Invitation.user_id).filter_by(
+        project_id=project_id, status=RequestStatus.PENDING)]
+    badge_users.append(db.session.query(Project.creator_id).filter_by(id=project_id).scalar())
+
+    # Зависимые строки удаляются в порядке внешних ключей: сначала листья, потом проект
+    counts['reminder'] = _delete_in_chunks(
+        Reminder, Task.project_id == project_id, chunk_size, progress, join=Reminder.task)
+    counts['sub_task'] = _delete_in_chunks(
+        SubTask, Task.project_id == project_id, chunk_size, progress, join=SubTask.task)
+    _update_in_chunks(
+        Task, db.and_(Task.project_id == project_id, Task.parent_task_id != None),
+        {'parent_task_id': None}, chunk_size, progress)
+    counts['task'] = _delete_in_chunks(Task, Task.project_id == project_id, chunk_size, progress)
+    counts['message'] = _delete_in_chunks(Message, Message.project_id == project_id, chunk_size, progress)
+    counts['message_archive'] = _delete_in_chunks(
+        MessageArchive, MessageArchive.project_id == project_id, chunk_size, progress)
+    counts['application'] = _delete_in_chunks(
+        Application, Application.project_id == project_id, chunk_size, progress)
+    counts['invitation'] = _delete_in_chunks(
+        Invitation, Invitation.project_id == project_id, chunk_size, progress)
+    counts['project_participant'] = _delete_in_chunks(
+        ProjectParticipant, ProjectParticipant.project_id == project_id, chunk_size, progress)
+
+    counts['recommendation'] = _delete_in_chunks(
+        Recommendation, _recommendation_criterion('candidate', 'project', project_id), chunk_size, progress)
+    counts['activity'] = _delete_in_chunks(Activity, Activity.project_id == project_id, chunk_size, progress)
+
+    counts['project'] = db.session.query(Project).filter_by(id=project_id).delete(synchronize_session=False)
+    db.session.commit()
+    progress('project', counts['project'])
+    badges.forget(*badge_users)
+    return counts
+
+
+@job('delete_user')
+def delete_user(user_id, chunk_size=None, progress=None):
+    chunk_size = _chunk_size(chunk_size)
+    progress = progress or _log_progress
+    counts = {}
+
+    project_ids = [row[0] for row in db.session.query(Project.id).filter_by(creator_id=user_id)]
+    # Владельцы проектов, где у пользователя висят заявки: их счётчики в навигации уменьшатся
+    badge_users = [row[0] for row in db.session.query(Project.creator_id).join(Application).filter(
+        Application.user_id == user_id, Application.status == RequestStatus.PENDING)]
+    for project_id in project_ids:
+        for table, count in delete_project(project_id, chunk_size, progress).items():
+            counts[table] = counts.get(table, 0) + count
+
+    _update_in_chunks(Task, Task.assignee_id == user_id, {'assignee_id': None}, chunk_size, progress)
+    # Журнал проектов сохраняется, автор записей становится анонимным
+    _update_in_chunks(Activity, Activity.user_id == user_id, {'user_id': None}, chunk_size, progress)
+    counts['reminder'] = counts.get('reminder', 0) + _delete_in_chunks(
+        Reminder, Reminder.user_id == user_id, chunk_size, progress)
+    counts['message'] = counts.get('message', 0) + _delete_in_chunks(
+        Message, Message.user_id == user_id, chunk_size, progress)
+    counts['message_archive'] = counts.get('message_archive', 0) + _delete_in_chunks(
+        MessageArchive, MessageArchive.user_id == user_id, chunk_size, progress)
+    counts['application'] = counts.get('application', 0) + _delete_in_chunks(
+        Application, Application.user_id == user_id, chunk_size, progress)
+    counts['invitation'] = counts.get('invitation', 0) + _delete_in_chunks(
+        Invitation, Invitation.user_id == user_id, chunk_size, progress)
+    counts['project_participant'] = counts.get('project_participant', 0) + _delete_in_chunks(
+        ProjectParticipant, ProjectParticipant.user_id == user_id, chunk_size, progress)
+
+    counts['recommendation'] = counts.get('recommendation', 0) + _delete_in_chunks(
+        Recommendation, _recommendation_criterion('project', 'candidate', user_id), chunk_size, progress)
+
+    counts['user_stats'] = db.session.query(UserStats).filter_by(user_id=user_id).delete(synchronize_session=False)
+    avatar = db.session.query(User.avatar).filter_by(id=user_id).scalar()
+    counts['user'] = db.session.query(User).filter_by(id=user_id).delete(synchronize_session=False)
+    db.session.commit()
+    progress('user', counts['user'])
+    forget_profile(user_id)
+    badges.forget(user_id, *badge_users)
+    remove_avatar(avatar)
+    return counts
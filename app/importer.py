@@ -0,0 +1,310 @@
+import csv
+import io
+import json
+import time
+from datetime import datetime
+
+import click
+from sqlalchemy import insert, update, cast, String
+
+from app import db
+from app.contributions import bump
+from app.models import User, Project, ProjectParticipant, Task, SubTask
+
+
+class ImportValidationError(ValueError):
+    def __init__(self, errors):
+        super().__init__('; '.join(errors))
+        self.errors = errors
+
+
+def parse_json(text):
+    data = json.loads(text)
+    if isinstance(data, dict):
+        if 'projects' not in data:
+            raise ImportValidationError(['В файле нет списка projects'])
+        data = data['projects']
+    return data
+
+
+def parse_csv(text):
+    # Плоские строки CSV собираются в ту же вложенную структуру, что и JSON
+    projects = {}
+    tasks = {}
+    for row in csv.DictReader(io.StringIO(text)):
+        kind = (row.get('type') or '').strip()
+        project_key = (row.get('project') or '').strip()
+        # Строка проекта может идти после его задач и участников: поля дописываются к уже собранному
+        project = projects.setdefault(project_key, {'title': project_key, 'participants': [], 'tasks': []})
+        if kind == 'project':
+            project.update(
+                description=row.get('description'),
+                skills_required=(row.get('skills_required') or '').strip(),
+                deadline=row.get('deadline')
+            )
+        elif kind == 'participant':
+            project['participants'].append(row.get('username'))
+        elif kind == 'task':
+            task = {
+                'title': row.get('title'),
+                'description': row.get('description'),
+                'deadline': row.get('deadline'),
+                'assignee': row.get('username'),
+                'subtasks': []
+            }
+            tasks[(project_key, (task['title'] or '').strip())] = task
+            project['tasks'].append(task)
+        elif kind == 'subtask':
+            task_key = (project_key, (row.get('task') or '').strip())
+            task = tasks.get(task_key)
+            if task is None:
+                task = {'title': task_key[1], 'subtasks': []}
+                tasks[task_key] = task
+                project['tasks'].append(task)
+            task['subtasks'].append({'title': row.get('title'), 'deadline': row.get('deadline')})
+    return list(projects.values())
+
+
+def _parse_date(value, where, errors, required=False):
+    value = (value or '').strip()
+    if not value:
+        if required:
+            errors.append(f'{where}: не указан дедлайн')
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        errors.append(f'{where}: неверный формат даты "{value}"')
+        return None
+
+
+def _string_fields(obj, names, where, errors):
+    for name in names:
+        value = obj.get(name)
+        if value is not None and not isinstance(value, str):
+            errors.append(f'{where}: поле {name} должно быть строкой')
+
+
+def _list_of(value, kind, where, name, errors):
+    # Возвращает элементы списка, если структура верна; иначе пишет ошибку и возвращает []
+    if value is None:
+        return []
+    if not isinstance(value, list) or not all(isinstance(item, kind) for item in value):
+        expected = 'строк' if kind is str else 'объектов'
+        errors.append(f'{where}: {name} должно быть списком {expected}')
+        return []
+    return value
+
+
+def _shape_errors(projects):
+    # JSON приходит от пользователя: прежде чем читать поля, проверяем, что вложенность и типы те, что ожидаются
+    if not isinstance(projects, list):
+        return ['Файл должен содержать список проектов']
+    errors = []
+    for i, project in enumerate(projects, 1):
+        where = f'Проект {i}'
+        if not isinstance(project, dict):
+            errors.append(f'{where}: ожидается объект')
+            continue
+        _string_fields(project, ('title', 'description', 'skills_required', 'deadline'), where, errors)
+        _list_of(project.get('participants'), str, where, 'participants', errors)
+        for j, task in enumerate(_list_of(project.get('tasks'), dict, where, 'tasks', errors), 1):
+            task_where = f'{where}, задача {j}'
+            _string_fields(task, ('title', 'description', 'deadline', 'assignee'), task_where, errors)
+            for k, subtask in enumerate(_list_of(task.get('subtasks'), dict, task_where, 'subtasks', errors), 1):
+                _string_fields(subtask, ('title', 'deadline'), f'{task_where}, подзадача {k}', errors)
+    return errors
+
+
+def validate(projects, creator_id):
+    errors = _shape_errors(projects)
+    if errors:
+        raise ImportValidationError(errors)
+
+    usernames = set()
+    for project in projects:
+        usernames.update(name.strip() for name in project.get('participants') or [] if name)
+        for task in project.get('tasks') or []:
+            if task.get('assignee'):
+                usernames.add(task['assignee'].strip())
+
+    # Все имена пользователей разрешаются одним запросом
+    user_ids = {}
+    if usernames:
+        user_ids = dict(db.session.query(User.username, User.id).filter(User.username.in_(usernames)))
+    for name in sorted(usernames - set(user_ids)):
+        errors.append(f'Пользователь "{name}" не найден')
+
+    cleaned = []
+    for i, project in enumerate(projects, 1):
+        where = f'Проект {i}'
+        title = (project.get('title') or '').strip()
+        description = (project.get('description') or '').strip()
+        if not title:
+            errors.append(f'{where}: не указано название')
+        if not description:
+            errors.append(f'{where}: не указано описание')
+
+        member_ids = {creator_id}
+        participant_ids = []
+        for name in project.get('participants') or []:
+            user_id = user_ids.get((name or '').strip())
+            if user_id and user_id not in member_ids:
+                member_ids.add(user_id)
+                participant_ids.append(user_id)
+
+        deadline = _parse_date(project.get('deadline'), where, errors)
+        tasks = []
+        for j, task in enumerate(project.get('tasks') or [], 1):
+            task_where = f'{where}, задача {j}'
+            task_title = (task.get('title') or '').strip()
+            if not task_title:
+                errors.append(f'{task_where}: не указано название')
+
+            assignee_id = None
+            if task.get('assignee'):
+                assignee_id = user_ids.get(task['assignee'].strip())
+                if assignee_id and assignee_id not in member_ids:
+                    errors.append(f'{task_where}: ответственный не является участником проекта')
+
+            task_deadline = _parse_date(task.get('deadline'), task_where, errors) or deadline
+            subtasks = []
+            for k, subtask in enumerate(task.get('subtasks') or [], 1):
+                subtask_where = f'{task_where}, подзадача {k}'
+                subtask_title = (subtask.get('title') or '').strip()
+                if not subtask_title:
+                    errors.append(f'{subtask_where}: не указано название')
+                subtask_deadline = _parse_date(subtask.get('deadline'), subtask_where, errors, required=True)
+                if subtask_deadline and task_deadline and subtask_deadline.date() > task_deadline.date():
+                    errors.append(f'{subtask_where}: дедлайн позже дедлайна задачи')
+                subtasks.append({'title': subtask_title, 'deadline': subtask_deadline and subtask_deadline.date()})
+
+            tasks.append({
+                'title': task_title,
+                'description': task.get('description'),
+                'deadline': task_deadline,
+                'assignee_id': assignee_id,
+                'subtasks': subtasks
+            })
+
+        cleaned.append({
+            'title': title,
+            'description': description,
+            'skills_required': (project.get('skills_required') or '').strip(),
+            'deadline': deadline,
+            'participant_ids': participant_ids,
+            'tasks': tasks
+        })
+
+    if errors:
+        raise ImportValidationError(errors)
+    return cleaned
+
+
+def _insert_tasks(rows, project_ids):
+    # MySQL не возвращает id из executemany: задачи новых проектов перечитываются по возрастанию id,
+    # а автоинкремент внутри одной вставки идёт в порядке строк
+    if not rows:
+        return []
+    db.session.execute(insert(Task), rows)
+    ids_by_project = {}
+    for task_id, project_id in db.session.query(Task.id, Task.project_id) \
+            .filter(Task.project_id.in_(project_ids)).order_by(Task.id):
+        ids_by_project.setdefault(project_id, []).append(task_id)
+    positions = {project_id: iter(ids) for project_id, ids in ids_by_project.items()}
+    task_ids = [next(positions[row['project_id']]) for row in rows]
+
+    # Импортированные задачи — один уровень без родителей: путь ставится одним UPDATE
+    db.session.execute(
+        update(Task).where(Task.project_id.in_(project_ids), Task.parent_task_id == None)
+        .values(path=cast(Task.id, String) + '/')
+        .execution_options(synchronize_session=False)
+    )
+    return task_ids
+
+
+def import_projects(projects, creator_id):
+    projects = validate(projects, creator_id)
+    started = time.perf_counter()
+
+    try:
+        # Проектов немного, их id даёт flush; задачи, подзадачи и участники вставляются executemany
+        project_rows = [Project(
+            title=p['title'],
+            description=p['description'],
+            skills_required=p['skills_required'],
+            deadline=p['deadline'],
+            creator_id=creator_id
+        ) for p in projects]
+        db.session.add_all(project_rows)
+        db.session.flush()
+
+        participants = []
+        task_rows = []
+        for project, row in zip(projects, project_rows):
+            participants.append({'user_id': creator_id, 'project_id': row.id})
+            participants.extend({'user_id': user_id, 'project_id': row.id} for user_id in project['participant_ids'])
+            task_rows.extend({
+                'title': task['title'],
+                'description': task['description'],
+                'deadline': task['deadline'],
+                'project_id': row.id,
+                'assignee_id': task['assignee_id']
+            } for task in project['tasks'])
+        task_ids = _insert_tasks(task_rows, [row.id for row in project_rows])
+
+        tasks = [task for project in projects for task in project['tasks']]
+        subtasks = [
+            {'title': subtask['title'], 'deadline': subtask['deadline'], 'completed': False, 'task_id': task_id}
+            for task, task_id in zip(tasks, task_ids) for subtask in task['subtasks']
+        ]
+        if participants:
+            db.session.execute(insert(ProjectParticipant), participants)
+        if subtasks:
+            db.session.execute(insert(SubTask), subtasks)
+        bump(creator_id, projects_created=len(project_rows))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    elapsed = time.perf_counter() - started
+    stats = {
+        'projects': len(project_rows),
+        'participants': len(participants),
+        'tasks': len(task_rows),
+        'subtasks': len(subtasks),
+        'seconds': elapsed
+    }
+    stats['rows'] = stats['projects'] + stats['participants'] + stats['tasks'] + stats['subtasks']
+    stats['rows_per_sec'] = stats['rows'] / elapsed if elapsed else 0
+    return stats
+
+
+def load(filename, text):
+    if filename.lower().endswith('.json'):
+        return parse_json(text)
+    return parse_csv(text)
+
+
+@click.command('import-projects')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--creator', required=True, help='Имя пользователя — владельца проектов.')
+def import_projects_command(path, creator):
+    """Массовый импорт проектов, задач, подзадач и участников из CSV или JSON."""
+    user = User.query.filter_by(username=creator).first()
+    if user is None:
+        raise click.ClickException(f'Пользователь "{creator}" не найден')
+
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+    try:
+        stats = import_projects(load(path, text), user.id)
+    except ImportValidationError as e:
+        for error in e.errors:
+            click.echo(error, err=True)
+        raise click.ClickException('Импорт отменён: файл содержит ошибки')
+
+    click.echo(f"Импортировано: проектов {stats['projects']}, участников {stats['participants']}, "
+               f"задач {stats['tasks']}, подзадач {stats['subtasks']} "
+               f"за {stats['seconds']:.2f} с ({stats['rows_per_sec']:.0f} строк/с)")
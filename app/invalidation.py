@@ -0,0 +1,230 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.cache import all_caches
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+class SQLiteTransport:
+    # Локальная шина для воркеров одной машины: общий файл SQLite, каждый процесс читает события после своего id
+    def __init__(self, url, retention=300):
+        self.path = url[len('sqlite:///'):]
+        self.retention = retention
+        self.last_id = None
+        self._connection = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        # После fork соединение родителя не используется
+        if self._connection is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._connection = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS invalidation ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, origin TEXT NOT NULL, payload TEXT NOT NULL, created REAL NOT NULL)'
+            )
+            self._pid = os.getpid()
+        return self._connection
+
+    def publish(self, origin, events):
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            cursor = connection.execute('INSERT INTO invalidation (origin, payload, created) VALUES (?, ?, ?)',
+                                        (origin, json.dumps(events), now))
+            if cursor.lastrowid % 100 == 0:
+                connection.execute('DELETE FROM invalidation WHERE created < ?', (now - self.retention,))
+
+    def fetch(self):
+        with self._lock:
+            connection = self._connect()
+            if self.last_id is None:
+                # Новый процесс начинает с текущего конца: его кэши ещё пусты
+                self.last_id = connection.execute('SELECT COALESCE(MAX(id), 0) FROM invalidation').fetchone()[0]
+                return []
+            rows = connection.execute('SELECT id, origin, payload FROM invalidation WHERE id > ? ORDER BY id LIMIT 1000',
+                                      (self.last_id,)).fetchall()
+        if rows:
+            self.last_id = rows[-1][0]
+        return [(origin, json.loads(payload)) for _, origin, payload in rows]
+
+
+class RedisTransport:
+    # Сетевая шина для нескольких серверов: Redis Stream, длина ограничена примерно maxlen событиями
+    def __init__(self, url, stream='invalidation', maxlen=10000):
+        if redis is None:
+            raise RuntimeError('redis is not installed')
+        self.client = redis.Redis.from_url(url)
+        self.stream = stream
+        self.maxlen = maxlen
+        self.last_id = None
+
+    def publish(self, origin, events):
+        self.client.xadd(self.stream, {'origin': origin, 'payload': json.dumps(events)},
+                         maxlen=self.maxlen, approximate=True)
+
+    def fetch(self):
+        if self.last_id is None:
+            latest = self.client.xrevrange(self.stream, count=1)
+            self.last_id = latest[0][0] if latest else b'0-0'
+            return []
+        result = self.client.xread({self.stream: self.last_id}, count=1000)
+        messages = result[0][1] if result else []
+        if messages:
+            self.last_id = messages[-1][0]
+        return [(fields[b'origin'].decode(), json.loads(fields[b'payload'])) for _, fields in messages]
+
+
+TRANSPORTS = {
+    'sqlite': lambda url, app: SQLiteTransport(url, app.config.get('INVALIDATION_RETENTION', 300)),
+    'redis': lambda url, app: RedisTransport(url),
+    'rediss': lambda url, app: RedisTransport(url),
+}
+
+
+def register_transport(scheme, factory):
+    # factory(url, app) -> объект с publish(origin, events) и fetch() -> [(origin, events)]
+    TRANSPORTS[scheme] = factory
+
+
+def _key(key):
+    # JSON превращает кортежи в списки, ключи кэша должны остаться хешируемыми
+    return tuple(_key(part) for part in key) if isinstance(key, list) else key
+
+
+def apply(events):
+    caches = all_caches()
+    for name, key in events:
+        cache = caches.get(name)
+        if cache is None:
+            continue
+        if key is None:
+            cache.clear()
+        else:
+            cache.delete(_key(key))
+
+
+class InvalidationBus:
+    # Событие — пара (имя кэша, ключ); ключ None очищает кэш целиком. После commit события применяются
+    # к кэшам своего процесса и публикуются, остальные воркеры забирают их в начале запроса
+    def __init__(self, app=None):
+        self.transport = None
+        self.rules = {}
+        self.interval = 0.2
+        self.retention = 300
+        self.published = 0
+        self.received = 0
+        self._last_poll = 0
+        self._last_success = time.monotonic()
+        self._poll_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not app.config.get('INVALIDATION_ENABLED', True):
+            return
+        url = app.config.get('INVALIDATION_URL') or 'sqlite:///' + os.path.join(app.instance_path, 'invalidation.db')
+        scheme = url.split(':', 1)[0]
+        if scheme not in TRANSPORTS:
+            raise RuntimeError(f'Unknown invalidation transport: {scheme}')
+        self.transport = TRANSPORTS[scheme](url, app)
+        self.interval = app.config.get('INVALIDATION_POLL_INTERVAL', 0.2)
+        self.retention = app.config.get('INVALIDATION_RETENTION', 300)
+        app.before_request(self.poll)
+
+    @property
+    def origin(self):
+        return f'{socket.gethostname()}:{os.getpid()}'
+
+    def watch(self, model, cache_name, key=lambda obj: obj.id):
+        # Изменение строки модели через ORM сбрасывает запись кэша с ключом key(obj)
+        self.rules.setdefault(model, []).append((cache_name, key))
+
+    def invalidate(self, session, cache_name, *keys):
+        # Для изменений мимо ORM (UPDATE, upsert): событие уйдёт вместе с commit сессии
+        session.info.setdefault('invalidations', set()).update((cache_name, key) for key in keys)
+
+    def publish(self, cache_name, *keys):
+        # Сразу, без транзакции: для кода, который сам уже сделал commit
+        if not keys:
+            return
+        self._send([(cache_name, key) for key in keys])
+
+    def _send(self, events):
+        apply(events)
+        if self.transport is None:
+            return
+        try:
+            self.transport.publish(self.origin, events)
+            self.published += 1
+        except Exception:
+            # Ошибка шины не должна ломать уже зафиксированную транзакцию; другие воркеры догонят по TTL
+            if has_app_context():
+                current_app.logger.exception('invalidation publish failed')
+
+    def poll(self):
+        now = time.monotonic()
+        if self.transport is None or now - self._last_poll < self.interval:
+            return
+        if not self._poll_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_poll = now
+            try:
+                messages = self.transport.fetch()
+            except Exception:
+                current_app.logger.exception('invalidation poll failed')
+                return
+            if now - self._last_success > self.retention:
+                # Процесс долго не читал шину и мог пропустить события: доверять кэшам нельзя
+                for cache in all_caches().values():
+                    cache.clear()
+            self._last_success = now
+            origin = self.origin
+            for sender, events in messages:
+                if sender != origin:
+                    apply(events)
+                    self.received += 1
+        finally:
+            self._poll_lock.release()
+
+
+bus = InvalidationBus()
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect(session, flush_context):
+    if not bus.rules:
+        return
+    events = session.info.setdefault('invalidations', set())
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        for cache_name, key in bus.rules.get(type(obj), ()):
+            events.add((cache_name, key(obj)))
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish(session):
+    events = session.info.pop('invalidations', None)
+    if events:
+        bus._send(sorted(events, key=repr))
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard(session, previous_transaction):
+    session.info.pop('invalidations', None)
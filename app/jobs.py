@@ -0,0 +1,175 @@
+import json
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from app import db
+from app.invalidation import bus
+from app.models import Job
+
+_registry = {}
+
+jobs_cli = AppGroup('jobs', help='Фоновые задачи.')
+
+
+def job(name):
+    def decorator(func):
+        _registry[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, delay=0, max_attempts=None, **kwargs):
+    # enqueue фиксирует текущую сессию: задача и подготовившие её изменения вызывающего кода
+    # вступают в силу одним commit. При JOBS_EAGER изменения фиксируются до запуска задачи, id нет
+    if name not in _registry:
+        raise KeyError(f'Unknown job: {name}')
+
+    if current_app.config.get('JOBS_EAGER'):
+        db.session.commit()
+        _registry[name](**kwargs)
+        return None
+
+    job_row = Job(
+        name=name,
+        payload=json.dumps(kwargs),
+        max_attempts=max_attempts or current_app.config.get('JOBS_MAX_ATTEMPTS', 3),
+        run_at=datetime.utcnow() + timedelta(seconds=delay)
+    )
+    db.session.add(job_row)
+    db.session.commit()
+    return job_row.id
+
+
+def _claim():
+    now = datetime.utcnow()
+    candidate = db.session.query(Job.id).filter(
+        Job.status == 'queued',
+        Job.run_at <= now
+    ).order_by(Job.run_at, Job.id).first()
+    if candidate is None:
+        return None
+
+    # Условие на статус в UPDATE не даёт двум воркерам взять одну задачу
+    claimed = Job.query.filter_by(id=candidate.id, status='queued').update(
+        {'status': 'running', 'attempts': Job.attempts + 1, 'started_at': now},
+        synchronize_session=False
+    )
+    db.session.commit()
+    return candidate.id if claimed else None
+
+
+def _run(app, job_id):
+    with app.app_context():
+        # Воркер очереди тоже держит кэши процесса: перед задачей забираем чужие инвалидации
+        bus.poll()
+        job_row = Job.query.get(job_id)
+        func = _registry.get(job_row.name)
+        try:
+            if func is None:
+                raise KeyError(f'Unknown job: {job_row.name}')
+            func(**json.loads(job_row.payload or '{}'))
+        except Exception:
+            db.session.rollback()
+            job_row = Job.query.get(job_id)
+            job_row.last_error = traceback.format_exc()
+            if job_row.attempts < job_row.max_attempts:
+                delay = app.config.get('JOBS_RETRY_DELAY', 30) * 2 ** (job_row.attempts - 1)
+                job_row.status = 'queued'
+                job_row.run_at = datetime.utcnow() + timedelta(seconds=delay)
+            else:
+                job_row.status = 'failed'
+                job_row.finished_at = datetime.utcnow()
+            app.logger.exception('job %s (%s) failed', job_id, job_row.name)
+        else:
+            job_row.status = 'done'
+            job_row.finished_at = datetime.utcnow()
+        db.session.commit()
+
+
+def requeue_stale():
+    timeout = current_app.config.get('JOBS_TIMEOUT', 600)
+    stale_before = datetime.utcnow() - timedelta(seconds=timeout)
+    count = Job.query.filter(Job.status == 'running', Job.started_at < stale_before).update(
+        {'status': 'queued'}, synchronize_session=False
+    )
+    db.session.commit()
+    return count
+
+
+def schedule_due():
+    # Периодическая задача ставится, если её нет в очереди и она не создавалась в течение интервала
+    now = datetime.utcnow()
+    scheduled = []
+    for name, interval in current_app.config.get('JOBS_SCHEDULE', {}).items():
+        exists = db.session.query(Job.id).filter(
+            Job.name == name,
+            db.or_(
+                Job.status.in_(['queued', 'running']),
+                Job.created_at > now - timedelta(seconds=interval)
+            )
+        ).first()
+        if exists is None:
+            enqueue(name)
+            scheduled.append(name)
+    return scheduled
+
+
+def work(threads=None, once=False):
+    app = current_app._get_current_object()
+    threads = threads or app.config.get('JOBS_THREADS', 4)
+    poll_interval = app.config.get('JOBS_POLL_INTERVAL', 1)
+    requeue_stale()
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        running = set()
+        next_schedule = 0
+        while True:
+            if not once and time.monotonic() >= next_schedule:
+                schedule_due()
+                next_schedule = time.monotonic() + app.config.get('JOBS_SCHEDULE_CHECK', 60)
+            running = {f for f in running if not f.done()}
+            job_id = _claim() if len(running) < threads else None
+            if job_id is not None:
+                running.add(pool.submit(_run, app, job_id))
+                continue
+            if once and not running:
+                break
+            time.sleep(poll_interval)
+
+
+@jobs_cli.command('work')
+@click.option('--threads', type=int, help='Количество потоков воркера.')
+@click.option('--once', is_flag=True, help='Выполнить накопившиеся задачи и выйти.')
+def work_command(threads, once):
+    """Запустить воркер фоновых задач."""
+    work(threads=threads, once=once)
+
+
+@jobs_cli.command('run')
+@click.argument('name')
+def run_command(name):
+    """Выполнить зарегистрированную задачу сразу, без очереди."""
+    if name not in _registry:
+        raise click.ClickException(f'Неизвестная задача: {name}')
+    result = _registry[name]()
+    if result is not None:
+        click.echo(result)
+
+
+@jobs_cli.command('list')
+@click.option('--status', help='queued, running, done или failed.')
+@click.option('--limit', default=20)
+def list_command(status, limit):
+    """Показать последние задачи."""
+    query = Job.query
+    if status:
+        query = query.filter_by(status=status)
+    for job_row in query.order_by(Job.id.desc()).limit(limit):
+        click.echo(f'{job_row.id}\t{job_row.name}\t{job_row.status}\t'
+                   f'{job_row.attempts}/{job_row.max_attempts}\t{job_row.run_at:%Y-%m-%d %H:%M:%S}')
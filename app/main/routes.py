@@ -2,6 +2,7 @@ from flask import render_template, request
 from flask_login import login_required, current_user
 from app.main import bp
 from app.models import Project, User
+from app.recommendations import projects_for
 from sqlalchemy import or_
 
 @bp.route('/')
@@ -9,8 +10,14 @@ from sqlalchemy import or_
 @login_required
 def index():
     page = request.args.get('page', 1, type=int)
-    projects = Project.query.paginate(page=page, per_page=10)
-    return render_template('main/index.html', title='Home', projects=projects)
+    projects = Project.active().paginate(page=page, per_page=10)
+
+    recommended_ids = projects_for(current_user.id)
+    recommended = []
+    if recommended_ids:
+        by_id = {p.id: p for p in Project.active().filter(Project.id.in_(recommended_ids))}
+        recommended = [by_id[project_id] for project_id in recommended_ids if project_id in by_id]
+    return render_template('main/index.html', title='Home', projects=projects, recommended=recommended)
 
 
 @bp.route('/search')
@@ -18,9 +25,12 @@ def index():
 def search():
     page = request.args.get('page', 1, type=int)
     query = request.args.get('q', '')
+    # Архивные проекты ищутся только по запросу
+    include_archived = request.args.get('archived', 0, type=int)
+    base_query = Project.visible() if include_archived else Project.active()
 
     if query:
-        projects_query = Project.query.join(User).filter(
+        projects_query = base_query.join(User).filter(
             or_(
                 Project.title.ilike(f'%{query}%'),
                 Project.description.ilike(f'%{query}%'),
@@ -29,7 +39,8 @@ def search():
             )
         )
     else:
-        projects_query = Project.query
+        projects_query = base_query
 
     projects = projects_query.paginate(page=page, per_page=10)
-    return render_template('main/search.html', title='Search', projects=projects, query=query)
\ No newline at end of file
+    return render_template('main/search.html', title='Search', projects=projects, query=query,
+                           include_archived=include_archived)
\ No newline at end of file
@@ -0,0 +1,93 @@
+from datetime import datetime
+
+from sqlalchemy import case, select
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+from app import db
+from app.models import User, Project, ProjectParticipant, Application, Invitation, RequestStatus
+
+_INSERTS = {'mysql': mysql.insert, 'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+
+def _upsert(model, values, reopen=None, reopen_columns=()):
+    # Один INSERT ... ON DUPLICATE KEY / ON CONFLICT по уникальному (project_id, user_id).
+    # Существующая строка обновляется только если выполняется условие reopen.
+    # Возвращает True, если строка вставлена или переоткрыта.
+    table = model.__table__
+    dialect = db.session.get_bind().dialect.name
+    stmt = _INSERTS[dialect](table).values(**values)
+
+    if dialect == 'mysql':
+        if reopen is None:
+            stmt = stmt.on_duplicate_key_update(id=table.c.id)
+        else:
+            # Присваивания выполняются по порядку, поэтому status, от которого зависит условие, идёт последним
+            stmt = stmt.on_duplicate_key_update([
+                (name, case((reopen(table.c), stmt.inserted[name]), else_=table.c[name]))
+                for name in reopen_columns
+            ])
+        result = db.session.execute(stmt)
+        # Диалект SQLAlchemy всегда подключается с CLIENT_FOUND_ROWS (на нём держится проверка rowcount в ORM),
+        # и тогда 1 означает и вставку, и строку без изменений. 2 — только реальное изменение,
+        # а переоткрытие всегда меняет status. Вставку отличает id: lastrowid совпадает с id строки,
+        # только если её вставил этот запрос — иначе он пуст или равен неиспользованному значению автоинкремента
+        if result.rowcount == 2:
+            return True
+        if result.rowcount != 1 or not result.lastrowid:
+            return False
+        row_id = db.session.execute(select(table.c.id).where(
+            table.c.project_id == values['project_id'], table.c.user_id == values['user_id']
+        )).scalar()
+        return row_id == result.lastrowid
+
+    if reopen is None:
+        stmt = stmt.on_conflict_do_nothing(index_elements=['project_id', 'user_id'])
+    else:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['project_id', 'user_id'],
+            set_={name: stmt.excluded[name] for name in reopen_columns},
+            where=reopen(table.c)
+        )
+    return db.session.execute(stmt).rowcount == 1
+
+
+def add_participant(project_id, user_id):
+    return _upsert(ProjectParticipant, {
+        'project_id': project_id,
+        'user_id': user_id,
+        'joined_at': datetime.utcnow()
+    })
+
+
+def submit_application(project_id, user_id):
+    # Повторная заявка возможна только после отказа
+    return _upsert(Application, {
+        'project_id': project_id,
+        'user_id': user_id,
+        'status': RequestStatus.PENDING,
+        'applied_at': datetime.utcnow()
+    }, reopen=lambda c: c.status == RequestStatus.REJECTED, reopen_columns=('applied_at', 'status'))
+
+
+def send_invitation(project_id, user_id):
+    # Принятое или отклонённое приглашение можно отправить заново
+    return _upsert(Invitation, {
+        'project_id': project_id,
+        'user_id': user_id,
+        'status': RequestStatus.PENDING,
+        'invited_at': datetime.utcnow()
+    }, reopen=lambda c: c.status != RequestStatus.PENDING, reopen_columns=('invited_at', 'status'))
+
+
+def chat_access(project_id, user_id):
+    # Чат доступен создателю и участникам; проект и учётная запись в очереди на удаление закрыты.
+    # Одна выборка для синхронного и асинхронного чата: непустой результат — доступ есть
+    member = select(ProjectParticipant.id).where(
+        ProjectParticipant.project_id == Project.id, ProjectParticipant.user_id == user_id
+    ).exists()
+    return select(Project.id).join(User, User.id == user_id).where(
+        Project.id == project_id,
+        Project.deleting == False,
+        User.deleting == False,
+        db.or_(Project.creator_id == user_id, member)
+    )
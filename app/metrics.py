@@ -0,0 +1,289 @@
+import fcntl
+import glob
+import ipaddress
+import json
+import os
+import threading
+import time
+
+from flask import current_app, request, g, abort
+from sqlalchemy import event
+from sqlalchemy.pool import Pool
+
+from app import db
+from app.cache import all_caches
+from app.invalidation import bus
+from app.ratelimit import limiter
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+RETIRED = 'retired.json'
+
+
+class Metrics:
+    # Счётчики копятся в памяти процесса и раз в METRICS_FLUSH_INTERVAL сбрасываются в файл
+    # METRICS_DIR/<pid>.json; /metrics суммирует файлы всех воркеров
+    def __init__(self, app=None):
+        self.requests = {}
+        self.errors = {}
+        self.latency = {}
+        self.checkouts = 0
+        self.directory = None
+        self.buckets = BUCKETS
+        self._last_flush = 0
+        self._lock = threading.Lock()
+        event.listen(Pool, 'checkout', self._checkout)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.directory = app.config.get('METRICS_DIR')
+        self.buckets = tuple(app.config.get('METRICS_BUCKETS', BUCKETS))
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+        app.before_request(self.start)
+        app.after_request(self.finish)
+        app.add_url_rule('/metrics', 'metrics', self.view)
+
+    def _checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.checkouts += 1
+
+    def start(self):
+        g.metrics_started = time.perf_counter()
+
+    def finish(self, response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+        self.observe(request.endpoint or 'unmatched', response.status_code, time.perf_counter() - started)
+        if self.directory and time.monotonic() - self._last_flush >= current_app.config.get('METRICS_FLUSH_INTERVAL', 1):
+            self.flush()
+        return response
+
+    def observe(self, endpoint, status, seconds):
+        with self._lock:
+            key = f'{endpoint}|{status}'
+            self.requests[key] = self.requests.get(key, 0) + 1
+            if status >= 500:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+            histogram = self.latency.setdefault(endpoint, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram[i] += 1
+            histogram[-2] += seconds
+            histogram[-1] += 1
+
+    def snapshot(self):
+        pool = db.engine.pool
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'buckets': list(self.buckets),
+                'requests': dict(self.requests),
+                'errors': dict(self.errors),
+                'latency': {endpoint: list(values) for endpoint, values in self.latency.items()},
+                'checkouts': self.checkouts,
+                'pool': {
+                    'size': _call(pool, 'size'),
+                    'checked_out': _call(pool, 'checkedout'),
+                    'overflow': _call(pool, 'overflow'),
+                },
+                'caches': {name: cache.stats() for name, cache in all_caches().items()},
+                'ratelimit': limiter.stats(),
+                'invalidation': {'published': bus.published, 'received': bus.received},
+            }
+
+    def flush(self):
+        path = os.path.join(self.directory, f'{os.getpid()}.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(path + '.tmp', path)
+        self._last_flush = time.monotonic()
+
+    def collect(self):
+        if not self.directory:
+            return [self.snapshot()]
+        self.flush()
+        # Блокировка на весь сбор: два параллельных /metrics не должны свернуть один снимок дважды
+        with open(os.path.join(self.directory, '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            snapshots = []
+            for path in glob.glob(os.path.join(self.directory, '*.json')):
+                try:
+                    with open(path) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+            return _retire(self.directory, snapshots)
+
+    def view(self):
+        token = current_app.config.get('METRICS_TOKEN')
+        if token:
+            if request.headers.get('Authorization') != f'Bearer {token}':
+                abort(403)
+        elif not _internal(request.remote_addr):
+            # Без токена счётчики отдаются только изнутри сети
+            abort(403)
+        body = render(self.collect())
+        return current_app.response_class(body, mimetype='text/plain', headers={'Cache-Control': 'no-store'})
+
+
+def _call(pool, name):
+    method = getattr(pool, name, None)
+    return method() if method else None
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _internal(address):
+    try:
+        ip = ipaddress.ip_address(address or '')
+    except ValueError:
+        return False
+    return ip.is_loopback or ip.is_private
+
+
+def _merge(total, snapshot):
+    # Снимок завершившегося воркера добавляется к общему файлу: остаются только счётчики
+    for field in ('requests', 'errors', 'ratelimit'):
+        target = total.setdefault(field, {})
+        for key, value in snapshot[field].items():
+            if isinstance(value, dict):
+                counters = target.setdefault(key, {})
+                for name, count in value.items():
+                    counters[name] = counters.get(name, 0) + count
+            else:
+                target[key] = target.get(key, 0) + value
+    latency = total.setdefault('latency', {})
+    for endpoint, values in snapshot['latency'].items():
+        latency[endpoint] = [a + b for a, b in zip(latency.get(endpoint, [0] * len(values)), values)]
+    total['checkouts'] = total.get('checkouts', 0) + snapshot['checkouts']
+    caches = total.setdefault('caches', {})
+    for name, stats in snapshot['caches'].items():
+        cache = caches.setdefault(name, {'hits': 0, 'misses': 0, 'size': 0})
+        cache['hits'] += stats['hits']
+        cache['misses'] += stats['misses']
+    invalidation = total.setdefault('invalidation', {})
+    for field, count in snapshot.get('invalidation', {}).items():
+        invalidation[field] = invalidation.get(field, 0) + count
+    return total
+
+
+def _retire(directory, snapshots):
+    # Воркеры перезапускаются по max_requests: снимки мёртвых процессов сворачиваются в retired.json
+    # и удаляются, чтобы каталог не рос и /metrics не перечитывал их при каждом запросе
+    retired = next((s for s in snapshots if s.get('pid') is None), None)
+    dead = [s for s in snapshots if s.get('pid') is not None and not _alive(s['pid'])]
+    if not dead:
+        return snapshots
+    if retired is None:
+        retired = {'pid': None, 'buckets': dead[0]['buckets'],
+                   'pool': {'size': None, 'checked_out': None, 'overflow': None}}
+    for snapshot in dead:
+        _merge(retired, snapshot)
+    path = os.path.join(directory, RETIRED)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(retired, f)
+    os.replace(path + '.tmp', path)
+    for snapshot in dead:
+        try:
+            os.remove(os.path.join(directory, f'{snapshot["pid"]}.json'))
+        except FileNotFoundError:
+            pass
+    alive = [s for s in snapshots if s.get('pid') is not None and _alive(s['pid'])]
+    return alive + [retired]
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{str(value)}"' for name, value in labels.items()) + '}'
+
+
+def render(snapshots):
+    # Счётчики завершившихся воркеров остаются в сумме, показатели пула берутся только у живых
+    requests, errors, latency, caches, ratelimit = {}, {}, {}, {}, {}
+    invalidation = {'published': 0, 'received': 0}
+    checkouts = 0
+    buckets = snapshots[0]['buckets'] if snapshots else list(BUCKETS)
+    for snapshot in snapshots:
+        for key, count in snapshot['requests'].items():
+            requests[key] = requests.get(key, 0) + count
+        for endpoint, count in snapshot['errors'].items():
+            errors[endpoint] = errors.get(endpoint, 0) + count
+        for endpoint, values in snapshot['latency'].items():
+            total = latency.setdefault(endpoint, [0] * len(values))
+            latency[endpoint] = [a + b for a, b in zip(total, values)]
+        checkouts += snapshot['checkouts']
+        for name, stats in snapshot['caches'].items():
+            total = caches.setdefault(name, {'hits': 0, 'misses': 0, 'size': 0})
+            for field in total:
+                total[field] += stats[field]
+        for endpoint, counters in snapshot['ratelimit'].items():
+            for outcome, count in counters.items():
+                ratelimit[(endpoint, outcome)] = ratelimit.get((endpoint, outcome), 0) + count
+        for field, count in snapshot.get('invalidation', {}).items():
+            invalidation[field] += count
+
+    lines = [
+        '# HELP http_requests_total Requests by endpoint and status.',
+        '# TYPE http_requests_total counter',
+    ]
+    for key, count in sorted(requests.items()):
+        endpoint, status = key.rsplit('|', 1)
+        lines.append(f'http_requests_total{_labels(endpoint=endpoint, status=status)} {count}')
+
+    lines += ['# HELP http_request_errors_total Responses with status 5xx by endpoint.',
+              '# TYPE http_request_errors_total counter']
+    for endpoint, count in sorted(errors.items()):
+        lines.append(f'http_request_errors_total{_labels(endpoint=endpoint)} {count}')
+
+    lines += ['# HELP http_request_duration_seconds Request latency by endpoint.',
+              '# TYPE http_request_duration_seconds histogram']
+    for endpoint, values in sorted(latency.items()):
+        for bound, count in zip(buckets, values):
+            lines.append(f'http_request_duration_seconds_bucket{_labels(endpoint=endpoint, le=bound)} {count}')
+        lines.append(f'http_request_duration_seconds_bucket{_labels(endpoint=endpoint, le="+Inf")} {values[-1]}')
+        lines.append(f'http_request_duration_seconds_sum{_labels(endpoint=endpoint)} {values[-2]:.6f}')
+        lines.append(f'http_request_duration_seconds_count{_labels(endpoint=endpoint)} {values[-1]}')
+
+    lines += ['# HELP db_pool_checkouts_total Connections checked out of the pool.',
+              '# TYPE db_pool_checkouts_total counter',
+              f'db_pool_checkouts_total {checkouts}']
+    for field, help_text in (('size', 'Configured pool size.'),
+                             ('checked_out', 'Connections currently in use.'),
+                             ('overflow', 'Connections above pool_size (negative while the pool is not full).')):
+        lines += [f'# HELP db_pool_{field} {help_text}', f'# TYPE db_pool_{field} gauge']
+        for snapshot in snapshots:
+            value = snapshot['pool'][field]
+            if value is not None and snapshot['pid'] is not None and _alive(snapshot['pid']):
+                lines.append(f'db_pool_{field}{_labels(pid=snapshot["pid"])} {value}')
+
+    lines += ['# HELP cache_hits_total Cache hits.', '# TYPE cache_hits_total counter']
+    lines += [f'cache_hits_total{_labels(cache=name)} {stats["hits"]}' for name, stats in sorted(caches.items())]
+    lines += ['# HELP cache_misses_total Cache misses.', '# TYPE cache_misses_total counter']
+    lines += [f'cache_misses_total{_labels(cache=name)} {stats["misses"]}' for name, stats in sorted(caches.items())]
+    lines += ['# HELP cache_hit_ratio Share of lookups served from cache.', '# TYPE cache_hit_ratio gauge']
+    for name, stats in sorted(caches.items()):
+        total = stats['hits'] + stats['misses']
+        lines.append(f'cache_hit_ratio{_labels(cache=name)} {stats["hits"] / total if total else 0:.4f}')
+
+    lines += ['# HELP ratelimit_requests_total Rate limiter decisions by endpoint.',
+              '# TYPE ratelimit_requests_total counter']
+    for (endpoint, outcome), count in sorted(ratelimit.items()):
+        lines.append(f'ratelimit_requests_total{_labels(endpoint=endpoint, outcome=outcome)} {count}')
+
+    lines += ['# HELP cache_invalidations_total Invalidation bus messages by direction.',
+              '# TYPE cache_invalidations_total counter']
+    for field, count in sorted(invalidation.items()):
+        lines.append(f'cache_invalidations_total{_labels(direction=field)} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
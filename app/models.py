@@ -1,10 +1,46 @@
+import enum
 from datetime import datetime
 from app import db, login_manager
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import backref
 from flask import url_for
 
+
+class TaskStatus(enum.IntEnum):
+    NOT_STARTED = 0
+    IN_PROGRESS = 1
+    COMPLETED = 2
+
+
+class RequestStatus(enum.IntEnum):
+    # Общий для заявок и приглашений
+    PENDING = 0
+    ACCEPTED = 1
+    REJECTED = 2
+
+
+class StatusType(db.TypeDecorator):
+    # Статус хранится как SMALLINT, в Python это член IntEnum; строки ('pending') принимаются по имени
+    impl = db.SmallInteger
+    cache_ok = True
+
+    def __init__(self, enum_class):
+        super().__init__()
+        self.enum_class = enum_class
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if isinstance(value, str):
+            value = self.enum_class[value.upper()]
+        return int(value)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else self.enum_class(value)
+
+
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(64), index=True, unique=True)
@@ -13,6 +49,8 @@ class User(UserMixin, db.Model):
     about_me = db.Column(db.String(500))
     skills = db.Column(db.String(500))
     avatar = db.Column(db.String(120))
+    # Удаление идёт фоновой задачей; до её завершения учётная запись уже недоступна для входа
+    deleting = db.Column(db.Boolean, default=False, server_default=db.false(), nullable=False)
 
     created_projects = db.relationship('Project', backref='creator', lazy='dynamic')
     tasks = db.relationship('Task', backref='assignee', lazy='dynamic')
@@ -34,12 +72,35 @@ class Project(db.Model):
     deadline = db.Column(db.DateTime)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     creator_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    archived = db.Column(db.Boolean, default=False, server_default=db.false(), nullable=False)
+    archived_at = db.Column(db.DateTime)
+    # Проект, поставленный в очередь на удаление, скрыт сразу, не дожидаясь задачи
+    deleting = db.Column(db.Boolean, default=False, server_default=db.false(), nullable=False)
 
     tasks = db.relationship('Task', backref='project', lazy='dynamic')
     participants = db.relationship('ProjectParticipant', backref='project', lazy='dynamic')
     applications = db.relationship('Application', backref='project', lazy='dynamic')
     messages = db.relationship('Message', backref='project', lazy='dynamic')
 
+    # Списки читают только активные проекты: (archived, id) для постраничного вывода,
+    # (archived, deadline) для поиска кандидатов в архив
+    __table_args__ = (
+        db.Index('ix_project_archived_id', 'archived', 'id'),
+        db.Index('ix_project_archived_deadline', 'archived', 'deadline'),
+    )
+
+    @classmethod
+    def visible(cls):
+        return cls.query.filter(cls.deleting == False)
+
+    @classmethod
+    def active(cls):
+        return cls.visible().filter(cls.archived == False)
+
+    @classmethod
+    def visible_or_404(cls, project_id):
+        return cls.visible().filter(cls.id == project_id).first_or_404()
+
 
 class ProjectParticipant(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -49,38 +110,68 @@ class ProjectParticipant(db.Model):
 
     user = db.relationship('User', backref='project_participations')
 
+    __table_args__ = (db.UniqueConstraint('project_id', 'user_id', name='uq_project_participant_project_id_user_id'),)
+
 class Task(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
-    status = db.Column(db.String(20), default='not_started')  # not_started, in_progress, completed
+    status = db.Column(StatusType(TaskStatus), default=TaskStatus.NOT_STARTED,
+                       server_default='0', nullable=False)
     deadline = db.Column(db.DateTime)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    completed_at = db.Column(db.DateTime)
     project_id = db.Column(db.Integer, db.ForeignKey('project.id'))
     assignee_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     parent_task_id = db.Column(db.Integer, db.ForeignKey('task.id'))
-    completed = db.Column(db.Boolean, default=False)
     hidden = db.Column(db.Boolean, default=False)
+    overdue = db.Column(db.Boolean, default=False)
+    path = db.Column(db.String(255), index=True)  # материализованный путь: "1/5/9/"
 
     subtasks = db.relationship('SubTask', backref='task')
+    children = db.relationship('Task', backref=backref('parent', remote_side=[id]), lazy='dynamic')
+
+    # Индексы начинаются со статуса: фильтры и подсчёты по статусу читают узкий диапазон
+    __table_args__ = (
+        db.Index('ix_task_status_overdue_deadline', 'status', 'overdue', 'deadline'),
+        db.Index('ix_task_status_project_id', 'status', 'project_id'),
+    )
+
+    # Завершённость выводится из статуса, отдельной колонки нет
+    @hybrid_property
+    def completed(self):
+        return self.status == TaskStatus.COMPLETED
 
 class Application(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     project_id = db.Column(db.Integer, db.ForeignKey('project.id'))
-    status = db.Column(db.String(20), default='pending')  # pending, accepted, rejected
+    status = db.Column(StatusType(RequestStatus), default=RequestStatus.PENDING,
+                       server_default='0', nullable=False)
     applied_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.UniqueConstraint('project_id', 'user_id', name='uq_application_project_id_user_id'),
+        db.Index('ix_application_status_project_id', 'status', 'project_id'),
+    )
+
 class Invitation(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     project_id = db.Column(db.Integer, db.ForeignKey('project.id'))
-    status = db.Column(db.String(20), default='pending')
+    status = db.Column(StatusType(RequestStatus), default=RequestStatus.PENDING,
+                       server_default='0', nullable=False)
     invited_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     user = db.relationship('User', back_populates='invitations')
     project = db.relationship('Project', backref=backref('invitations', lazy='dynamic'))
 
+    __table_args__ = (
+        db.UniqueConstraint('project_id', 'user_id', name='uq_invitation_project_id_user_id'),
+        db.Index('ix_invitation_status_user_id', 'status', 'user_id'),
+        db.Index('ix_invitation_status_project_id', 'status', 'project_id'),
+    )
+
 class Message(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
@@ -90,17 +181,113 @@ class Message(db.Model):
 
     user = db.relationship('User', backref='messages')
 
+    __table_args__ = (
+        db.Index('ix_message_project_id_id', 'project_id', 'id'),
+        # Полнотекстовый индекс только для MySQL; в SQLite поиск идёт через FTS5 (app/search.py)
+        db.Index('ix_message_content_fulltext', 'content', mysql_prefix='FULLTEXT').ddl_if(dialect='mysql'),
+    )
+
+class MessageArchive(db.Model):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    content = db.Column(db.Text, nullable=False)
+    timestamp = db.Column(db.DateTime)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    project_id = db.Column(db.Integer, db.ForeignKey('project.id'))
+
+    __table_args__ = (
+        db.Index('ix_message_archive_project_id_id', 'project_id', 'id'),
+        db.Index('ix_message_archive_content_fulltext', 'content', mysql_prefix='FULLTEXT').ddl_if(dialect='mysql'),
+    )
+
 class SubTask(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(128), nullable=False)
     deadline = db.Column(db.Date, nullable=False)
     completed = db.Column(db.Boolean, default=False)
+    overdue = db.Column(db.Boolean, default=False)
 
     task_id = db.Column(db.Integer, db.ForeignKey('task.id'), nullable=False)
 
+    __table_args__ = (db.Index('ix_sub_task_completed_overdue_deadline', 'completed', 'overdue', 'deadline'),)
+
+class Recommendation(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # candidate: проект -> пользователь, project: пользователь -> проект
+    subject_id = db.Column(db.Integer, nullable=False)
+    target_id = db.Column(db.Integer, nullable=False)
+    score = db.Column(db.Float, nullable=False)
+    rank = db.Column(db.SmallInteger, nullable=False)
+
+    __table_args__ = (db.Index('ix_recommendation_kind_subject_id_rank', 'kind', 'subject_id', 'rank'),)
+
+class Activity(db.Model):
+    # Журнал только дописывается: код действия и короткий JSON с деталями
+    id = db.Column(db.Integer, primary_key=True)
+    project_id = db.Column(db.Integer, db.ForeignKey('project.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    action = db.Column(db.SmallInteger, nullable=False)
+    target_id = db.Column(db.Integer)
+    data = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (db.Index('ix_activity_project_id_id', 'project_id', 'id'),)
+
+class Reminder(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    task_id = db.Column(db.Integer, db.ForeignKey('task.id'), nullable=False)
+    subtask_id = db.Column(db.Integer, db.ForeignKey('sub_task.id'))
+    kind = db.Column(db.String(20), nullable=False)  # due_soon, overdue
+    due_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    seen = db.Column(db.Boolean, default=False)
+
+    task = db.relationship('Task')
+    subtask = db.relationship('SubTask')
+
+    __table_args__ = (db.Index('ix_reminder_user_id_seen', 'user_id', 'seen'),)
+
+class Job(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(64), nullable=False)
+    payload = db.Column(db.Text)
+    status = db.Column(db.String(20), default='queued')  # queued, running, done, failed
+    attempts = db.Column(db.Integer, default=0)
+    max_attempts = db.Column(db.Integer, default=3)
+    last_error = db.Column(db.Text)
+    run_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (db.Index('ix_job_status_run_at', 'status', 'run_at'),)
+
+class Backfill(db.Model):
+    # Контрольная точка фонового заполнения данных: с какого id продолжать после остановки
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(64), nullable=False, unique=True)
+    status = db.Column(db.String(20), default='pending')  # pending, running, paused, done, failed
+    last_id = db.Column(db.Integer, default=0)
+    rows = db.Column(db.Integer, default=0)
+    batches = db.Column(db.Integer, default=0)
+    last_error = db.Column(db.Text)
+    started_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+class UserStats(db.Model):
+    # Счётчики вклада для профиля: обновляются на лету, сверяются с задачами и проектами фоновой задачей
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    projects_created = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    tasks_completed = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    tasks_on_time = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    tasks_late = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 @login_manager.user_loader
 def load_user(id):
-    return User.query.get(int(id))
+    user = User.query.get(int(id))
+    return user if user is not None and not user.deleting else None
 
 @property
 def avatar_url(self):
@@ -1,10 +1,12 @@
 from flask import render_template, redirect, url_for, flash, request, current_app, abort, jsonify
-from flask_login import login_required, current_user
+from flask_login import login_required, current_user, logout_user
 import os
 import uuid
 
 from app import db
-from app.models import User
+from app.models import User, Project
+from app.contributions import profile_summary
+from app.jobs import enqueue
 from app.profile import bp
 from app.profile.forms import ProfileForm
 
@@ -27,15 +29,14 @@ def edit(user_id):
         user.username = form.username.data
         user.email = form.email.data
         user.about_me = form.about_me.data
-        user.skills = request.form.get('skills', '').strip()
         skills_str = request.form.get('skills', '').strip()
+        skills_changed = user.skills != skills_str
         user.skills = skills_str
 
+        old_avatar = None
         if 'delete_avatar' in request.form and request.form.get('delete_avatar') == 'on':
             if user.avatar:
-                avatar_path = os.path.join(current_app.root_path, 'static', user.avatar)
-                if os.path.exists(avatar_path):
-                    os.remove(avatar_path)
+                old_avatar = user.avatar
                 user.avatar = None
 
         file = request.files.get('avatar')
@@ -47,11 +48,8 @@ def edit(user_id):
                 os.makedirs(current_app.config['UPLOAD_FOLDER'], exist_ok=True)
                 file.save(file_path)
 
-
                 if user.avatar:
-                    old_path = os.path.join(current_app.root_path, 'static', user.avatar)
-                    if os.path.exists(old_path):
-                        os.remove(old_path)
+                    old_avatar = user.avatar
 
                 user.avatar = f"uploads/avatars/{unique_filename}"
             else:
@@ -59,6 +57,10 @@ def edit(user_id):
                 return redirect(url_for('profile.edit', user_id=user.id))
 
         db.session.commit()
+        if old_avatar:
+            enqueue('remove_avatar', avatar=old_avatar)
+        if skills_changed:
+            enqueue('refresh_user_recommendations', user_id=user.id)
         flash('Профиль успешно обновлен!', 'success')
         return redirect(url_for('profile.view', user_id=user.id))
     return render_template('profile/edit.html', user=user, form=form)
@@ -66,20 +68,20 @@ def edit(user_id):
 @bp.route('/<int:user_id>', endpoint='view')
 @login_required
 def view(user_id):
-
-    user = User.query.get_or_404(user_id)
-    form = ProfileForm()
-    form.username.data = user.username
-    form.email.data = user.email
-    form.about_me.data = user.about_me
-    form.skills.data = user.skills
-
-    return render_template('profile/view.html', title='Profile', user=user, form=form)
+    # Профиль со счётчиками вклада отдаётся из кэша, без загрузки модели и формы
+    user = profile_summary(user_id)
+    if user is None:
+        abort(404)
+    return render_template('profile/view.html', title='Profile', user=user)
 
 @bp.route('/delete', methods=['POST'])
 @login_required
 def delete():
-    db.session.delete(current_user)
-    db.session.commit()
+    user_id = current_user.id
+    # Вход и проекты закрываются сразу, строки удаляет фоновая задача; флаги фиксируются commit-ом в enqueue
+    current_user.deleting = True
+    Project.query.filter_by(creator_id=user_id).update({'deleting': True}, synchronize_session=False)
+    logout_user()
+    enqueue('delete_user', user_id=user_id)
     flash('Ваша учетная запись была удалена.', 'success')
     return redirect(url_for('auth.register'))
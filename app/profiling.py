@@ -0,0 +1,111 @@
+import os
+import re
+import time
+
+from flask import current_app, g, has_request_context, request
+from jinja2 import FileSystemBytecodeCache, Template
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+def _add(name, seconds):
+    if not has_request_context():
+        return
+    timings = g.setdefault('timings', {})
+    total, count = timings.get(name, (0.0, 0))
+    timings[name] = (total + seconds, count + 1)
+
+
+def _timed_block(label, func):
+    def block(context):
+        started = time.perf_counter()
+        try:
+            yield from func(context)
+        finally:
+            _add(label, time.perf_counter() - started)
+    return block
+
+
+class ProfiledTemplate(Template):
+    # Время шаблона и каждого его блока; блок включает вложенные в него блоки и include
+    @classmethod
+    def _from_namespace(cls, environment, namespace, globals):
+        template = super()._from_namespace(environment, namespace, globals)
+        template.blocks = {
+            name: _timed_block(f'block:{template.name}:{name}', func) for name, func in template.blocks.items()
+        }
+        return template
+
+    def render(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            _add(f'template:{self.name}', time.perf_counter() - started)
+
+
+def _query_started(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _query_finished(conn, cursor, statement, parameters, context, executemany):
+    _add('db', time.perf_counter() - conn.info['query_started'].pop())
+
+
+class Profiler:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        cache_dir = app.config.get('TEMPLATE_CACHE_DIR') or os.path.join(app.instance_path, 'jinja_cache')
+        os.makedirs(cache_dir, exist_ok=True)
+        # Скомпилированные шаблоны переживают перезапуск воркеров: холодный старт без повторной компиляции
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+
+        if app.config.get('PROFILING_ENABLED', False):
+            app.jinja_env.template_class = ProfiledTemplate
+            app.before_request(self.start)
+            app.after_request(self.finish)
+            # Замер запросов к БД вешается только при включённом профилировании: без него каждый запрос
+            # платил бы за два лишних обработчика
+            if not event.contains(Engine, 'before_cursor_execute', _query_started):
+                event.listen(Engine, 'before_cursor_execute', _query_started)
+                event.listen(Engine, 'after_cursor_execute', _query_finished)
+
+    def start(self):
+        g.request_started = time.perf_counter()
+
+    def finish(self, response):
+        timings = g.pop('timings', {})
+        started = g.pop('request_started', None)
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+
+        if _trusted():
+            metrics = [f'total;dur={elapsed * 1000:.1f}']
+            for name, (seconds, count) in sorted(timings.items(), key=lambda item: -item[1][0]):
+                desc = f'{count} queries' if name == 'db' else name.split(':', 1)[1]
+                metrics.append(f'{_token(name)};dur={seconds * 1000:.1f};desc="{desc}"')
+            response.headers['Server-Timing'] = ', '.join(metrics)
+
+        if elapsed * 1000 >= current_app.config.get('SLOW_REQUEST_MS', 500):
+            current_app.logger.warning('slow request %s %s %.0fms: %s', request.method, request.path, elapsed * 1000,
+                                       ', '.join(f'{name}={seconds * 1000:.0f}ms' for name, (seconds, count)
+                                                 in timings.items()))
+        return response
+
+
+def _trusted():
+    if current_app.debug:
+        return True
+    token = current_app.config.get('PROFILING_TOKEN')
+    return bool(token) and request.headers.get('X-Profiling-Token') == token
+
+
+def _token(name):
+    return re.sub(r'[^A-Za-z0-9_-]+', '_', name).strip('_')
+
+
+profiler = Profiler()
@@ -0,0 +1,79 @@
+import csv
+import enum
+import io
+import json
+
+from flask import current_app
+
+from app import db
+from app.models import Task, SubTask, Message, MessageArchive, User
+
+TASK_COLUMNS = [
+    'task_id', 'task_title', 'task_status', 'task_deadline', 'assignee',
+    'subtask_id', 'subtask_title', 'subtask_deadline', 'subtask_completed'
+]
+MESSAGE_COLUMNS = ['message_id', 'timestamp', 'username', 'content']
+CHUNK_SIZE = 8192
+
+
+def _stream(query):
+    # Серверный курсор: строки приходят порциями, а не одним списком в памяти
+    batch_size = current_app.config.get('EXPORT_BATCH_SIZE', 1000)
+    return query.execution_options(stream_results=True, yield_per=batch_size)
+
+
+def _format(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if isinstance(value, enum.Enum):
+        # В выгрузке статус остаётся строкой (completed, in_progress, ...), как и до перевода на коды
+        return value.name.lower()
+    return value
+
+
+def task_rows(project_id):
+    query = db.session.query(
+        Task.id, Task.title, Task.status, Task.deadline, User.username,
+        SubTask.id, SubTask.title, SubTask.deadline, SubTask.completed
+    ).outerjoin(User, User.id == Task.assignee_id) \
+        .outerjoin(SubTask, SubTask.task_id == Task.id) \
+        .filter(Task.project_id == project_id) \
+        .order_by(Task.id, SubTask.id)
+    for row in _stream(query):
+        yield [_format(value) for value in row]
+
+
+def message_rows(project_id):
+    # Архив содержит более старые сообщения, поэтому читается первым
+    for model in (MessageArchive, Message):
+        query = db.session.query(
+            model.id, model.timestamp, User.username, model.content
+        ).outerjoin(User, User.id == model.user_id) \
+            .filter(model.project_id == project_id) \
+            .order_by(model.id)
+        for row in _stream(query):
+            yield [_format(value) for value in row]
+
+
+def to_csv(columns, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+    yield buffer.getvalue()
+
+
+def to_ndjson(columns, rows):
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n')
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+    yield buffer.getvalue()
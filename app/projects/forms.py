@@ -1,6 +1,7 @@
 from flask_wtf import FlaskForm
 from wtforms import StringField, TextAreaField, DateField, SubmitField
 from wtforms.validators import DataRequired
+from flask_wtf.file import FileField, FileAllowed, FileRequired
 
 class ProjectForm(FlaskForm):
     title = StringField(
@@ -59,3 +60,15 @@ class InvitationForm(FlaskForm):
         'Пригласить',
         render_kw={"class": "btn btn-primary"}
     )
+
+
+class ImportForm(FlaskForm):
+    file = FileField(
+        'Файл CSV или JSON',
+        validators=[FileRequired(), FileAllowed(['csv', 'json'], 'Только CSV или JSON')],
+        render_kw={"class": "form-control"}
+    )
+    submit = SubmitField(
+        'Импортировать',
+        render_kw={"class": "btn btn-primary"}
+    )
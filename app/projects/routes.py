@@ -1,13 +1,50 @@
-from flask import render_template, redirect, url_for, flash, request, abort, jsonify
+from flask import render_template, redirect, url_for, flash, request, abort, jsonify, Response, stream_with_context, \
+    current_app
 from flask_login import login_required, current_user
 from app import db
 from app.projects import bp
-from app.projects.forms import ProjectForm, TaskForm, InvitationForm
-from app.models import User, Project, Task, Application, Invitation, ProjectParticipant, Message, SubTask
+from app.projects.forms import ProjectForm, TaskForm, InvitationForm, ImportForm
+from app.models import User, Project, Task, Application, Invitation, ProjectParticipant, Message, SubTask, Reminder, \
+    TaskStatus, RequestStatus
+from app.jobs import enqueue
+from app.projects import export
+from app.importer import load, import_projects, ImportValidationError
+from app.retention import message_history, messages_after, set_archived
+from app.deadlines import is_overdue
+from app.task_tree import load_project_tree, can_be_parent, set_path, subtree_ids
+from app.recommendations import candidates_for
+from app.membership import add_participant, submit_application, send_invitation
+from app.activity import record, activity_feed
+from app.contributions import bump, set_task_status
+from app import badges
+from app.search import search_messages
 from datetime import datetime
 from sqlalchemy.orm import subqueryload
 
 
+def _task_or_404(task_id):
+    task = Task.query.get_or_404(task_id)
+    if task.project.deleting:
+        abort(404)
+    return task
+
+
+def _chat_project(project_id):
+    # Чат читают и пишут только создатель и участники
+    project = Project.visible_or_404(project_id)
+    if project.creator_id != current_user.id and not ProjectParticipant.query.filter_by(
+            project_id=project.id, user_id=current_user.id).first():
+        abort(403)
+    return project
+
+
+def _subtask_or_404(subtask_id):
+    subtask = SubTask.query.get_or_404(subtask_id)
+    if subtask.task.project.deleting:
+        abort(404)
+    return subtask
+
+
 @bp.route('/create', methods=['GET', 'POST'])
 @login_required
 def create():
@@ -21,18 +58,41 @@ def create():
             creator_id=current_user.id
         )
         db.session.add(project)
-        db.session.commit()
+        db.session.flush()
         participant = ProjectParticipant(user_id=current_user.id, project_id=project.id)
         db.session.add(participant)
+        bump(current_user.id, projects_created=1)
         db.session.commit()
+        enqueue('refresh_project_recommendations', project_id=project.id)
         flash('Проект создан!', 'success')
         return redirect(url_for('projects.manage', project_id=project.id))
     return render_template('projects/create.html', title='Create Project', form=form)
 
+@bp.route('/import', methods=['GET', 'POST'])
+@login_required
+def import_data():
+    form = ImportForm()
+    errors = []
+    if form.validate_on_submit():
+        upload = form.file.data
+        try:
+            projects = load(upload.filename, upload.read().decode('utf-8-sig'))
+            stats = import_projects(projects, current_user.id)
+            enqueue('refresh_recommendations')
+        except ImportValidationError as e:
+            errors = e.errors
+        except ValueError:
+            errors = ['Не удалось разобрать файл']
+        else:
+            flash(f"Импортировано проектов: {stats['projects']}, задач: {stats['tasks']}, "
+                  f"подзадач: {stats['subtasks']} ({stats['rows_per_sec']:.0f} строк/с)", 'success')
+            return redirect(url_for('projects.my_projects'))
+    return render_template('projects/import.html', title='Import', form=form, errors=errors)
+
 @bp.route('/project/<int:project_id>/update_deadline', methods=['POST'])
 @login_required
 def update_project_deadline(project_id):
-    project = Project.query.get_or_404(project_id)
+    project = Project.visible_or_404(project_id)
 
     if project.creator_id != current_user.id:
         flash('Вы не авторизованы изменять дедлайн проекта', 'danger')
@@ -56,27 +116,48 @@ def update_project_deadline(project_id):
 def my_projects():
     participant_projects = db.session.query(Project).distinct() \
         .join(Task, Task.project_id == Project.id) \
-        .filter(Task.assignee_id == current_user.id) \
+        .filter(Task.assignee_id == current_user.id, Project.archived == False, Project.deleting == False) \
         .all()
 
-    created_projects = current_user.created_projects.all()
+    created_projects = current_user.created_projects.filter_by(archived=False, deleting=False).all()
     projects_set = set(participant_projects) | set(created_projects)
     current_projects = list(projects_set)
 
+    # Архив показывается отдельной вкладкой: только созданные и те, где есть задачи пользователя
+    archived_projects = Project.visible().filter(
+        Project.archived == True,
+        db.or_(
+            Project.creator_id == current_user.id,
+            Project.id.in_(db.session.query(Task.project_id).filter(Task.assignee_id == current_user.id))
+        )
+    ).order_by(Project.archived_at.desc()).all()
+
     applications = current_user.applications.all()
 
-    invitations = current_user.invitations.filter_by(status='pending').all()
+    invitations = current_user.invitations.filter_by(status=RequestStatus.PENDING).all()
+
+    reminders = Reminder.query.filter_by(user_id=current_user.id, seen=False) \
+        .order_by(Reminder.due_at).all()
 
     return render_template('projects/my_projects.html',
                            current_projects=current_projects,
                            created_projects=created_projects,
+                           archived_projects=archived_projects,
                            applications=applications,
-                           invitations=invitations)
+                           invitations=invitations,
+                           reminders=reminders)
+
+@bp.route('/reminders/dismiss', methods=['POST'])
+@login_required
+def dismiss_reminders():
+    Reminder.query.filter_by(user_id=current_user.id, seen=False).update({'seen': True})
+    db.session.commit()
+    return redirect(url_for('projects.my_projects'))
 
 @bp.route('/<int:project_id>/manage', methods=['GET', 'POST'])
 @login_required
 def manage(project_id):
-    project = Project.query.get_or_404(project_id)
+    project = Project.visible_or_404(project_id)
 
     if project.creator_id != current_user.id:
         flash('Вы не авторизованы для управления проектом', 'danger')
@@ -85,49 +166,90 @@ def manage(project_id):
     form = TaskForm()
     if form.validate_on_submit():
         assignee_id = request.form.get('assignee')
+        parent_task_id = request.form.get('parent_task_id', type=int)
+        parent = Task.query.get(parent_task_id) if parent_task_id else None
+        deadline = form.deadline.data or project.deadline
         task = Task(
             title=form.title.data,
             description=form.description.data,
-            deadline=form.deadline.data or project.deadline,
+            deadline=deadline,
             project_id=project.id,
-            assignee_id=int(assignee_id) if assignee_id else None
+            assignee_id=int(assignee_id) if assignee_id else None,
+            overdue=is_overdue(deadline)
         )
+        if not can_be_parent(task, parent):
+            flash('Родительская задача должна принадлежать этому проекту', 'danger')
+            return redirect(url_for('projects.manage', project_id=project.id))
+        task.parent = parent
         db.session.add(task)
+        db.session.flush()
+        set_path(task)
+        record(project.id, 'task_created', task.id, title=task.title)
         db.session.commit()
         flash('Задача успешно добавлена', 'success')
         return redirect(url_for('projects.manage', project_id=project.id))
 
-    users = User.query.filter(User.id != project.creator_id).all()
+    users = User.query.filter(User.id != project.creator_id, User.deleting == False).all()
     participant_ids = [p.user_id for p in project.participants]
     notusers = User.query.filter(
         User.id != project.creator_id,
+        User.deleting == False,
         ~User.id.in_(participant_ids)
     ).all()
     unassigned_tasks_count = Task.query.filter_by(project_id=project.id, assignee_id=None).count()
-    return render_template('projects/manage.html', project=project, form=form, users=users, notusers=notusers, unassigned_tasks_count=unassigned_tasks_count)
+    status_counts = dict(db.session.query(Task.status, db.func.count(Task.id))
+                         .filter(Task.project_id == project.id).group_by(Task.status))
+    task_tree = load_project_tree(project.id)
+    notusers_by_id = {user.id: user for user in notusers}
+    suggested_users = [notusers_by_id[user_id] for user_id in candidates_for(project.id) if user_id in notusers_by_id]
+    return render_template('projects/manage.html', project=project, form=form, users=users, notusers=notusers, unassigned_tasks_count=unassigned_tasks_count, task_tree=task_tree, suggested_users=suggested_users, status_counts=status_counts)
+
+@bp.route('/<int:project_id>/export/<kind>.<fmt>')
+@login_required
+def export_project(project_id, kind, fmt):
+    project = Project.visible_or_404(project_id)
+
+    if project.creator_id != current_user.id:
+        abort(403)
+
+    if kind == 'tasks':
+        columns, rows = export.TASK_COLUMNS, export.task_rows(project.id)
+    elif kind == 'messages':
+        columns, rows = export.MESSAGE_COLUMNS, export.message_rows(project.id)
+    else:
+        abort(404)
+
+    if fmt == 'csv':
+        body, mimetype = export.to_csv(columns, rows), 'text/csv'
+    elif fmt == 'ndjson':
+        body, mimetype = export.to_ndjson(columns, rows), 'application/x-ndjson'
+    else:
+        abort(404)
+
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename=project_{project.id}_{kind}.{fmt}'}
+    )
 
 @bp.route('/<int:project_id>/apply')
 @login_required
 def apply(project_id):
-    project = Project.query.get_or_404(project_id)
+    project = Project.visible_or_404(project_id)
     if project.creator_id == current_user.id:
         return redirect(url_for('projects.details', project_id=project.id))
+    if project.archived:
+        flash('Проект в архиве и не принимает заявки', 'info')
+        return redirect(url_for('projects.details', project_id=project.id))
 
-    existing_application = Application.query.filter_by(
-        user_id=current_user.id,
-        project_id=project.id
-    ).order_by(Application.applied_at.desc()).first()
-
-    if existing_application and existing_application.status != 'rejected':
-        flash('Вы уже подали заявку на этот проект. Она отображена в Мои проекты/Заявки', 'info')
-    else:
-        application = Application(
-            user_id=current_user.id,
-            project_id=project.id
-        )
-        db.session.add(application)
-        db.session.commit()
+    submitted = submit_application(project.id, current_user.id)
+    if submitted:
+        badges.changed(project.creator_id)
+    db.session.commit()
+    if submitted:
         flash('Заявка отправлена.', 'success')
+    else:
+        flash('Вы уже подали заявку на этот проект. Она отображена в Мои проекты/Заявки', 'info')
 
     return redirect(url_for('projects.details', project_id=project.id))
 
@@ -148,23 +270,38 @@ def delete_application(application_id):
 @bp.route('/delete/<int:project_id>', methods=['POST'])
 @login_required
 def delete(project_id):
-    project = Project.query.get_or_404(project_id)
+    project = Project.visible_or_404(project_id)
 
     if project.creator_id != current_user.id:
         flash('Вы не можете удалить этот проект', 'danger')
         return redirect(url_for('projects.my_projects'))
 
-    db.session.delete(project)
-    db.session.commit()
-    flash('Проект успешно удален', 'success')
+    # Флаг и задача фиксируются одним commit внутри enqueue: проект не останется скрытым без задачи
+    project.deleting = True
+    enqueue('delete_project', project_id=project.id)
+    flash('Проект поставлен в очередь на удаление', 'success')
     return redirect(url_for('projects.my_projects'))
 
+@bp.route('/<int:project_id>/archive', methods=['POST'])
+@login_required
+def archive(project_id):
+    project = Project.visible_or_404(project_id)
+    if project.creator_id != current_user.id:
+        flash('Вы не авторизованы для управления проектом', 'danger')
+        return redirect(url_for('main.index'))
+
+    set_archived(project, not project.archived)
+    db.session.commit()
+    flash('Проект перенесён в архив' if project.archived else 'Проект возвращён из архива', 'success')
+    return redirect(url_for('projects.manage', project_id=project.id))
+
 @bp.route('/application/<int:application_id>/cancel', methods=['POST'])
 @login_required
 def cancel_application(application_id):
     application = Application.query.get_or_404(application_id)
 
     db.session.delete(application)
+    badges.changed(application.project.creator_id)
     db.session.commit()
     return redirect(url_for('projects.my_projects'))
 
@@ -173,14 +310,17 @@ def cancel_application(application_id):
 def accept_application(application_id):
     application = Application.query.get_or_404(application_id)
     project = application.project
+    if project.deleting:
+        abort(404)
 
     if project.creator_id != current_user.id:
         flash('Вы не авторизованы принимать заявки', 'danger')
         return redirect(url_for('projects.manage', project_id=project.id))
 
-    application.status = 'accepted'
-    participant = ProjectParticipant(user_id=application.user_id, project_id=project.id)
-    db.session.add(participant)
+    application.status = RequestStatus.ACCEPTED
+    add_participant(project.id, application.user_id)
+    record(project.id, 'application_accepted', application.user_id)
+    badges.changed(project.creator_id)
     db.session.commit()
     flash(f'Заявка от {application.applicant.username} принята', 'success')
     return redirect(url_for('projects.manage', project_id=project.id))
@@ -195,7 +335,9 @@ def reject_application(application_id):
         flash('Вы не авторизованы отклонять заявки', 'danger')
         return redirect(url_for('projects.manage', project_id=project.id))
 
-    application.status = 'rejected'
+    application.status = RequestStatus.REJECTED
+    record(project.id, 'application_rejected', application.user_id)
+    badges.changed(project.creator_id)
     db.session.commit()
     flash(f'Заявка от {application.applicant.username} отклонена', 'success')
     return redirect(url_for('projects.manage', project_id=project.id))
@@ -203,37 +345,38 @@ def reject_application(application_id):
 @bp.route('/invite/<int:project_id>', methods=['POST'])
 @login_required
 def invite(project_id):
-    project = Project.query.get_or_404(project_id)
+    project = Project.visible_or_404(project_id)
 
     if project.creator_id != current_user.id:
         flash('Вы не авторизованы приглашать участников', 'danger')
         return redirect(url_for('projects.manage', project_id=project.id))
 
     username = request.form.get('username')
-    user = User.query.filter_by(username=username).first()
+    user = User.query.filter_by(username=username, deleting=False).first()
     if not user:
         flash('Пользователь не найден', 'danger')
         return redirect(url_for('projects.manage', project_id=project.id))
 
-    is_participant = ProjectParticipant.query.filter_by(project_id=project.id, user_id=user.id).first()
-    is_invited = Invitation.query.filter_by(project_id=project.id, user_id=user.id, status='pending').first()
+    is_participant = db.session.query(
+        ProjectParticipant.query.filter_by(project_id=project.id, user_id=user.id).exists()
+    ).scalar()
 
     if is_participant:
         flash('Пользователь уже является участником проекта', 'warning')
-    elif is_invited:
-        flash('Пользователь уже приглашён', 'warning')
-    else:
-        invitation = Invitation(user_id=user.id, project_id=project.id, status='pending')
-        db.session.add(invitation)
+    elif send_invitation(project.id, user.id):
+        record(project.id, 'invitation_sent', user.id)
+        badges.changed(user.id)
         db.session.commit()
         flash(f'Приглашение отправлено пользователю {user.username}', 'success')
+    else:
+        flash('Пользователь уже приглашён', 'warning')
 
     return redirect(url_for('projects.manage', project_id=project.id))
 
 @bp.route('/participant/<int:project_id>/remove/<int:user_id>', methods=['POST'])
 @login_required
 def remove_participant(project_id, user_id):
-    project = Project.query.get_or_404(project_id)
+    project = Project.visible_or_404(project_id)
 
     if project.creator_id != current_user.id:
         flash('Вы не авторизованы исключать участников', 'danger')
@@ -243,6 +386,7 @@ def remove_participant(project_id, user_id):
     if participant:
         Task.query.filter_by(project_id=project.id, assignee_id=user_id).update({'assignee_id': None})
         db.session.delete(participant)
+        record(project.id, 'participant_removed', user_id)
         db.session.commit()
         flash('Участник исключён из проекта и снят с назначенных задач', 'success')
     else:
@@ -254,14 +398,16 @@ def remove_participant(project_id, user_id):
 @login_required
 def accept_invitation(invitation_id):
     invitation = Invitation.query.get_or_404(invitation_id)
+    if invitation.project.deleting:
+        abort(404)
 
     if invitation.user_id != current_user.id:
         flash('Вы не можете принимать приглашения другого пользователя', 'danger')
         return redirect(url_for('projects.my_projects'))
 
-    invitation.status = 'accepted'
-    participant = ProjectParticipant(user_id=current_user.id, project_id=invitation.project_id)
-    db.session.add(participant)
+    invitation.status = RequestStatus.ACCEPTED
+    add_participant(invitation.project_id, current_user.id)
+    record(invitation.project_id, 'invitation_accepted', current_user.id)
     db.session.commit()
     flash(f'Вы приняли приглашение в проект "{invitation.project.title}"', 'success')
     return redirect(url_for('projects.my_projects'))
@@ -275,7 +421,8 @@ def reject_invitation(invitation_id):
         flash('Вы не можете отклонять приглашения другого пользователя', 'danger')
         return redirect(url_for('projects.my_projects'))
 
-    invitation.status = 'rejected'
+    invitation.status = RequestStatus.REJECTED
+    record(invitation.project_id, 'invitation_rejected', current_user.id)
     db.session.commit()
     flash(f'Вы отклонили приглашение в проект "{invitation.project.title}"', 'success')
     return redirect(url_for('projects.my_projects'))
@@ -283,7 +430,7 @@ def reject_invitation(invitation_id):
 @bp.route('/task/<int:task_id>/assign', methods=['POST'])
 @login_required
 def assign_task(task_id):
-    task = Task.query.get_or_404(task_id)
+    task = _task_or_404(task_id)
     project = task.project
 
     if project.creator_id != current_user.id:
@@ -292,6 +439,7 @@ def assign_task(task_id):
 
     assignee_id = request.form.get('assignee_id')
     task.assignee_id = int(assignee_id) if assignee_id else None
+    record(project.id, 'task_assigned', task.id, assignee_id=task.assignee_id)
     db.session.commit()
     flash('Ответственный обновлён.', 'success')
     return redirect(url_for('projects.manage', project_id=project.id))
@@ -314,13 +462,26 @@ def revoke_invitation(invitation_id):
 @bp.route('/<int:project_id>')
 @login_required
 def details(project_id):
-    project = Project.query.get_or_404(project_id)
+    project = Project.visible_or_404(project_id)
     return render_template('projects/details.html', project=project)
 
+@bp.route('/<int:project_id>/activity')
+@login_required
+def activity(project_id):
+    project = Project.visible_or_404(project_id)
+    is_member = project.creator_id == current_user.id or ProjectParticipant.query.filter_by(
+        project_id=project.id, user_id=current_user.id).first()
+    if not is_member:
+        abort(403)
+
+    before = request.args.get('before', type=int)
+    entries, has_more = activity_feed(project.id, before, current_app.config.get('ACTIVITY_PAGE_SIZE', 50))
+    return render_template('projects/activity.html', project=project, entries=entries, has_more=has_more)
+
 @bp.route('/tasks/<int:task_id>/edit', methods=['POST'])
 @login_required
 def edit_task(task_id):
-    task = Task.query.get_or_404(task_id)
+    task = _task_or_404(task_id)
 
     deadline_str = request.form.get('deadline')
     assignee_id = request.form.get('assignee_id')
@@ -338,7 +499,9 @@ def edit_task(task_id):
 
     if deadline_str:
         try:
-            task.deadline = datetime.strptime(deadline_str, '%Y-%m-%d').date()
+            new_deadline = datetime.strptime(deadline_str, '%Y-%m-%d')
+            task.deadline = new_deadline.date()
+            task.overdue = is_overdue(new_deadline)
         except ValueError:
             flash('Неверный формат даты дедлайна', 'error')
 
@@ -352,8 +515,23 @@ def edit_task(task_id):
     task.assignee_id = new_assignee.id if new_assignee else None
 
     if old_assignee_id != task.assignee_id:
+        Reminder.query.filter_by(task_id=task.id).delete()
         SubTask.query.filter_by(task_id=task.id).delete()
 
+    if 'parent_task_id' in request.form:
+        parent_task_id = request.form.get('parent_task_id', type=int)
+        parent = Task.query.get(parent_task_id) if parent_task_id else None
+        if parent_task_id != task.parent_task_id:
+            if can_be_parent(task, parent):
+                task.parent = parent
+                db.session.flush()
+                set_path(task)
+            else:
+                flash('Нельзя сделать задачу подзадачей самой себя или задачи другого проекта', 'error')
+
+    record(task.project_id, 'task_edited', task.id, title=task.title)
+    if old_assignee_id != task.assignee_id:
+        record(task.project_id, 'task_assigned', task.id, assignee_id=task.assignee_id)
     db.session.commit()
     flash('Задача успешно обновлена', 'success')
     return redirect(url_for('projects.manage', project_id=task.project_id))
@@ -361,14 +539,19 @@ def edit_task(task_id):
 @bp.route('/task/<int:task_id>/delete', methods=['POST'])
 @login_required
 def delete_task(task_id):
-    task = Task.query.get_or_404(task_id)
+    task = _task_or_404(task_id)
     project = task.project
 
     if project.creator_id != current_user.id:
         flash('Вы не можете удалять задачи этого проекта', 'danger')
         return redirect(url_for('projects.manage', project_id=project.id))
-    SubTask.query.filter_by(task_id=task.id).delete()
-    db.session.delete(task)
+    # Вместе с задачей удаляется всё её поддерево
+    task_ids = subtree_ids(task)
+    Reminder.query.filter(Reminder.task_id.in_(task_ids)).delete(synchronize_session=False)
+    SubTask.query.filter(SubTask.task_id.in_(task_ids)).delete(synchronize_session=False)
+    Task.query.filter(Task.id.in_(task_ids)).update({'parent_task_id': None}, synchronize_session=False)
+    Task.query.filter(Task.id.in_(task_ids)).delete(synchronize_session=False)
+    record(project.id, 'task_deleted', task.id, title=task.title, subtree=len(task_ids))
     db.session.commit()
     flash('Задача удалена', 'success')
     return redirect(url_for('projects.manage', project_id=project.id))
@@ -376,7 +559,7 @@ def delete_task(task_id):
 @bp.route('/<int:project_id>/execute', methods=['GET', 'POST'])
 @login_required
 def execute(project_id):
-    project = Project.query.get_or_404(project_id)
+    project = Project.visible_or_404(project_id)
 
     tasks = Task.query.filter(
         Task.project_id == project.id,
@@ -392,30 +575,32 @@ def execute(project_id):
         'projects/execute.html',
         project=project,
         tasks=tasks,
-        hidden_exists=hidden_exists,
-        today=datetime.utcnow()
+        hidden_exists=hidden_exists
     )
 
 
 @bp.route('/task/<int:task_id>/complete', methods=['POST'])
 @login_required
 def update_task_status(task_id):
-    task = Task.query.get_or_404(task_id)
+    task = _task_or_404(task_id)
 
     if not task.project in [p.project for p in current_user.project_participations]:
         flash('Нет доступа к задаче', 'danger')
         return redirect(url_for('projects.execute', project_id=task.project_id))
 
+    completed = 'completed' in request.form
+    if completed and any(not sub.completed for sub in task.subtasks):
+        flash('Невозможно завершить: есть незавершённые подзадачи', 'warning')
+        return redirect(url_for('projects.execute', project_id=task.project_id))
 
-    task.completed = 'completed' in request.form
-    task.status = 'completed' if task.completed else 'not_started'  # или 'in_progress', как решишь
-
-
-    if task.completed and task.subtasks:
-        if any(not sub.completed for sub in task.subtasks):
-            flash('Невозможно завершить: есть незавершённые подзадачи', 'warning')
-            return redirect(url_for('projects.execute', project_id=task.project_id))
+    if completed:
+        set_task_status(task, TaskStatus.COMPLETED)
+    elif task.completed:
+        # Снятая отметка возвращает задачу в работу, если часть подзадач уже выполнена
+        set_task_status(task, TaskStatus.IN_PROGRESS if any(sub.completed for sub in task.subtasks)
+                        else TaskStatus.NOT_STARTED)
 
+    record(task.project_id, 'task_status', task.id, status=task.status.name.lower())
     db.session.commit()
     flash('Статус задачи обновлен', 'success')
     return redirect(url_for('projects.execute', project_id=task.project_id))
@@ -424,7 +609,7 @@ def update_task_status(task_id):
 @bp.route('/task/<int:task_id>/assign_self', methods=['POST'])
 @login_required
 def assign_to_self(task_id):
-    task = Task.query.get_or_404(task_id)
+    task = _task_or_404(task_id)
     if task.assignee_id is not None:
         flash('Задача уже назначена', 'warning')
     else:
@@ -436,7 +621,7 @@ def assign_to_self(task_id):
 @bp.route('/task/<int:task_id>/add_subtask', methods=['POST'])
 @login_required
 def add_subtask(task_id):
-    task = Task.query.get_or_404(task_id)
+    task = _task_or_404(task_id)
     title = request.form.get('title')
     deadline_str = request.form.get('deadline')
 
@@ -450,8 +635,10 @@ def add_subtask(task_id):
         flash('Дедлайн подзадачи не может быть позже дедлайна основной задачи', 'danger')
         return redirect(url_for('projects.execute', project_id=task.project_id))
 
-    subtask = SubTask(title=title, deadline=subtask_deadline, task=task)
+    subtask = SubTask(title=title, deadline=subtask_deadline, task=task,
+                      overdue=subtask_deadline < datetime.utcnow().date())
     db.session.add(subtask)
+    record(task.project_id, 'subtask_created', task.id, title=title)
     db.session.commit()
     flash('Подзадача добавлена', 'success')
     return redirect(url_for('projects.execute', project_id=task.project_id))
@@ -459,7 +646,7 @@ def add_subtask(task_id):
 @bp.route('/projects/<int:project_id>', methods=['GET'])
 def view(project_id):
     tab = request.args.get('tab', 'tasks')
-    project = Project.query.get_or_404(project_id)
+    project = Project.visible_or_404(project_id)
     tasks = Task.query.options(subqueryload(Task.subtasks))\
         .filter_by(project_id=project_id, parent_task_id=None).all()
     return render_template('projects/execute.html', project=project, tasks=tasks, active_tab=tab)
@@ -467,24 +654,21 @@ def view(project_id):
 @bp.route('/subtask/<int:subtask_id>/status', methods=['POST'])
 @login_required
 def update_subtask_status(subtask_id):
-    subtask = SubTask.query.get_or_404(subtask_id)
+    subtask = _subtask_or_404(subtask_id)
     parent_task = subtask.task
     project_id = parent_task.project_id
 
     subtask.completed = 'completed' in request.form
-    db.session.commit()
+    record(project_id, 'subtask_status', parent_task.id, subtask_id=subtask.id, completed=subtask.completed)
 
     subtasks = SubTask.query.filter_by(task_id=parent_task.id).all()
 
     if all(sub.completed for sub in subtasks):
-        parent_task.status = 'completed'
-        parent_task.completed = True
+        set_task_status(parent_task, TaskStatus.COMPLETED)
     elif any(sub.completed for sub in subtasks):
-        parent_task.status = 'in_progress'
-        parent_task.completed = False
+        set_task_status(parent_task, TaskStatus.IN_PROGRESS)
     else:
-        parent_task.status = 'not_started'
-        parent_task.completed = False
+        set_task_status(parent_task, TaskStatus.NOT_STARTED)
 
     db.session.commit()
     return redirect(url_for('projects.execute', project_id=project_id))
@@ -492,8 +676,9 @@ def update_subtask_status(subtask_id):
 @bp.route('/subtask/<int:subtask_id>/delete', methods=['POST'])
 @login_required
 def delete_subtask(subtask_id):
-    subtask = SubTask.query.get_or_404(subtask_id)
+    subtask = _subtask_or_404(subtask_id)
     project_id = subtask.task.project_id
+    Reminder.query.filter_by(subtask_id=subtask.id).delete()
     db.session.delete(subtask)
     db.session.commit()
     return redirect(url_for('projects.execute', project_id=project_id))
@@ -501,7 +686,7 @@ def delete_subtask(subtask_id):
 @bp.route('/task/<int:task_id>/hide', methods=['POST'])
 @login_required
 def hide_task(task_id):
-    task = Task.query.get_or_404(task_id)
+    task = _task_or_404(task_id)
 
     if not task.project in [p.project for p in current_user.project_participations]:
         flash('Нет доступа к задаче', 'danger')
@@ -515,7 +700,7 @@ def hide_task(task_id):
 @bp.route('/<int:project_id>/unhide_all_tasks', methods=['POST'])
 @login_required
 def unhide_all_tasks(project_id):
-    project = Project.query.get_or_404(project_id)
+    project = Project.visible_or_404(project_id)
     hidden_tasks = Task.query.filter_by(project_id=project.id, hidden=True).all()
     for task in hidden_tasks:
         task.hidden = False
@@ -526,18 +711,44 @@ def unhide_all_tasks(project_id):
 @bp.route('/projects/<int:project_id>/messages', methods=['GET'])
 @login_required
 def get_messages(project_id):
-    messages = Message.query.filter_by(project_id=project_id).order_by(Message.timestamp.asc()).all()
+    _chat_project(project_id)
+    before = request.args.get('before', type=int)
+    after = request.args.get('after', type=int)
+    page_size = current_app.config['CHAT_PAGE_SIZE']
+    limit = min(request.args.get('limit', type=int) or page_size, page_size)
+
+    if after is not None:
+        # Опрос: сообщения новее after, has_more — новых больше страницы
+        messages = messages_after(project_id, after, limit + 1)
+        has_more = len(messages) > limit
+        messages = messages[:limit]
+    else:
+        # Без before — последняя страница, а не вся переписка
+        messages, has_more = message_history(project_id, before, limit)
+
     messages_data = [{
+        'id': msg.id,
         'user_id': msg.user_id,
-        'username': msg.user.username,
+        'username': msg.username,
         'content': msg.content,
         'timestamp': msg.timestamp.strftime('%H:%M')
     } for msg in messages]
-    return jsonify(messages=messages_data)
+    last_id = messages_data[-1]['id'] if messages_data else (after or 0)
+    return jsonify(messages=messages_data, has_more=has_more, last_id=last_id)
+
+@bp.route('/projects/<int:project_id>/messages/search', methods=['GET'])
+@login_required
+def search_project_messages(project_id):
+    project = _chat_project(project_id)
+    query = request.args.get('q', '').strip()
+    page = max(request.args.get('page', 1, type=int), 1)
+    hits, has_more = search_messages(project.id, query, page)
+    return jsonify(hits=hits, has_more=has_more, page=page)
 
 @bp.route('/projects/<int:project_id>/send_message', methods=['POST'])
 @login_required
 def send_message(project_id):
+    _chat_project(project_id)
     content = request.form.get('content')
     if not content or content.strip() == '':
         return jsonify({'error': 'Сообщение не может быть пустым'}), 400
@@ -0,0 +1,147 @@
+import math
+import threading
+import time
+
+from flask import current_app, request, jsonify
+from flask_login import current_user
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+class MemoryStore:
+    # Token bucket в памяти процесса: у каждого воркера свои счётчики
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, capacity, cost=1):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            wait = 0.0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                wait = (cost - tokens) / rate
+            if len(self._buckets) >= self.maxsize and key not in self._buckets:
+                self._prune(now)
+            self._buckets[key] = (tokens, now)
+            return wait
+
+    def _prune(self, now):
+        # Корзины, которые давно не трогали, уже полные, их можно забыть
+        stale = [key for key, (tokens, updated) in self._buckets.items() if now - updated > 3600]
+        for key in stale or list(self._buckets)[:len(self._buckets) // 10 + 1]:
+            del self._buckets[key]
+
+
+class RedisStore:
+    # Общее хранилище для нескольких воркеров и серверов, обновление атомарно через Lua
+    SCRIPT = '''
+    local rate = tonumber(ARGV[1])
+    local capacity = tonumber(ARGV[2])
+    local cost = tonumber(ARGV[3])
+    local now = tonumber(ARGV[4])
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local tokens = tonumber(bucket[1]) or capacity
+    local updated = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+    local wait = 0
+    if tokens >= cost then
+        tokens = tokens - cost
+    else
+        wait = (cost - tokens) / rate
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+    return tostring(wait)
+    '''
+
+    def __init__(self, url, prefix='ratelimit:'):
+        if redis is None:
+            raise RuntimeError('redis is not installed')
+        self.prefix = prefix
+        self.client = redis.Redis.from_url(url)
+        self.script = self.client.register_script(self.SCRIPT)
+
+    def take(self, key, rate, capacity, cost=1):
+        return float(self.script(keys=[self.prefix + key], args=[rate, capacity, cost, time.time()]))
+
+
+class RateLimiter:
+    def __init__(self, app=None):
+        self.storage = None
+        self.fallback = MemoryStore()
+        self._counters = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        url = app.config.get('RATELIMIT_STORAGE_URL')
+        if self.storage is None:
+            self.storage = RedisStore(url) if url else self.fallback
+        app.before_request(self.check)
+
+    def policy(self):
+        limits = current_app.config.get('RATELIMITS', {})
+        if request.endpoint in limits:
+            return limits[request.endpoint]
+        if request.method == 'POST':
+            return current_app.config.get('RATELIMIT_DEFAULT')
+        return None
+
+    def key(self):
+        if current_user.is_authenticated:
+            return f'{request.endpoint}:user:{current_user.id}'
+        # За прокси remote_addr — адрес клиента только при PROXY_FIX_HOPS, см. create_app
+        return f'{request.endpoint}:ip:{request.remote_addr}'
+
+    def take(self, key, rate, capacity):
+        try:
+            return self.storage.take(key, rate, capacity)
+        except Exception:
+            # Если общее хранилище недоступно, ограничиваем хотя бы внутри процесса
+            current_app.logger.exception('rate limit storage failed, using in-process buckets')
+            return self.fallback.take(key, rate, capacity)
+
+    def check(self):
+        if not current_app.config.get('RATELIMIT_ENABLED', True) or request.endpoint in (None, 'static'):
+            return None
+        policy = self.policy()
+        if not policy:
+            return None
+
+        rate, capacity = policy
+        wait = self.take(self.key(), rate, capacity)
+        self._count(request.endpoint, 'limited' if wait else 'allowed')
+        if wait:
+            return self.too_many_requests(wait)
+        return None
+
+    def too_many_requests(self, wait):
+        message = 'Слишком много запросов, попробуйте позже'
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest' or request.is_json or request.blueprint == 'api':
+            response = jsonify({'error': message})
+        else:
+            response = current_app.response_class(message, mimetype='text/plain')
+        response.status_code = 429
+        response.headers['Retry-After'] = str(max(1, math.ceil(wait)))
+        return response
+
+    def _count(self, endpoint, outcome):
+        with self._lock:
+            counters = self._counters.setdefault(endpoint, {'allowed': 0, 'limited': 0})
+            counters[outcome] += 1
+
+    def stats(self):
+        with self._lock:
+            return {endpoint: dict(counters) for endpoint, counters in self._counters.items()}
+
+
+limiter = RateLimiter()
@@ -0,0 +1,293 @@
+import math
+
+from flask import current_app
+from sqlalchemy import insert
+
+from app import db
+from app.cache import get_cache
+from app.invalidation import bus
+from app.jobs import job
+from app.models import User, Project, ProjectParticipant, Recommendation
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+CANDIDATE = 'candidate'  # проект -> подходящие пользователи
+PROJECT = 'project'  # пользователь -> подходящие проекты
+
+
+def parse_skills(text):
+    return {skill.strip().lower() for skill in (text or '').split(',') if skill.strip()}
+
+
+class SkillData:
+    # Проекты держатся матрицей целиком, пользователи — списками индексов навыков:
+    # их строки собираются в матрицу по частям, и полная матрица U×P оценок не строится
+    def __init__(self):
+        users = db.session.query(User.id, User.skills) \
+            .filter(User.deleting == False).order_by(User.id).all()
+        projects = db.session.query(Project.id, Project.skills_required, Project.creator_id) \
+            .filter(Project.archived == False, Project.deleting == False).order_by(Project.id).all()
+
+        self.user_ids = np.array([u.id for u in users], dtype=np.int64)
+        self.project_ids = np.array([p.id for p in projects], dtype=np.int64)
+        user_index = {user_id: i for i, user_id in enumerate(self.user_ids.tolist())}
+        project_index = {project_id: i for i, project_id in enumerate(self.project_ids.tolist())}
+
+        vocabulary = {}
+        project_skills = [_indexes(parse_skills(p.skills_required), vocabulary) for p in projects]
+        self.user_skills = [_indexes(parse_skills(u.skills), vocabulary) for u in users]
+        self.width = max(len(vocabulary), 1)
+        self.projects = _matrix(project_skills, self.width)
+
+        # Создатель и участники проекта не рекомендуются этому проекту: пары (строка пользователя, столбец проекта),
+        # отсортированные по строке, чтобы каждая часть брала свой срез
+        members = {(p.creator_id, p.id) for p in projects}
+        members.update(db.session.query(ProjectParticipant.user_id, ProjectParticipant.project_id))
+        pairs = sorted((user_index[user_id], project_index[project_id]) for user_id, project_id in members
+                       if user_id in user_index and project_id in project_index)
+        self.member_users = np.array([u for u, _ in pairs], dtype=np.int64)
+        self.member_projects = np.array([p for _, p in pairs], dtype=np.int64)
+
+    def scores(self, start, stop):
+        # Оценки пользователей [start, stop) по всем проектам, без пар «участник — свой проект»
+        scores = _matrix(self.user_skills[start:stop], self.width) @ self.projects.T
+        lo, hi = np.searchsorted(self.member_users, [start, stop])
+        scores[self.member_users[lo:hi] - start, self.member_projects[lo:hi]] = 0
+        return scores
+
+
+def _indexes(skills, vocabulary):
+    return [vocabulary.setdefault(skill, len(vocabulary)) for skill in skills]
+
+
+def _matrix(rows, width):
+    # Строки нормируются, поэтому произведение матриц даёт косинусную близость
+    matrix = np.zeros((len(rows), width), dtype=np.float32)
+    for i, columns in enumerate(rows):
+        matrix[i, columns] = 1.0
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _score(value):
+    # Оценки округляются: матрицы float32, разреженный путь float64, в MySQL колонка FLOAT одинарной точности —
+    # иначе равные оценки сравнивались бы по последним битам, и порядок зависел бы от способа расчёта
+    return round(float(value), 6)
+
+
+def _order(pair):
+    # Порядок в списке: оценка по убыванию, при равенстве меньший id
+    target_id, score = pair
+    return -score, target_id
+
+
+def _top(scores, n):
+    return sorted(scores.items(), key=_order)[:n]
+
+
+def _top_n(scores, ids, n):
+    positive = np.flatnonzero(scores > 0)
+    if len(positive) > n:
+        # Равные n-му месту тоже проходят отбор, чтобы между ними выбрал _top
+        threshold = np.partition(scores[positive], len(positive) - n)[len(positive) - n] - 1e-6
+        positive = positive[scores[positive] >= threshold]
+    return _top({int(ids[i]): _score(scores[i]) for i in positive}, n)
+
+
+def _keep_top(best_scores, best_ids, scores, ids, n):
+    # Лучшие n пользователей каждого проекта среди уже просмотренных и новой части.
+    # Части идут по возрастанию id, а прежние лучшие уже упорядочены, поэтому устойчивая сортировка
+    # по убыванию оценки даёт тот же порядок, что _order: при равенстве меньший id
+    scores = np.vstack([best_scores, np.round(scores.astype(np.float64), 6)])
+    ids = np.vstack([best_ids, np.broadcast_to(ids[:, None], (len(ids), scores.shape[1]))])
+    order = np.argsort(-scores, axis=0, kind='stable')[:n]
+    return np.take_along_axis(scores, order, axis=0), np.take_along_axis(ids, order, axis=0)
+
+
+def _replace(kind, results, delete=True):
+    if not results:
+        return
+    if delete:
+        Recommendation.query.filter(
+            Recommendation.kind == kind,
+            Recommendation.subject_id.in_(list(results))
+        ).delete(synchronize_session=False)
+    rows = [
+        {'kind': kind, 'subject_id': subject_id, 'target_id': target_id, 'score': score, 'rank': rank}
+        for subject_id, pairs in results.items()
+        for rank, (target_id, score) in enumerate(pairs)
+    ]
+    if rows:
+        db.session.execute(insert(Recommendation), rows)
+    bus.invalidate(db.session, 'recommendations', *((kind, subject_id) for subject_id in results))
+
+
+def _escape_like(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _sharing_skill(column, skills):
+    # Отбор в БД: строки, где встречается хоть один навык; точное совпадение проверяется после разбора.
+    # SQLite сравнивает без учёта регистра только ASCII, поэтому с другими навыками отбор там не делается
+    if db.session.get_bind().dialect.name == 'sqlite' and not all(skill.isascii() for skill in skills):
+        return db.true()
+    return db.or_(*(column.ilike(f'%{_escape_like(skill)}%', escape='\\') for skill in skills))
+
+
+def _cosine(a, b):
+    common = len(a & b)
+    return _score(common / math.sqrt(len(a) * len(b))) if common else 0.0
+
+
+def _score_user(user_id):
+    # Проекты, подходящие одному пользователю: разреженно, {project_id: score} только для общих навыков
+    skills = parse_skills(db.session.query(User.skills)
+                          .filter(User.id == user_id, User.deleting == False).scalar())
+    if not skills:
+        return {}
+    joined = {row[0] for row in db.session.query(ProjectParticipant.project_id)
+              .filter(ProjectParticipant.user_id == user_id)}
+    scores = {}
+    for project_id, required, creator_id in db.session.query(
+            Project.id, Project.skills_required, Project.creator_id
+    ).filter(Project.archived == False, Project.deleting == False,
+             _sharing_skill(Project.skills_required, skills)):
+        score = _cosine(skills, parse_skills(required))
+        if score > 0 and creator_id != user_id and project_id not in joined:
+            scores[project_id] = score
+    return scores
+
+
+def _score_project(project_id):
+    # Пользователи, подходящие одному проекту, в том же виде
+    project = db.session.query(Project.skills_required, Project.creator_id) \
+        .filter(Project.id == project_id, Project.archived == False, Project.deleting == False).first()
+    skills = parse_skills(project.skills_required) if project else set()
+    if not skills:
+        return {}
+    members = {project.creator_id} | {row[0] for row in db.session.query(ProjectParticipant.user_id)
+                                       .filter(ProjectParticipant.project_id == project_id)}
+    scores = {}
+    for user_id, user_skills in db.session.query(User.id, User.skills) \
+            .filter(User.deleting == False, _sharing_skill(User.skills, skills)):
+        score = _cosine(skills, parse_skills(user_skills))
+        if score > 0 and user_id not in members:
+            scores[user_id] = score
+    return scores
+
+
+def _merge(kind, changed_id, scores, n, rescore):
+    # Инкрементальное обновление: читаются только списки, куда изменённый объект входит или может войти
+    subject_ids = set(scores) | {row[0] for row in db.session.query(Recommendation.subject_id)
+                                 .filter_by(kind=kind, target_id=changed_id)}
+    if not subject_ids:
+        return
+    existing = {}
+    for rec in db.session.query(Recommendation.subject_id, Recommendation.target_id, Recommendation.score) \
+            .filter(Recommendation.kind == kind, Recommendation.subject_id.in_(subject_ids)) \
+            .order_by(Recommendation.subject_id, Recommendation.rank):
+        existing.setdefault(rec.subject_id, []).append((rec.target_id, _score(rec.score)))
+
+    results = {}
+    for subject_id in sorted(subject_ids):
+        current = existing.get(subject_id, [])
+        others = [pair for pair in current if pair[0] != changed_id]
+        score = scores.get(subject_id, 0.0)
+        # Всё, что не попало в полный список, стоит после его последнего элемента
+        beats_last = score > 0 and (len(current) < n or _order((changed_id, score)) < _order(current[-1]))
+        if len(others) == len(current):
+            if not beats_last:
+                continue
+        elif not beats_last:
+            # Объект опустился ниже прежнего последнего места полного списка: его может обогнать
+            # кто-то за пределами списка, поэтому список этого субъекта пересчитывается целиком
+            results[subject_id] = _top(rescore(subject_id), n)
+            continue
+        merged = others + ([(changed_id, score)] if score > 0 else [])
+        results[subject_id] = _top(dict(merged), n)
+    _replace(kind, results)
+
+
+def _top_count():
+    return current_app.config.get('RECOMMENDATIONS_TOP_N', 10)
+
+
+@job('refresh_recommendations')
+def refresh_recommendations():
+    if np is None:
+        current_app.logger.warning('numpy is not installed, recommendations are disabled')
+        return 0
+
+    data = SkillData()
+    n = _top_count()
+    chunk = current_app.config.get('RECOMMENDATIONS_CHUNK_SIZE', 1000)
+
+    # Пользователи оцениваются частями: в памяти одновременно только chunk×P оценок
+    # и лучшие n кандидатов каждого проекта
+    projects = {}
+    best_scores = np.zeros((0, len(data.project_ids)))
+    best_ids = np.zeros((0, len(data.project_ids)), dtype=np.int64)
+    for start in range(0, len(data.user_ids), chunk):
+        ids = data.user_ids[start:start + chunk]
+        scores = data.scores(start, start + len(ids))
+        for u, user_id in enumerate(ids):
+            projects[int(user_id)] = _top_n(scores[u], data.project_ids, n)
+        best_scores, best_ids = _keep_top(best_scores, best_ids, scores, ids, n)
+
+    candidates = {
+        int(project_id): [(int(user_id), _score(score))
+                          for user_id, score in zip(best_ids[:, p], best_scores[:, p]) if score > 0]
+        for p, project_id in enumerate(data.project_ids)
+    }
+
+    Recommendation.query.delete()
+    _replace(CANDIDATE, candidates, delete=False)
+    _replace(PROJECT, projects, delete=False)
+    db.session.commit()
+    bus.publish('recommendations', None)
+    return len(candidates) + len(projects)
+
+
+@job('refresh_user_recommendations')
+def refresh_user_recommendations(user_id):
+    # Без матриц: оценки только для проектов с общими навыками и только затронутые списки кандидатов
+    n = _top_count()
+    scores = _score_user(user_id)
+    _replace(PROJECT, {user_id: _top(scores, n)})
+    _merge(CANDIDATE, user_id, scores, n, _score_project)
+    db.session.commit()
+    return 1
+
+
+@job('refresh_project_recommendations')
+def refresh_project_recommendations(project_id):
+    n = _top_count()
+    scores = _score_project(project_id)
+    _replace(CANDIDATE, {project_id: _top(scores, n)})
+    _merge(PROJECT, project_id, scores, n, _score_user)
+    db.session.commit()
+    return 1
+
+
+def _cache():
+    return get_cache('recommendations', ttl=current_app.config.get('RECOMMENDATIONS_CACHE_TTL', 300))
+
+
+def _cached(kind, subject_id):
+    return _cache().get_or_set((kind, subject_id), lambda: [
+        row[0] for row in db.session.query(Recommendation.target_id)
+        .filter_by(kind=kind, subject_id=subject_id)
+        .order_by(Recommendation.rank)
+    ])
+
+
+def candidates_for(project_id):
+    return _cached(CANDIDATE, project_id)
+
+
+def projects_for(user_id):
+    return _cached(PROJECT, user_id)
@@ -0,0 +1,93 @@
+import random
+import time
+
+import click
+from flask import current_app, g, has_request_context, request, session
+from flask.cli import AppGroup
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+from sqlalchemy.sql.selectable import SelectBase
+
+replicas_cli = AppGroup('replicas', help='Реплики базы данных только для чтения.')
+
+
+def replica_keys(app):
+    return [key for key in app.config.get('SQLALCHEMY_BINDS', {}) if str(key).startswith('replica_')]
+
+
+def _use_replica():
+    # Реплика — только для перечисленных в DB_REPLICA_ENDPOINTS GET-запросов и только пока пользователь
+    # не писал в базу в последние DB_REPLICA_STICKY_SECONDS (read-your-writes при отставании реплики)
+    if not has_request_context() or request.method not in ('GET', 'HEAD'):
+        return False
+    if g.get('db_wrote') or request.endpoint not in current_app.config.get('DB_REPLICA_ENDPOINTS', ()):
+        return False
+    return session.get('db_primary_until', 0) < time.time()
+
+
+class RoutingSession(Session):
+    # Чтения без явной привязки уходят на реплику, всё остальное (flush, UPDATE/DELETE, текстовый SQL) — на основную
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and isinstance(clause, SelectBase) and _use_replica():
+            engine = self._replica()
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _replica(self):
+        # Одна реплика на весь запрос, чтобы чтения внутри него были согласованы между собой
+        if 'db_replica' not in g:
+            keys = replica_keys(current_app)
+            g.db_replica = random.choice(keys) if keys else None
+        return self._db.engines[g.db_replica] if g.db_replica else None
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _mark_write(session, flush_context):
+    if has_request_context():
+        g.db_wrote = True
+
+
+class Replicas:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # Вызывается до db.init_app: реплики становятся обычными binds replica_0, replica_1, ...
+        # с теми же параметрами пула, что и основная база
+        binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+        for i, uri in enumerate(app.config.get('DB_REPLICA_URIS') or ()):
+            binds.setdefault(f'replica_{i}', dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}), url=uri))
+        app.after_request(self.stick_to_primary)
+
+    def stick_to_primary(self, response):
+        if g.pop('db_wrote', False):
+            session['db_primary_until'] = time.time() + current_app.config.get('DB_REPLICA_STICKY_SECONDS', 5)
+        return response
+
+
+@replicas_cli.command('check')
+def check():
+    """Проверить доступность реплик и их отставание по последним id."""
+    from app import db
+
+    keys = replica_keys(current_app)
+    if not keys:
+        click.echo('Реплики не настроены (DB_REPLICA_URIS)')
+        return
+    query = text('SELECT (SELECT MAX(id) FROM message), (SELECT MAX(id) FROM activity)')
+    with db.engines[None].connect() as connection:
+        primary = connection.execute(query).one()
+    for key in keys:
+        try:
+            with db.engines[key].connect() as connection:
+                replica = connection.execute(query).one()
+        except Exception as e:
+            click.echo(f'{key}: недоступна ({e.__class__.__name__}: {e})')
+            continue
+        lag = [(primary_id or 0) - (replica_id or 0) for primary_id, replica_id in zip(primary, replica)]
+        click.echo(f'{key}: отстаёт на {lag[0]} сообщений, {lag[1]} событий')
+
+
+replicas = Replicas()
@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import insert, select
+
+from app import db
+from app.activity import record
+from app.jobs import job
+from app.models import Message, MessageArchive, User, Project, Task, TaskStatus
+
+ARCHIVE_COLUMNS = ['id', 'content', 'timestamp', 'user_id', 'project_id']
+
+
+@job('archive_messages')
+def archive_messages(max_age_days=None, batch_size=None):
+    max_age_days = max_age_days or current_app.config.get('MESSAGE_RETENTION_DAYS', 90)
+    batch_size = batch_size or current_app.config.get('MESSAGE_ARCHIVE_BATCH_SIZE', 1000)
+    cutoff = datetime.utcnow() - timedelta(days=max_age_days)
+
+    total = 0
+    while True:
+        ids = [row[0] for row in db.session.query(Message.id)
+               .filter(Message.timestamp < cutoff)
+               .order_by(Message.id)
+               .limit(batch_size)]
+        if not ids:
+            break
+
+        # Перенос и удаление одной порции выполняются в одной короткой транзакции
+        db.session.execute(
+            insert(MessageArchive).from_select(
+                ARCHIVE_COLUMNS,
+                select(*(getattr(Message, name) for name in ARCHIVE_COLUMNS)).where(Message.id.in_(ids))
+            )
+        )
+        db.session.query(Message).filter(Message.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        total += len(ids)
+
+    current_app.logger.info('archived %s messages older than %s', total, cutoff)
+    return total
+
+
+def set_archived(project, archived, auto=False):
+    project.archived = archived
+    project.archived_at = datetime.utcnow() if archived else None
+    data = {'auto': True} if auto else {}
+    record(project.id, 'project_archived' if archived else 'project_unarchived', **data)
+
+
+@job('archive_projects')
+def archive_projects(after_days=None, batch_size=None):
+    # В архив уходят проекты, срок которых истёк больше PROJECT_ARCHIVE_AFTER_DAYS назад
+    # и в которых не осталось незавершённых задач
+    after_days = after_days or current_app.config.get('PROJECT_ARCHIVE_AFTER_DAYS', 30)
+    batch_size = batch_size or current_app.config.get('PROJECT_ARCHIVE_BATCH_SIZE', 500)
+    cutoff = datetime.utcnow() - timedelta(days=after_days)
+    unfinished = db.session.query(Task.id).filter(
+        Task.project_id == Project.id,
+        Task.status.in_([TaskStatus.NOT_STARTED, TaskStatus.IN_PROGRESS])
+    ).exists()
+
+    total = 0
+    last_id = 0
+    while True:
+        projects = Project.active().filter(
+            Project.deadline < cutoff,
+            Project.id > last_id,
+            ~unfinished
+        ).order_by(Project.id).limit(batch_size).all()
+        if not projects:
+            break
+        for project in projects:
+            set_archived(project, True, auto=True)
+        db.session.commit()
+        total += len(projects)
+        last_id = projects[-1].id
+
+    current_app.logger.info('archived %s projects with deadline before %s', total, cutoff)
+    return total
+
+
+def _page(model, project_id, before, limit):
+    query = db.session.query(
+        model.id, model.user_id, User.username, model.content, model.timestamp
+    ).outerjoin(User, User.id == model.user_id).filter(model.project_id == project_id)
+    if before:
+        query = query.filter(model.id < before)
+    return query.order_by(model.id.desc()).limit(limit).all()
+
+
+def messages_after(project_id, after, limit=50):
+    # Опрос чата: новые сообщения есть только в горячей таблице
+    return db.session.query(
+        Message.id, Message.user_id, User.username, Message.content, Message.timestamp
+    ).outerjoin(User, User.id == Message.user_id) \
+        .filter(Message.project_id == project_id, Message.id > after) \
+        .order_by(Message.id.asc()).limit(limit).all()
+
+
+def message_history(project_id, before=None, limit=50):
+    # Сначала читается горячая таблица, недостающее добирается из архива
+    rows = _page(Message, project_id, before, limit + 1)
+    if len(rows) <= limit:
+        oldest = rows[-1].id if rows else before
+        rows += _page(MessageArchive, project_id, oldest, limit + 1 - len(rows))
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    rows.reverse()
+    return rows, has_more
@@ -0,0 +1,136 @@
+import re
+
+from flask import current_app
+from sqlalchemy import DDL, event, select, text, union_all, literal, column
+from sqlalchemy.dialects.mysql import match
+
+from app import db
+from app.models import Message, MessageArchive, User
+
+SEARCH_TABLES = (Message, MessageArchive)
+
+WORD = re.compile(r'\w+', re.UNICODE)
+
+
+def fts_statements(table):
+    # SQLite: внешняя FTS5-таблица поверх сообщений, триггеры поддерживают её при каждой вставке и удалении
+    fts = f'{table}_fts'
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+        f"content, project_id UNINDEXED, content='{table}', content_rowid='id', tokenize='unicode61')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, content, project_id) VALUES (new.id, new.content, new.project_id); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, content, project_id) VALUES ('delete', old.id, old.content, old.project_id); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, content, project_id) VALUES ('delete', old.id, old.content, old.project_id); "
+        f"INSERT INTO {fts}(rowid, content, project_id) VALUES (new.id, new.content, new.project_id); END",
+    ]
+
+
+for _model in SEARCH_TABLES:
+    for _statement in fts_statements(_model.__tablename__):
+        event.listen(_model.__table__, 'after_create', DDL(_statement).execute_if(dialect='sqlite'))
+
+
+def terms(query):
+    return WORD.findall(query.lower())
+
+
+def _hits(model, project_id, words, limit):
+    if db.session.get_bind().dialect.name == 'mysql':
+        score = match(model.content, against=' '.join(words)).in_natural_language_mode()
+        rows = db.session.query(model.id, score.label('score')) \
+            .filter(model.project_id == project_id, score) \
+            .order_by(score.desc()).limit(limit)
+        return [(row.id, row.score) for row in rows]
+
+    fts = f'{model.__tablename__}_fts'
+    # Каждое слово в кавычках: пользовательский ввод не разбирается как синтаксис FTS5
+    query = ' '.join('"' + word.replace('"', '""') + '"' for word in words)
+    rows = db.session.execute(text(
+        f'SELECT rowid AS id, -bm25({fts}) AS score FROM {fts} '
+        f'WHERE {fts} MATCH :query AND project_id = :project_id ORDER BY score DESC LIMIT :limit'
+    ).columns(column('id'), column('score')), {'query': query, 'project_id': project_id, 'limit': limit})
+    return [(row.id, row.score) for row in rows]
+
+
+def _context(model, project_id, ids, size):
+    # Соседние сообщения для всех найденных одним запросом (UNION ALL маленьких выборок по индексу)
+    if not ids or not size:
+        return {}
+    columns = (model.id, model.user_id, model.content, model.timestamp)
+    parts = []
+    for message_id in ids:
+        before = select(*columns, literal(message_id).label('hit_id')) \
+            .where(model.project_id == project_id, model.id < message_id) \
+            .order_by(model.id.desc()).limit(size).subquery()
+        after = select(*columns, literal(message_id).label('hit_id')) \
+            .where(model.project_id == project_id, model.id > message_id) \
+            .order_by(model.id).limit(size).subquery()
+        parts += [select(before), select(after)]
+    rows = db.session.execute(select(union_all(*parts).subquery())).all()
+
+    context = {}
+    for row in sorted(rows, key=lambda r: r.id):
+        context.setdefault(row.hit_id, []).append(row)
+    return context
+
+
+def highlight(content, words, width=80):
+    lowered = content.lower()
+    positions = [lowered.find(word) for word in words if lowered.find(word) >= 0]
+    start = max(0, min(positions) - width // 2) if positions else 0
+    snippet = content[start:start + width]
+    return ('…' if start else '') + snippet + ('…' if start + width < len(content) else '')
+
+
+def search_messages(project_id, query, page=1, per_page=None, context_size=None):
+    per_page = per_page or current_app.config.get('SEARCH_PAGE_SIZE', 20)
+    context_size = current_app.config.get('SEARCH_CONTEXT', 2) if context_size is None else context_size
+    words = terms(query)
+    if not words:
+        return [], False
+
+    # Горячая таблица и архив ищутся отдельно, результаты сливаются по релевантности
+    offset = (page - 1) * per_page
+    limit = offset + per_page + 1
+    ranked = []
+    for model in SEARCH_TABLES:
+        ranked += [(score, message_id, model) for message_id, score in _hits(model, project_id, words, limit)]
+    ranked.sort(key=lambda hit: (-hit[0], -hit[1]))
+    has_more = len(ranked) > offset + per_page
+    ranked = ranked[offset:offset + per_page]
+
+    results = []
+    for model in SEARCH_TABLES:
+        ids = [message_id for score, message_id, hit_model in ranked if hit_model is model]
+        if not ids:
+            continue
+        rows = {row.id: row for row in db.session.query(
+            model.id, model.user_id, model.content, model.timestamp
+        ).filter(model.id.in_(ids))}
+        context = _context(model, project_id, ids, context_size)
+        results += [(message_id, rows[message_id], context.get(message_id, [])) for message_id in ids if message_id in rows]
+
+    user_ids = {row.user_id for _, row, ctx in results} | {c.user_id for _, _, ctx in results for c in ctx}
+    usernames = dict(db.session.query(User.id, User.username).filter(User.id.in_(user_ids))) if user_ids else {}
+
+    order = {message_id: i for i, (score, message_id, model) in enumerate(ranked)}
+    scores = {message_id: score for score, message_id, model in ranked}
+    hits = [{
+        'id': row.id,
+        'user_id': row.user_id,
+        'username': usernames.get(row.user_id),
+        'content': row.content,
+        'snippet': highlight(row.content, words),
+        'timestamp': row.timestamp.strftime('%d.%m.%Y %H:%M'),
+        'score': round(float(scores[message_id]), 4),
+        'context': [{
+            'id': c.id,
+            'username': usernames.get(c.user_id),
+            'content': c.content,
+            'timestamp': c.timestamp.strftime('%H:%M')
+        } for c in ctx]
+    } for message_id, row, ctx in sorted(results, key=lambda r: order[r[0]])]
+    return hits, has_more
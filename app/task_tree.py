@@ -0,0 +1,173 @@
+from flask import current_app
+from sqlalchemy import select, literal, func, update
+
+from app import db
+from app.backfill import backfill
+from app.jobs import job
+from app.models import Task
+
+
+class TaskNode:
+    def __init__(self, task, depth=0):
+        self.task = task
+        self.depth = depth
+        self.children = []
+        self.total = 0
+        self.completed = 0
+        self.next_deadline = None
+
+    @property
+    def all_completed(self):
+        return self.total > 0 and self.total == self.completed
+
+
+def _subtree_cte(root_criterion):
+    # Рекурсивный CTE одинаково работает в MySQL 8 и SQLite
+    tree = select(Task.id, literal(0).label('depth')) \
+        .where(root_criterion) \
+        .cte('task_tree', recursive=True)
+    return tree.union_all(
+        select(Task.id, tree.c.depth + 1).join(tree, Task.parent_task_id == tree.c.id)
+    )
+
+
+def _by_path():
+    return current_app.config.get('TASK_TREE_STRATEGY') == 'path'
+
+
+def subtree_ids(task):
+    # Путь есть у всех задач после заполнения task_paths; если его всё же нет, поддерево ищется CTE
+    if _by_path() and task.path:
+        return [row[0] for row in db.session.query(Task.id).filter(Task.path.like(f'{task.path}%'))]
+    tree = _subtree_cte(Task.id == task.id)
+    return [row[0] for row in db.session.execute(select(tree.c.id))]
+
+
+def _load_by_cte(root_criterion):
+    tree = _subtree_cte(root_criterion)
+    return db.session.query(Task, tree.c.depth).join(tree, Task.id == tree.c.id).all()
+
+
+def _load_project_by_path(project_id):
+    # Дерево проекта — все его задачи: один запрос по project_id без рекурсии, глубина берётся из пути
+    rows = Task.query.filter(Task.project_id == project_id).all()
+    if any(task.path is None for task in rows):
+        return None
+    return [(task, task.path.count('/') - 1) for task in rows]
+
+
+def _build(rows, root_ids):
+    nodes = {task.id: TaskNode(task, depth) for task, depth in rows}
+    roots = set(root_ids)
+    for node in nodes.values():
+        parent = nodes.get(node.task.parent_task_id)
+        if parent is not None and node.task.id not in roots:
+            parent.children.append(node)
+
+    # Свёртка снизу вверх за один проход: узлы обрабатываются от самых глубоких
+    for node in sorted(nodes.values(), key=lambda n: n.depth, reverse=True):
+        node.children.sort(key=lambda n: n.task.id)
+        node.total += 1
+        if node.task.completed:
+            node.completed += 1
+        elif node.task.deadline and (node.next_deadline is None or node.task.deadline < node.next_deadline):
+            node.next_deadline = node.task.deadline
+        parent = nodes.get(node.task.parent_task_id)
+        if parent is not None and node.task.id not in roots:
+            parent.total += node.total
+            parent.completed += node.completed
+            if node.next_deadline and (parent.next_deadline is None or node.next_deadline < parent.next_deadline):
+                parent.next_deadline = node.next_deadline
+
+    return [nodes[root_id] for root_id in root_ids if root_id in nodes]
+
+
+def load_forest(root_criterion):
+    rows = _load_by_cte(root_criterion)
+    root_ids = sorted(task.id for task, depth in rows if depth == 0)
+    return _build(rows, root_ids)
+
+
+def load_project_tree(project_id):
+    rows = _load_project_by_path(project_id) if _by_path() else None
+    if rows is None:
+        return load_forest(db.and_(Task.project_id == project_id, Task.parent_task_id == None))
+    return _build(rows, sorted(task.id for task, depth in rows if depth == 0))
+
+
+def can_be_parent(task, parent):
+    if parent is None:
+        return True
+    if parent.project_id != task.project_id:
+        return False
+    return task.id is None or parent.id not in subtree_ids(task)
+
+
+def set_path(task):
+    # Вызывается после flush, когда у задачи уже есть id; родителю без пути он строится по цепочке предков
+    old_path = task.path
+    parent = task.parent if task.parent_task_id else None
+    if parent is not None and parent.path is None:
+        set_path(parent)
+    parent_path = parent.path if parent is not None else ''
+    task.path = f'{parent_path}{task.id}/'
+    if old_path and old_path != task.path:
+        Task.query.filter(Task.path.like(f'{old_path}%'), Task.id != task.id).update(
+            {'path': literal(task.path) + func.substr(Task.path, len(old_path) + 1)},
+            synchronize_session=False
+        )
+
+
+@job('rebuild_task_paths')
+def rebuild_task_paths(project_id=None, batch_size=500):
+    # Каждое дерево пересчитывается и фиксируется отдельно: большой проект не держит одну транзакцию
+    criterion = Task.parent_task_id == None
+    if project_id:
+        criterion = db.and_(criterion, Task.project_id == project_id)
+
+    count = 0
+    last_id = 0
+    while True:
+        root_ids = [row[0] for row in db.session.query(Task.id).filter(criterion, Task.id > last_id)
+                    .order_by(Task.id).limit(batch_size)]
+        if not root_ids:
+            break
+        last_id = root_ids[-1]
+        for root_id in root_ids:
+            stack = [(root, '') for root in load_forest(Task.id == root_id)]
+            while stack:
+                node, prefix = stack.pop()
+                node.task.path = f'{prefix}{node.task.id}/'
+                stack.extend((child, node.task.path) for child in node.children)
+                count += 1
+            db.session.commit()
+    return count
+
+
+@backfill('task_paths', Task)
+def task_paths(ids):
+    # Задачи, созданные до появления path: путь строится от ближайшего предка, у которого он уже есть.
+    # Предки дочитываются по уровням, только пока путь неизвестен
+    rows = {}
+    frontier = set(ids)
+    while frontier:
+        found = db.session.query(Task.id, Task.parent_task_id, Task.path).filter(Task.id.in_(frontier)).all()
+        rows.update((row.id, row) for row in found)
+        frontier = {row.parent_task_id for row in found
+                    if row.path is None and row.parent_task_id is not None and row.parent_task_id not in rows}
+
+    paths = {task_id: row.path for task_id, row in rows.items() if row.path}
+    for task_id in ids:
+        chain = []
+        current = task_id
+        while current in rows and current not in paths and current not in chain:
+            chain.append(current)
+            current = rows[current].parent_task_id
+        prefix = paths.get(current, '')
+        for node in reversed(chain):
+            prefix = paths[node] = f'{prefix}{node}/'
+
+    changed = [{'id': task_id, 'path': paths[task_id]} for task_id in ids if rows[task_id].path is None]
+    if changed:
+        db.session.execute(update(Task), changed)
+    return len(changed)
@@ -0,0 +1,13 @@
+from app import create_app
+from app.chat import create_chat_app
+
+app = create_app()
+
+try:
+    from asgiref.wsgi import WsgiToAsgi
+except ImportError:
+    WsgiToAsgi = None
+
+# Чат обслуживается асинхронно, остальные запросы уходят во Flask через WSGI-адаптер.
+# Без asgiref этот процесс отдаёт только чат, а Flask запускается отдельно (run.py, gunicorn).
+application = create_chat_app(app, fallback=WsgiToAsgi(app) if WsgiToAsgi else None)
@@ -0,0 +1,104 @@
+# Запуск в продакшене:
+#
+#     gunicorn -c gunicorn.conf.py
+#
+# Все параметры задаются переменными окружения:
+#
+#     GUNICORN_BIND            адрес, по умолчанию 0.0.0.0:8000
+#     GUNICORN_WORKERS         число процессов, по умолчанию 2 * CPU + 1
+#     GUNICORN_WORKER_CLASS    sync, gthread или gevent
+#     GUNICORN_THREADS         потоков на процесс для gthread
+#     GUNICORN_WORKER_CONNECTIONS  одновременных соединений на процесс для gevent
+#     GUNICORN_TIMEOUT, GUNICORN_GRACEFUL_TIMEOUT, GUNICORN_MAX_REQUESTS
+#     GUNICORN_PRELOAD         0 — загружать приложение в каждом воркере, по умолчанию 1
+#
+# Чат опрашивается каждые 3 секунды, поэтому каждый открытый проект держит запросы постоянно.
+# Для такой нагрузки вместо sync-воркеров стоит выбрать один из вариантов:
+#
+#     GUNICORN_WORKER_CLASS=gthread GUNICORN_THREADS=8 gunicorn -c gunicorn.conf.py
+#         потоки в каждом процессе; пул соединений БД должен быть не меньше числа потоков
+#         (DB_POOL_SIZE=8)
+#
+#     GUNICORN_WORKER_CLASS=gevent GUNICORN_WORKER_CONNECTIONS=1000 gunicorn -c gunicorn.conf.py
+#         зелёные потоки; pymysql написан на чистом Python и совместим с monkey patching,
+#         патч применяется ниже до загрузки приложения
+#
+# Асинхронный чат (asgi.py) запускается отдельно, например:
+#
+#     gunicorn asgi:application -k uvicorn.workers.UvicornWorker -b 0.0.0.0:8001
+#
+# Плавный перезапуск после выкладки. С preload (по умолчанию) код загружен в мастере,
+# и kill -HUP перезапустит воркеры со старым кодом. Новый код поднимается новым мастером:
+#
+#     kill -USR2 <pid мастера>     запускает новый мастер с воркерами рядом со старым
+#     kill -WINCH <pid старого>    старый мастер плавно останавливает свои воркеры
+#     kill -QUIT <pid старого>     когда новые воркеры отвечают, старый мастер завершается
+#
+# С GUNICORN_PRELOAD=0 каждый воркер импортирует приложение сам, и для выкладки достаточно
+# kill -HUP <pid мастера>: старые воркеры дообслуживают запросы в пределах graceful_timeout.
+import glob
+import multiprocessing
+import os
+import tempfile
+import time
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'sync')
+
+if worker_class == 'gevent':
+    # Патч нужен до импорта приложения, иначе preload загрузит непропатченные socket и threading
+    from gevent import monkey
+    monkey.patch_all()
+
+_started = time.perf_counter()
+
+# Воркеры пишут счётчики для /metrics в общий каталог (см. app/metrics.py)
+os.environ.setdefault('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'kyrs-metrics'))
+
+wsgi_app = 'wsgi:app'
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4 if worker_class == 'gthread' else 1))
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+
+# Приложение загружается в мастере до fork: воркеры делят память через copy-on-write
+# и стартуют мгновенно
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') != '0'
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+
+# Периодический перезапуск воркеров ограничивает рост памяти; jitter не даёт им рестартовать разом
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = max_requests // 10
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+
+
+def on_starting(server):
+    # Счётчики прошлого запуска мастера не должны попасть в новые суммы. Удаляются только
+    # снимки воркеров: METRICS_DIR может указывать на каталог с чужими файлами
+    directory = os.environ['METRICS_DIR']
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def when_ready(server):
+    server.log.info('master ready in %.3fs (%s workers, %s)', time.perf_counter() - _started, workers, worker_class)
+
+
+def post_fork(server, worker):
+    # Соединения из пула мастера не должны использоваться в дочерних процессах:
+    # отбрасываем пул без закрытия сокетов, которые всё ещё принадлежат мастеру
+    from wsgi import app
+    from app import db
+
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    worker.log.info('worker %s started', worker.pid)
@@ -90,13 +90,25 @@ def run_migrations_online():
                 directives[:] = []
                 logger.info('No changes in schema detected.')
 
+    # FTS5-таблицы поиска по чату (app/search.py) создаются не моделями, autogenerate их не трогает
+    def include_name(name, type_, parent_names):
+        return not (type_ == 'table' and name.endswith(('_fts', '_fts_data', '_fts_idx', '_fts_docsize',
+                                                         '_fts_config')))
+
     conf_args = current_app.extensions['migrate'].configure_args
     if conf_args.get("process_revision_directives") is None:
         conf_args["process_revision_directives"] = process_revision_directives
+    conf_args.setdefault("include_name", include_name)
 
     connectable = get_engine()
 
     with connectable.connect() as connection:
+        # Индексы FULLTEXT создаются только на MySQL; на SQLite autogenerate их не предлагает
+        def include_object(object, name, type_, reflected, compare_to):
+            return not (type_ == 'index' and connection.dialect.name != 'mysql'
+                        and object.dialect_options['mysql'].get('prefix') == 'FULLTEXT')
+
+        conf_args.setdefault("include_object", include_object)
         context.configure(
             connection=connection,
             target_metadata=get_metadata(),
@@ -0,0 +1,58 @@
+"""add message fulltext search
+
+Revision ID: 0ef60cf5415e
+Revises: 2dda671a48f1
+Create Date: 2026-10-19 20:31:07.412958
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0ef60cf5415e'
+down_revision = '2dda671a48f1'
+branch_labels = None
+depends_on = None
+
+TABLES = ('message', 'message_archive')
+
+
+def _create_fts(table):
+    # SQLite: FTS5-таблица поверх существующих сообщений и триггеры, как в app/search.py
+    fts = f'{table}_fts'
+    op.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+               f"content, project_id UNINDEXED, content='{table}', content_rowid='id', tokenize='unicode61')")
+    op.execute(f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+               f"INSERT INTO {fts}(rowid, content, project_id) VALUES (new.id, new.content, new.project_id); END")
+    op.execute(f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+               f"INSERT INTO {fts}({fts}, rowid, content, project_id) "
+               f"VALUES ('delete', old.id, old.content, old.project_id); END")
+    op.execute(f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE ON {table} BEGIN "
+               f"INSERT INTO {fts}({fts}, rowid, content, project_id) "
+               f"VALUES ('delete', old.id, old.content, old.project_id); "
+               f"INSERT INTO {fts}(rowid, content, project_id) VALUES (new.id, new.content, new.project_id); END")
+    # Индексируем уже накопленную историю
+    op.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'mysql':
+        op.create_index('ix_message_content_fulltext', 'message', ['content'], mysql_prefix='FULLTEXT')
+        op.create_index('ix_message_archive_content_fulltext', 'message_archive', ['content'], mysql_prefix='FULLTEXT')
+    elif dialect == 'sqlite':
+        for table in TABLES:
+            _create_fts(table)
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'mysql':
+        op.drop_index('ix_message_archive_content_fulltext', table_name='message_archive')
+        op.drop_index('ix_message_content_fulltext', table_name='message')
+    elif dialect == 'sqlite':
+        for table in TABLES:
+            for suffix in ('ai', 'ad', 'au'):
+                op.execute(f'DROP TRIGGER IF EXISTS {table}_fts_{suffix}')
+            op.execute(f'DROP TABLE IF EXISTS {table}_fts')
@@ -0,0 +1,95 @@
+"""status codes for task, application and invitation
+
+Revision ID: d0844c504b4a
+Revises: 79bef02acd0e
+Create Date: 2026-10-19 21:12:40.518305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd0844c504b4a'
+down_revision = '79bef02acd0e'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 5000
+
+TASK_STATUS = "CASE WHEN status = 'completed' OR completed = 1 THEN 2 WHEN status = 'in_progress' THEN 1 ELSE 0 END"
+REQUEST_STATUS = "CASE status WHEN 'accepted' THEN 1 WHEN 'rejected' THEN 2 ELSE 0 END"
+TASK_STATUS_NAME = "CASE status_code WHEN 2 THEN 'completed' WHEN 1 THEN 'in_progress' ELSE 'not_started' END"
+REQUEST_STATUS_NAME = "CASE status_code WHEN 1 THEN 'accepted' WHEN 2 THEN 'rejected' ELSE 'pending' END"
+
+
+def _fill(table, column, expression):
+    # Перенос порциями по диапазонам id: без одного UPDATE на всю таблицу и долгой блокировки
+    bind = op.get_bind()
+    max_id = bind.execute(sa.text(f'SELECT MAX(id) FROM {table}')).scalar() or 0
+    for start in range(0, max_id, BATCH_SIZE):
+        bind.execute(sa.text(f'UPDATE {table} SET {column} = {expression} WHERE id > :start AND id <= :end'),
+                     {'start': start, 'end': start + BATCH_SIZE})
+
+
+def _to_codes(table, expression):
+    with op.batch_alter_table(table, schema=None) as batch_op:
+        batch_op.add_column(sa.Column('status_code', sa.SmallInteger(), server_default='0', nullable=False))
+    _fill(table, 'status_code', expression)
+
+
+def _to_names(table, expression):
+    with op.batch_alter_table(table, schema=None) as batch_op:
+        batch_op.alter_column('status', new_column_name='status_code',
+                              existing_type=sa.SmallInteger(), existing_server_default='0', existing_nullable=False)
+    with op.batch_alter_table(table, schema=None) as batch_op:
+        batch_op.add_column(sa.Column('status', sa.String(length=20), nullable=True))
+    _fill(table, 'status', expression)
+    with op.batch_alter_table(table, schema=None) as batch_op:
+        batch_op.drop_column('status_code')
+
+
+def upgrade():
+    with op.batch_alter_table('task', schema=None) as batch_op:
+        batch_op.drop_index('ix_task_completed_overdue_deadline')
+    _to_codes('task', TASK_STATUS)
+    with op.batch_alter_table('task', schema=None) as batch_op:
+        batch_op.drop_column('completed')
+        batch_op.drop_column('status')
+        batch_op.alter_column('status_code', new_column_name='status',
+                              existing_type=sa.SmallInteger(), existing_server_default='0', existing_nullable=False)
+    with op.batch_alter_table('task', schema=None) as batch_op:
+        batch_op.create_index('ix_task_status_overdue_deadline', ['status', 'overdue', 'deadline'], unique=False)
+        batch_op.create_index('ix_task_status_project_id', ['status', 'project_id'], unique=False)
+
+    for table in ('application', 'invitation'):
+        _to_codes(table, REQUEST_STATUS)
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_column('status')
+            batch_op.alter_column('status_code', new_column_name='status',
+                                  existing_type=sa.SmallInteger(), existing_server_default='0', existing_nullable=False)
+
+    with op.batch_alter_table('application', schema=None) as batch_op:
+        batch_op.create_index('ix_application_status_project_id', ['status', 'project_id'], unique=False)
+    with op.batch_alter_table('invitation', schema=None) as batch_op:
+        batch_op.create_index('ix_invitation_status_user_id', ['status', 'user_id'], unique=False)
+        batch_op.create_index('ix_invitation_status_project_id', ['status', 'project_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('invitation', schema=None) as batch_op:
+        batch_op.drop_index('ix_invitation_status_project_id')
+        batch_op.drop_index('ix_invitation_status_user_id')
+    with op.batch_alter_table('application', schema=None) as batch_op:
+        batch_op.drop_index('ix_application_status_project_id')
+    for table in ('application', 'invitation'):
+        _to_names(table, REQUEST_STATUS_NAME)
+
+    with op.batch_alter_table('task', schema=None) as batch_op:
+        batch_op.drop_index('ix_task_status_project_id')
+        batch_op.drop_index('ix_task_status_overdue_deadline')
+        batch_op.add_column(sa.Column('completed', sa.Boolean(), nullable=True))
+    _fill('task', 'completed', '(status = 2)')
+    _to_names('task', TASK_STATUS_NAME)
+    with op.batch_alter_table('task', schema=None) as batch_op:
+        batch_op.create_index('ix_task_completed_overdue_deadline', ['completed', 'overdue', 'deadline'], unique=False)
@@ -0,0 +1,70 @@
+import pytest
+
+from app import create_app, db
+from app.models import User, Project, ProjectParticipant
+from config import Config
+
+
+class TestConfig(Config):
+    TESTING = True
+    WTF_CSRF_ENABLED = False
+    RATELIMIT_ENABLED = False
+    METRICS_DIR = None
+    DB_REPLICA_URIS = []
+
+
+@pytest.fixture
+def config(tmp_path):
+    class AppConfig(TestConfig):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{tmp_path / "app.db"}'
+        SQLALCHEMY_BINDS = {}
+        TEMPLATE_CACHE_DIR = str(tmp_path / 'jinja_cache')
+    return AppConfig
+
+
+# Контекст приложения не держится открытым на весь тест: запросы тестового клиента
+# получают свой g, и вошедший пользователь не переходит из одного клиента в другой
+@pytest.fixture
+def app(config):
+    app = create_app(config)
+    with app.app_context():
+        # Только основная база: реплики получают схему копированием, а не из create_all
+        db.create_all(bind_key=None)
+    yield app
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+@pytest.fixture
+def users(app):
+    with app.app_context():
+        users = [User(username=name, email=f'{name}@example.com') for name in ('alice', 'bob', 'carol')]
+        for user in users:
+            user.set_password('secret')
+        db.session.add_all(users)
+        db.session.commit()
+        return {user.username: user.id for user in users}
+
+
+@pytest.fixture
+def project_id(app, users):
+    # Создатель — alice, участник — bob, carol в проект не входит
+    with app.app_context():
+        project = Project(title='Проект', description='Описание', skills_required='python', creator_id=users['alice'])
+        db.session.add(project)
+        db.session.commit()
+        db.session.add_all([ProjectParticipant(project_id=project.id, user_id=users['alice']),
+                            ProjectParticipant(project_id=project.id, user_id=users['bob'])])
+        db.session.commit()
+        return project.id
+
+
+@pytest.fixture
+def client_for(app):
+    def client_for(username):
+        client = app.test_client()
+        response = client.post('/auth/login', data={'username': username, 'password': 'secret'})
+        assert response.status_code == 302
+        return client
+    return client_for
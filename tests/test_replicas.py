@@ -0,0 +1,89 @@
+import shutil
+
+import pytest
+from sqlalchemy import select
+
+from app import db
+from app.models import Message, Project
+
+
+@pytest.fixture
+def config(config, tmp_path):
+    class ReplicaConfig(config):
+        DB_REPLICA_URIS = [f'sqlite:///{tmp_path / "replica.db"}']
+        SQLALCHEMY_BINDS = {}
+    return ReplicaConfig
+
+
+@pytest.fixture
+def sync_replica(app, project_id, tmp_path):
+    # Реплика — копия файла основной базы на момент вызова; всё записанное позже видно только в основной
+    def sync():
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose()
+        shutil.copy(tmp_path / 'app.db', tmp_path / 'replica.db')
+    sync()
+    return sync
+
+
+def _write_to_primary(app, project_id, user_id, content):
+    with app.app_context():
+        db.session.add(Message(content=content, user_id=user_id, project_id=project_id))
+        db.session.commit()
+
+
+def _messages(client, project_id):
+    response = client.get(f'/api/v1/projects/{project_id}/messages')
+    assert response.status_code == 200
+    return [message['attributes']['content'] for message in response.json['data']]
+
+
+def _forget_writes(client):
+    with client.session_transaction() as session:
+        session.pop('db_primary_until', None)
+
+
+def test_get_reads_go_to_replica(app, users, project_id, sync_replica, client_for):
+    client = client_for('bob')
+    _forget_writes(client)
+    _write_to_primary(app, project_id, users['alice'], 'только в основной')
+    assert 'только в основной' not in _messages(client, project_id)
+
+    sync_replica()
+    assert 'только в основной' in _messages(client, project_id)
+
+
+def test_reads_after_write_go_to_primary(app, users, project_id, sync_replica, client_for):
+    client = client_for('bob')
+    response = client.post(f'/projects/projects/{project_id}/send_message', data={'content': 'свежее'})
+    assert response.status_code == 200
+    assert 'свежее' in _messages(client, project_id)
+
+    # Когда окно DB_REPLICA_STICKY_SECONDS прошло, чтения снова идут на реплику, которая ещё отстаёт
+    _forget_writes(client)
+    assert 'свежее' not in _messages(client, project_id)
+
+
+def test_other_users_keep_reading_replica(app, users, project_id, sync_replica, client_for):
+    writer, reader = client_for('bob'), client_for('alice')
+    _forget_writes(reader)
+    assert writer.post(f'/projects/projects/{project_id}/send_message', data={'content': 'свежее'}).status_code == 200
+    assert 'свежее' not in _messages(reader, project_id)
+
+
+def test_bind_selection(app, users, project_id, sync_replica):
+    stmt = select(Project)
+    with app.test_request_context('/api/v1/projects'):
+        replica, primary = db.engines['replica_0'], db.engines[None]
+        assert db.session.get_bind(clause=stmt) is replica
+        # Запись в том же запросе переводит все следующие чтения на основную базу
+        db.session.add(Message(content='черновик', user_id=users['bob'], project_id=project_id))
+        db.session.flush()
+        assert db.session.get_bind(clause=stmt) is primary
+        db.session.rollback()
+
+    with app.test_request_context('/api/v1/projects', method='POST'):
+        assert db.session.get_bind(clause=stmt) is db.engines[None]
+    with app.test_request_context(f'/projects/projects/{project_id}/manage'):
+        assert db.session.get_bind(clause=stmt) is db.engines[None]
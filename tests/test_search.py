@@ -0,0 +1,97 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import text
+
+from app import db
+from app.models import Message, MessageArchive, Project
+from app.retention import archive_messages
+from app.search import search_messages
+
+
+@pytest.fixture
+def messages(app, users, project_id):
+    # Старые сообщения уходят в архив, новые остаются в горячей таблице
+    old = datetime.utcnow() - timedelta(days=365)
+    with app.app_context():
+        other = Project(title='Чужой', description='', creator_id=users['carol'])
+        db.session.add(other)
+        db.session.commit()
+        rows = [
+            Message(content='Миграция базы: обсуждаем план', user_id=users['alice'], project_id=project_id, timestamp=old),
+            Message(content='Миграция базы готова', user_id=users['bob'], project_id=project_id, timestamp=old),
+            Message(content='Привет всем', user_id=users['bob'], project_id=project_id),
+            Message(content='Миграция миграция миграция', user_id=users['alice'], project_id=project_id),
+            Message(content='Миграция в чужом проекте', user_id=users['carol'], project_id=other.id),
+        ]
+        db.session.add_all(rows)
+        db.session.commit()
+        ids = [row.id for row in rows]
+        assert archive_messages(max_age_days=30) == 2
+        return ids
+
+
+def _ids(app, project_id, query, **kwargs):
+    with app.app_context():
+        hits, has_more = search_messages(project_id, query, **kwargs)
+        return [hit['id'] for hit in hits], has_more
+
+
+def test_finds_hot_and_archived_messages(app, project_id, messages):
+    ids, has_more = _ids(app, project_id, 'миграция')
+    # Сообщение с тремя совпадениями релевантнее, чужой проект не попадает в выдачу
+    assert ids[0] == messages[3]
+    assert sorted(ids) == sorted([messages[0], messages[1], messages[3]])
+    assert not has_more
+    with app.app_context():
+        assert db.session.get(MessageArchive, messages[0]) is not None
+
+
+def test_all_words_must_match(app, project_id, messages):
+    assert _ids(app, project_id, 'МИГРАЦИЯ готова')[0] == [messages[1]]
+    assert _ids(app, project_id, 'миграция отсутствует')[0] == []
+
+
+def test_query_is_not_parsed_as_fts_syntax(app, project_id, messages):
+    # OR — обычное слово, которого нет ни в одном сообщении; одни знаки препинания не дают слов
+    assert _ids(app, project_id, 'миграция" OR "привет')[0] == []
+    assert _ids(app, project_id, 'NEAR(* "')[0] == []
+
+
+def test_pages_across_tables(app, project_id, messages):
+    first, has_more = _ids(app, project_id, 'миграция', per_page=2)
+    second, last = _ids(app, project_id, 'миграция', page=2, per_page=2)
+    assert has_more and not last
+    assert sorted(first + second) == sorted([messages[0], messages[1], messages[3]])
+
+
+def test_context_comes_from_the_same_table(app, project_id, messages):
+    with app.app_context():
+        hits, _ = search_messages(project_id, 'готова', context_size=1)
+    assert [c['id'] for c in hits[0]['context']] == [messages[0]]
+
+
+def test_triggers_follow_updates_and_deletes(app, project_id, messages):
+    with app.app_context():
+        message = db.session.get(Message, messages[2])
+        message.content = 'Миграция назначена на пятницу'
+        db.session.commit()
+    assert _ids(app, project_id, 'привет')[0] == []
+    assert _ids(app, project_id, 'пятницу')[0] == [messages[2]]
+
+    with app.app_context():
+        db.session.delete(db.session.get(Message, messages[2]))
+        db.session.delete(db.session.get(MessageArchive, messages[1]))
+        db.session.commit()
+        # integrity-check падает, если индекс FTS5 разошёлся с таблицей сообщений
+        for fts in ('message_fts', 'message_archive_fts'):
+            db.session.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('integrity-check')"))
+    assert _ids(app, project_id, 'пятницу')[0] == []
+    assert sorted(_ids(app, project_id, 'миграция')[0]) == [messages[0], messages[3]]
+
+
+def test_route_is_limited_to_members(app, project_id, messages, client_for):
+    response = client_for('bob').get(f'/projects/projects/{project_id}/messages/search?q=миграция')
+    assert response.status_code == 200
+    assert {hit['id'] for hit in response.json['hits']} == {messages[0], messages[1], messages[3]}
+    assert client_for('carol').get(f'/projects/projects/{project_id}/messages/search?q=миграция').status_code == 403
@@ -0,0 +1,12 @@
+import logging
+import time
+
+_started = time.perf_counter()
+
+from app import create_app
+
+app = create_app()
+
+# Время загрузки приложения; с preload_app оно платится один раз в мастере, а не в каждом воркере
+app.config['STARTUP_SECONDS'] = time.perf_counter() - _started
+logging.getLogger('gunicorn.error').info('application loaded in %.3fs', app.config['STARTUP_SECONDS'])